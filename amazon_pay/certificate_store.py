@@ -0,0 +1,110 @@
+import re
+import time
+import threading
+from urllib import request
+from urllib.error import URLError
+from urllib.parse import urlparse
+from collections import OrderedDict
+from amazon_pay.singleflight import SingleFlight
+
+
+SNS_HOST = re.compile(r'^sns\.[a-zA-Z0-9\-]{3,}\.amazonaws\.com(\.cn)?$')
+PEM_PATH = re.compile(r'^/(.*)\.pem$')
+
+
+def validate_sns_url(url, path=None):
+    """Raise ValueError unless url is an https URL of an SNS endpoint whose
+    path matches the path pattern, if given
+    """
+    try:
+        url_object = urlparse(url)
+    except Exception:
+        raise ValueError('Invalid URL.')
+    if url_object.scheme != 'https' or \
+            not SNS_HOST.search(url_object.netloc or ''):
+        raise ValueError('Invalid URL.')
+    if path is not None and not path.search(url_object.path):
+        raise ValueError('Invalid URL.')
+    return True
+
+
+def fetch_certificate(url, timeout=10):
+    """Download a signing certificate and return it as PEM text"""
+    try:
+        with request.urlopen(request.Request(url), timeout=timeout) as cert:
+            return str(cert.read(), encoding='utf-8')
+    except URLError as ex:
+        raise ValueError(
+            'Error retrieving certificate. {}'.format(ex.reason))
+
+
+class CertificateStore:
+
+    """Caches SNS signing certificates by URL, so that they are downloaded
+    once rather than for every notification. Concurrent requests for a
+    certificate that is not cached share one download.
+    """
+
+    def __init__(self, max_entries=32, ttl=24 * 3600, fetch=fetch_certificate,
+                 clock=time.time):
+        """
+        Parameters
+        ----------
+        max_entries : integer, optional
+            Number of certificates to keep. Default: 32
+
+        ttl : float, optional
+            Seconds to keep a certificate. Default: 86400
+
+        fetch : callable, optional
+            fetch(url) returns the PEM text of a certificate.
+            Default: fetch_certificate
+
+        clock : callable, optional
+            Returns the current time in seconds. Default: time.time
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.fetch = fetch
+        self.hits = 0
+        self.misses = 0
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._flight = SingleFlight()
+
+    def get(self, url):
+        """Return the PEM text of the certificate at url"""
+        pem = self._cached(url)
+        if pem is not None:
+            self.hits += 1
+            return pem
+        self.misses += 1
+        return self._flight.do(url, lambda: self._download(url))
+
+    def put(self, url, pem):
+        """Cache a certificate, e.g. one shipped with the application"""
+        with self._lock:
+            self._entries[url] = (pem, self._clock() + self.ttl)
+            self._entries.move_to_end(url)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _cached(self, url):
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is None:
+                return None
+            if entry[1] <= self._clock():
+                del self._entries[url]
+                return None
+            self._entries.move_to_end(url)
+            return entry[0]
+
+    def _download(self, url):
+        pem = self._cached(url)
+        if pem is None:
+            validate_sns_url(url, PEM_PATH)
+            pem = self.fetch(url)
+            self.put(url, pem)
+        return pem
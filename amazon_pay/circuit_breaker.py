@@ -0,0 +1,225 @@
+import time
+import threading
+from collections import deque
+
+
+class CircuitBreaker:
+
+    """Tracks the health of a single MWS endpoint and decides whether a
+    request may be sent to it.
+
+    The breaker starts closed. Once at least minimum_calls outcomes have been
+    recorded and the share of failures (5xx responses, timeouts and connection
+    errors) in the last window_size calls reaches failure_rate_threshold, the
+    breaker opens and every request is rejected without touching the network.
+    After reset_timeout seconds the breaker becomes half-open and lets up to
+    half_open_max_calls probe requests through. If they all succeed the breaker
+    closes again, a single failed probe opens it for another reset_timeout.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(
+            self,
+            failure_rate_threshold=0.5,
+            minimum_calls=10,
+            window_size=20,
+            reset_timeout=30,
+            half_open_max_calls=1,
+            on_state_change=None,
+            clock=time.monotonic):
+        """
+        Parameters
+        ----------
+        failure_rate_threshold : float, optional
+            Share of failed calls in the window that opens the circuit.
+            Default: 0.5
+
+        minimum_calls : integer, optional
+            Number of outcomes that must be recorded before the failure rate
+            is evaluated. Default: 10
+
+        window_size : integer, optional
+            Number of most recent outcomes the failure rate is computed over.
+            Default: 20
+
+        reset_timeout : float, optional
+            Seconds the circuit stays open before probes are let through.
+            Default: 30
+
+        half_open_max_calls : integer, optional
+            Number of probe requests allowed while half-open. All of them must
+            succeed for the circuit to close. Default: 1
+
+        on_state_change : callable, optional
+            Called as on_state_change(breaker, old_state, new_state) on every
+            transition. Default: None
+
+        clock : callable, optional
+            Monotonic time source, mostly useful for tests.
+            Default: time.monotonic
+        """
+        if not 0 < failure_rate_threshold <= 1:
+            raise ValueError('Invalid failure_rate_threshold.')
+        if minimum_calls < 1 or window_size < minimum_calls:
+            raise ValueError('Invalid window_size or minimum_calls.')
+        if half_open_max_calls < 1:
+            raise ValueError('Invalid half_open_max_calls.')
+
+        self.failure_rate_threshold = failure_rate_threshold
+        self.minimum_calls = minimum_calls
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.on_state_change = on_state_change
+
+        self._clock = clock
+        self._lock = threading.RLock()
+        self._state = self.CLOSED
+        self._outcomes = deque(maxlen=window_size)
+        self._opened_at = None
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        self._rejected = 0
+        self._total_failures = 0
+        self._total_successes = 0
+        self._times_opened = 0
+
+    @property
+    def state(self):
+        """Current state, moving from open to half-open if the reset timeout
+        has elapsed.
+        """
+        with self._lock:
+            return self._current_state()
+
+    def allow_request(self):
+        """Return True if a request may be sent. While half-open this reserves
+        one of the probe slots, so every allowed call must be followed by
+        record_success, record_failure or release.
+        """
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return True
+            if (state == self.HALF_OPEN and
+                    self._probes_in_flight < self.half_open_max_calls):
+                self._probes_in_flight += 1
+                return True
+            self._rejected += 1
+            return False
+
+    def record_success(self):
+        """Record a call that completed without a 5xx or transport error"""
+        with self._lock:
+            self._total_successes += 1
+            if self._state == self.HALF_OPEN:
+                self._probes_in_flight = max(self._probes_in_flight - 1, 0)
+                self._probe_successes += 1
+                if self._probe_successes >= self.half_open_max_calls:
+                    self._transition(self.CLOSED)
+            else:
+                self._outcomes.append(True)
+
+    def record_failure(self):
+        """Record a 5xx response, timeout or connection error"""
+        with self._lock:
+            self._total_failures += 1
+            if self._state == self.HALF_OPEN:
+                self._probes_in_flight = max(self._probes_in_flight - 1, 0)
+                self._transition(self.OPEN)
+            elif self._state == self.CLOSED:
+                self._outcomes.append(False)
+                if (len(self._outcomes) >= self.minimum_calls and
+                        self._failure_rate() >= self.failure_rate_threshold):
+                    self._transition(self.OPEN)
+
+    def release(self):
+        """Give back the probe slot reserved by allow_request for a call
+        that ended without an outcome to record, e.g. because it raised
+        before a response was received
+        """
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._probes_in_flight = max(self._probes_in_flight - 1, 0)
+
+    def reset(self):
+        """Force the breaker back to closed and forget recorded outcomes"""
+        with self._lock:
+            self._transition(self.CLOSED)
+
+    def snapshot(self):
+        """Return a dictionary describing the breaker, suitable for export
+        to a dashboard.
+        """
+        with self._lock:
+            return {
+                'state': self._current_state(),
+                'failure_rate': self._failure_rate(),
+                'window_calls': len(self._outcomes),
+                'total_successes': self._total_successes,
+                'total_failures': self._total_failures,
+                'rejected': self._rejected,
+                'times_opened': self._times_opened,
+                'probes_in_flight': self._probes_in_flight}
+
+    def _failure_rate(self):
+        if not self._outcomes:
+            return 0.0
+        return self._outcomes.count(False) / len(self._outcomes)
+
+    def _current_state(self):
+        if (self._state == self.OPEN and
+                self._clock() - self._opened_at >= self.reset_timeout):
+            self._transition(self.HALF_OPEN)
+        return self._state
+
+    def _transition(self, new_state):
+        old_state = self._state
+        self._state = new_state
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        if new_state == self.OPEN:
+            self._opened_at = self._clock()
+            self._times_opened += 1
+        elif new_state == self.CLOSED:
+            self._outcomes.clear()
+            self._opened_at = None
+        if old_state != new_state and self.on_state_change is not None:
+            self.on_state_change(self, old_state, new_state)
+
+
+class CircuitBreakerRegistry:
+
+    """Holds one CircuitBreaker per MWS endpoint. Share a registry between
+    AmazonPayClient instances so that every client talking to the same
+    region sees the same breaker.
+    """
+
+    def __init__(self, **breaker_options):
+        """
+        Parameters
+        ----------
+        breaker_options : keyword arguments, optional
+            Passed to every CircuitBreaker created by this registry.
+        """
+        self._breaker_options = breaker_options
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def get(self, endpoint):
+        """Return the breaker for endpoint, creating it on first use"""
+        with self._lock:
+            breaker = self._breakers.get(endpoint)
+            if breaker is None:
+                breaker = CircuitBreaker(**self._breaker_options)
+                self._breakers[endpoint] = breaker
+            return breaker
+
+    def snapshot(self):
+        """Return the state of every known breaker keyed by endpoint"""
+        with self._lock:
+            breakers = dict(self._breakers)
+        return {endpoint: breaker.snapshot()
+                for endpoint, breaker in breakers.items()}
@@ -6,9 +6,17 @@ import logging
 import platform
 import amazon_pay.ap_region as ap_region
 import amazon_pay.version as ap_version
+from amazon_pay.hooks import Hooks, composite_operation
+from amazon_pay.idempotency import IdempotentCalls, idempotency_key
 from amazon_pay.payment_request import PaymentRequest
+from amazon_pay.payment_response import PaymentResponse
+from amazon_pay.singleflight import SingleFlight, read_key
 from fileinput import filename
 
+# Seconds get_login_profile keeps the profile of a validated access token.
+LWA_CACHE_TTL = 300
+
+
 class AmazonPayClient:
 
     logger = logging.getLogger('__amazon_pay_sdk__')
@@ -33,7 +41,19 @@ class AmazonPayClient:
             application_version=None,
             log_enabled=False,
             log_file_name=None,
-            log_level=None):
+            log_level=None,
+            circuit_breaker=None,
+            metrics=None,
+            mws_endpoint=None,
+            transport=None,
+            profiler=None,
+            keep_response_xml=True,
+            compress_responses=True,
+            idempotency_store=None,
+            coalesce_reads=False,
+            response_cache=None,
+            order_index=None,
+            timeout=None):
     
         """
         Parameters
@@ -91,6 +111,74 @@ class AmazonPayClient:
             The level of logging recorded
             Default: "None"
             Levels: "CRITICAL"; "ERROR"; "WARNING"; "INFO"; "DEBUG"; "NOTSET"
+
+        circuit_breaker: CircuitBreakerRegistry, optional
+            Registry holding one circuit breaker per MWS endpoint. While the
+            breaker for the current endpoint is open, calls return a
+            PaymentCircuitOpenResponse without contacting MWS. Share one
+            registry between clients to share breaker state.
+            Default: None
+
+        metrics: MetricsSink, optional
+            Receives request counts, status codes, retries, throttle sleeps,
+            bytes sent and received, and sign/network/parse latencies per
+            Action and SellerId. See amazon_pay.metrics.InMemoryMetricsSink.
+            Default: None
+
+        mws_endpoint: string, optional
+            Full URL to send API calls to instead of the regional MWS
+            endpoint, e.g. the endpoint of amazon_pay.local_mws.LocalMwsServer.
+            Default: None
+
+        transport: Transport, optional
+            Object sending the signed requests, e.g. a RecordingTransport or
+            ReplayTransport from amazon_pay.transport. Default: None (post
+            with requests)
+
+        profiler: Profiler, optional
+            Accumulates wall and CPU time of the SDK phases of sampled calls
+            per Action. See amazon_pay.profiler.Profiler. Default: None
+
+        keep_response_xml: boolean, optional
+            Keep the raw response body in every PaymentResponse. Set to False
+            to drop it after parsing and reduce retained memory; to_xml() then
+            serializes the parsed tree. Default: True
+
+        compress_responses: boolean, optional
+            Ask MWS for gzip or deflate encoded responses. Responses are
+            decompressed while they are read. Default: True
+
+        idempotency_store: IdempotencyStore, optional
+            Keeps the successful responses of authorize, capture, refund and
+            authorize_on_billing_agreement keyed by their reference ID. A
+            repeated call with the same reference ID returns the stored
+            response without calling MWS, and concurrent duplicates wait for
+            the first call. See amazon_pay.idempotency. Default: None
+
+        coalesce_reads: boolean, optional
+            Let concurrent identical Get*Details, GetMerchantAccountStatus and
+            GetServiceStatus calls (same Action, IDs, SellerId and tokens)
+            share one MWS request and the same PaymentResponse.
+            Default: False
+
+        response_cache: ResponseCache, optional
+            Serves repeated read-only calls from a cache with per-Action TTLs.
+            Calls changing an order, authorization, capture, refund or
+            billing agreement drop its cached responses. See
+            amazon_pay.response_cache. Default: None
+
+        order_index: OrderIndex, optional
+            Records the order references, authorizations, captures and
+            refunds of every successful response in a local index, so that
+            their IDs, states and amounts can be looked up without calling
+            MWS. See amazon_pay.order_index. Default: None
+
+        timeout: float or tuple, optional
+            Seconds to wait for the connection and for each read from MWS,
+            or a (connect, read) tuple, passed to requests and to the
+            transport. A call timing out raises requests.exceptions.Timeout
+            and counts as a failure for the circuit breaker.
+            Default: None (wait indefinitely)
         """
         env_param_map = {'mws_access_key': 'AP_MWS_ACCESS_KEY',
                          'mws_secret_key': 'AP_MWS_SECRET_KEY',
@@ -120,12 +208,31 @@ class AmazonPayClient:
         self.handle_throttle = handle_throttle
         self.application_name = application_name
         self.application_version = application_version
+        self.circuit_breaker = circuit_breaker
+        self.metrics = metrics
+        self.hooks = Hooks()
+        self.transport = transport
+        self.profiler = profiler
+        self.keep_response_xml = keep_response_xml
+        self.compress_responses = compress_responses
+        self.timeout = timeout
+        self.idempotency_store = idempotency_store
+        self._idempotent_calls = None
+        if idempotency_store is not None:
+            self._idempotent_calls = IdempotentCalls(idempotency_store)
+        self.coalesce_reads = coalesce_reads
+        self._read_flight = SingleFlight()
+        self.response_cache = response_cache
+        self.order_index = order_index
+        self._lwa_clients = {}
+        self._lwa_session = None
 
         self._sandbox = sandbox
         self._api_version = ap_version.versions['api_version']
         self._application_library_version = ap_version.versions[
             'application_version']
         self._mws_endpoint = None
+        self._mws_endpoint_override = mws_endpoint
         self._set_endpoint()
 
         if log_enabled is not False:
@@ -169,7 +276,9 @@ class AmazonPayClient:
 
         self._headers = {
             'Content-Type': 'application/x-www-form-urlencoded',
-            'User-Agent': self._user_agent}
+            'User-Agent': self._user_agent,
+            'Accept-Encoding':
+                'gzip, deflate' if compress_responses else 'identity'}
 
     @property
     def sandbox(self):
@@ -183,7 +292,9 @@ class AmazonPayClient:
 
     def _set_endpoint(self):
         """Set endpoint for API calls"""
-        if self._sandbox:
+        if self._mws_endpoint_override is not None:
+            self._mws_endpoint = self._mws_endpoint_override
+        elif self._sandbox:
             self._mws_endpoint = \
                 'https://{}/OffAmazonPayments_Sandbox/{}'.format(
                     self._region, self._api_version)
@@ -192,18 +303,61 @@ class AmazonPayClient:
                 'https://{}/OffAmazonPayments/{}'.format(
                     self._region, self._api_version)
 
+    def register_hook(self, event, callback):
+        """Register a lifecycle callback. callback receives a
+        amazon_pay.hooks.LifecycleEvent.
+
+        Parameters
+        ----------
+        event : string, required
+            One of before_sign, before_send, after_receive, before_retry,
+            after_parse, span_start, span_end. Every MWS call runs in a span
+            named after its Action; charge and get_payment_details open a
+            parent span around the calls they make.
+
+        callback : callable, required
+            Function taking the event.
+        """
+        self.hooks.register(event, callback)
+
+    def unregister_hook(self, event, callback):
+        """Remove a callback added with register_hook"""
+        self.hooks.unregister(event, callback)
+
+    def circuit_breaker_state(self):
+        """Return the circuit breaker snapshot for the current endpoint, or
+        None if no circuit breaker is configured.
+        """
+        breaker = self._circuit_breaker()
+        return breaker.snapshot() if breaker is not None else None
+
     def get_login_profile(self, access_token, client_id):
         """Get profile associated with LWA user. This is a helper method for
         Login with Amazon (separate service). Added here for convenience.
+
+        The LoginWithAmazon client of each client_id is kept and shares one
+        pooled requests.Session. It caches the profile of a validated token
+        for LWA_CACHE_TTL seconds, never past the token's expiry.
         """
-        from amazon_pay.login_with_amazon import LoginWithAmazon
-        lwa_client = LoginWithAmazon(
-            client_id=client_id,
-            region=self._region_code,
-            sandbox=self._sandbox)
-        response = lwa_client.get_login_profile(access_token=access_token)
-        return response
-    
+        return self._lwa_client(client_id).get_login_profile(
+            access_token=access_token)
+
+    def _lwa_client(self, client_id):
+        key = (client_id, self._region_code, self._sandbox)
+        lwa_client = self._lwa_clients.get(key)
+        if lwa_client is None:
+            import requests
+            from amazon_pay.login_with_amazon import LoginWithAmazon
+            if self._lwa_session is None:
+                self._lwa_session = requests.Session()
+            lwa_client = self._lwa_clients.setdefault(key, LoginWithAmazon(
+                client_id=client_id,
+                region=self._region_code,
+                sandbox=self._sandbox,
+                session=self._lwa_session,
+                cache_ttl=LWA_CACHE_TTL))
+        return lwa_client
+
     def get_merchant_account_status(
             self,
             merchant_id=None,
@@ -990,7 +1144,8 @@ class AmazonPayClient:
             page_size=None,
             order_reference_status_list_filter=None,
             merchant_id=None,
-            mws_auth_token=None):
+            mws_auth_token=None,
+            stream=False):
 
         """
         Allows the search of any Amazon Pay order made using secondary
@@ -1052,6 +1207,12 @@ class AmazonPayClient:
             on file. Filters MUST be written out in English.
             Example: "Open", "Closed", "Suspended", "Canceled"
             Default: None       
+
+        stream: boolean, optional
+            Return an OrderReferenceStream that parses the response while it
+            is read and yields one dictionary per OrderReference, instead of
+            a PaymentResponse. Error responses are returned as usual.
+            Default: False
         """
         
         if self.region is not None:
@@ -1087,13 +1248,15 @@ class AmazonPayClient:
                 'OrderReferenceStatusListFilter.OrderReferenceStatus.',
                 order_reference_status_list_filter, optionals)
 
-        return self._operation(params=parameters, options=optionals)
+        return self._operation(
+            params=parameters, options=optionals, stream=stream)
 
     def list_order_reference_by_next_token(
             self,
             next_page_token,
             merchant_id=None,
-            mws_auth_token=None):
+            mws_auth_token=None,
+            stream=False):
         """
         next_page_token : string, required
             Uses the key from a list_order_reference call that provides a 
@@ -1108,6 +1271,9 @@ class AmazonPayClient:
         mws_auth_token: string, optional
             Your marketplace web service auth token. Default: None
 
+        stream: boolean, optional
+            Return an OrderReferenceStream instead of a PaymentResponse. See
+            list_order_reference. Default: False
         """
 
         parameters = {
@@ -1116,8 +1282,10 @@ class AmazonPayClient:
         optionals = {
             'SellerId': merchant_id,
             'MWSAuthToken': mws_auth_token}
-        return self._operation(params=parameters, options=optionals)
+        return self._operation(
+            params=parameters, options=optionals, stream=stream)
 
+    @composite_operation
     def get_payment_details(
             self,
             amazon_order_reference_id,
@@ -1536,6 +1704,7 @@ class AmazonPayClient:
 
         return self._operation(params=parameters)
 
+    @composite_operation
     def charge(
             self,
             amazon_reference_id,
@@ -1702,7 +1871,7 @@ class AmazonPayClient:
         """
         return re.search('^(B|C)', amazon_reference_id)
 
-    def _operation(self, params, options=None):
+    def _operation(self, params, options=None, stream=False):
         """Parses required and optional parameters and passes to the Request
         object.
         """
@@ -1712,6 +1881,30 @@ class AmazonPayClient:
                 if options[opt] is not None:
                     params[opt] = options[opt]
 
+        if self.response_cache is not None:
+            return self.response_cache.call(
+                params, self.merchant_id,
+                lambda: self._dispatch(params, stream))
+        return self._dispatch(params, stream)
+
+    def _dispatch(self, params, stream=False):
+        """Send a call through the idempotency store or read coalescing,
+        when enabled
+        """
+        if self._idempotent_calls is not None:
+            key = idempotency_key(params, self.merchant_id)
+            if key is not None:
+                return self._idempotent_calls.call(
+                    key, params, lambda: self._send(params, stream))
+        if self.coalesce_reads:
+            key = read_key(params, self.merchant_id)
+            if key is not None:
+                return self._read_flight.do(
+                    key, lambda: self._send(params, stream))
+        return self._send(params, stream)
+
+    def _send(self, params, stream=False):
+        """Send one API call and return its response"""
         request = PaymentRequest(
             params=params,
             config={'mws_access_key': self.mws_access_key,
@@ -1720,10 +1913,48 @@ class AmazonPayClient:
                     'merchant_id': self.merchant_id,
                     'mws_endpoint': self._mws_endpoint,
                     'headers': self._headers,
-                    'handle_throttle': self.handle_throttle})
-
-        request.send_post()
+                    'handle_throttle': self.handle_throttle,
+                    'circuit_breaker': self._circuit_breaker(),
+                    'metrics': self.metrics,
+                    'hooks': self.hooks,
+                    'transport': self.transport,
+                    'profiler': self._sampled_profiler(),
+                    'keep_response_xml': self.keep_response_xml,
+                    'stream': stream,
+                    'timeout': self.timeout})
+
+        with self.hooks.span(params['Action'], action=params['Action']) as span:
+            request.send_post()
+            span.attributes['request_id'] = request.response.request_id
+        if self.order_index is not None and \
+                isinstance(request.response, PaymentResponse):
+            # The call succeeded in MWS whether or not the index is updated
+            try:
+                self.order_index.record_response(request.response)
+            except Exception:
+                self.logger.exception('Order index update failed')
         return request.response
+
+    def invalidate_cache(self, *object_ids):
+        """Drop the cached responses of the orders or billing agreements the
+        object IDs belong to, e.g. the IDs of an IPN from
+        IpnHandler.object_ids(). Returns the number of dropped responses.
+        """
+        if self.response_cache is None:
+            return 0
+        return self.response_cache.invalidate(*object_ids)
+
+    def _sampled_profiler(self):
+        """Return the profiler if the next call should be profiled"""
+        if self.profiler is not None and self.profiler.sample():
+            return self.profiler
+        return None
+
+    def _circuit_breaker(self):
+        """Return the circuit breaker for the current endpoint, if any"""
+        if self.circuit_breaker is None:
+            return None
+        return self.circuit_breaker.get(self._mws_endpoint)
  
     def _enumerate(
         self,
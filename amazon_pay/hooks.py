@@ -0,0 +1,183 @@
+import time
+import logging
+import itertools
+import functools
+import threading
+from contextlib import contextmanager
+
+
+def composite_operation(method):
+    """Decorator for client methods that make several MWS calls. Runs the
+    method inside a span named after it so that the spans of the calls it
+    makes share it as their parent.
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.hooks.span(method.__name__):
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class Span:
+
+    """A timed section of work, either a single MWS call (named after its
+    Action) or a composite client operation such as charge or
+    get_payment_details. Spans opened while another span is active on the
+    same thread record it as their parent.
+
+    Properties
+    ----------
+    name : string
+        Action or client method name.
+
+    span_id : integer
+        Identifier unique within the process.
+
+    parent : Span
+        Enclosing span, or None.
+
+    attributes : dictionary
+        Extra data, e.g. request_id for MWS calls.
+
+    start, end : float
+        time.perf_counter() values. end is None while the span is open.
+    """
+
+    _ids = itertools.count(1)
+
+    def __init__(self, name, parent=None, attributes=None):
+        self.name = name
+        self.parent = parent
+        self.span_id = next(self._ids)
+        self.attributes = dict(attributes or {})
+        self.start = time.perf_counter()
+        self.end = None
+
+    @property
+    def duration(self):
+        """Seconds between start and end, or until now if still open"""
+        return (self.end or time.perf_counter()) - self.start
+
+
+class LifecycleEvent:
+
+    """Passed to every lifecycle callback.
+
+    Properties
+    ----------
+    name : string
+        Event name, one of Hooks.EVENTS.
+
+    action : string
+        MWS Action of the call, None for span events of composite operations.
+
+    attempt : integer
+        1 for the first attempt, incremented for every throttle retry.
+
+    span : Span
+        The span the event belongs to.
+
+    request_id : string
+        MWS RequestId, available from after_parse on.
+
+    status_code : integer
+        HTTP status code, available from after_receive on.
+
+    timings : dictionary
+        Seconds spent so far in the sign, network and parse phases.
+
+    retry_time : integer
+        Seconds the client will sleep before the retry (before_retry only).
+    """
+
+    def __init__(
+            self,
+            name,
+            action=None,
+            attempt=None,
+            span=None,
+            request_id=None,
+            status_code=None,
+            timings=None,
+            retry_time=None):
+        self.name = name
+        self.action = action
+        self.attempt = attempt
+        self.span = span
+        self.request_id = request_id
+        self.status_code = status_code
+        self.timings = timings or {}
+        self.retry_time = retry_time
+
+
+class Hooks:
+
+    """Registry of lifecycle callbacks. Callbacks receive a single
+    LifecycleEvent. Exceptions raised by callbacks are logged and never
+    interrupt the API call.
+    """
+
+    logger = logging.getLogger('__amazon_pay_sdk__')
+    logger.addHandler(logging.NullHandler())
+
+    EVENTS = ('before_sign', 'before_send', 'after_receive', 'before_retry',
+              'after_parse', 'span_start', 'span_end')
+
+    def __init__(self):
+        self._callbacks = {event: [] for event in self.EVENTS}
+        self._local = threading.local()
+
+    def __bool__(self):
+        return any(self._callbacks.values())
+
+    def register(self, event, callback):
+        """Call callback(LifecycleEvent) every time event fires"""
+        if event not in self._callbacks:
+            raise ValueError('Invalid event ({}).'.format(event))
+        self._callbacks[event].append(callback)
+
+    def unregister(self, event, callback):
+        """Remove a callback added with register"""
+        try:
+            self._callbacks[event].remove(callback)
+        except (KeyError, ValueError):
+            raise ValueError('Callback not registered for {}.'.format(event))
+
+    @property
+    def current_span(self):
+        """Innermost open span on this thread, or None"""
+        stack = getattr(self._local, 'stack', None)
+        return stack[-1] if stack else None
+
+    def fire(self, event, **data):
+        """Invoke the callbacks registered for event"""
+        callbacks = self._callbacks[event]
+        if not callbacks:
+            return
+        data.setdefault('span', self.current_span)
+        lifecycle_event = LifecycleEvent(event, **data)
+        for callback in list(callbacks):
+            try:
+                callback(lifecycle_event)
+            except Exception:
+                self.logger.warning(
+                    'Lifecycle callback for %s failed', event, exc_info=True)
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """Open a span around the enclosed block and fire span_start and
+        span_end for it.
+        """
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        span = Span(name, stack[-1] if stack else None, attributes)
+        stack.append(span)
+        self.fire('span_start', span=span, action=attributes.get('action'))
+        try:
+            yield span
+        finally:
+            stack.pop()
+            span.end = time.perf_counter()
+            self.fire('span_end', span=span, action=attributes.get('action'),
+                      request_id=span.attributes.get('request_id'))
@@ -0,0 +1,221 @@
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from amazon_pay.payment_response import PaymentResponse
+from amazon_pay.singleflight import SingleFlight, TOKEN_PARAMS
+
+
+# Actions that create an object in MWS, and the parameter holding the
+# caller's reference ID for it. MWS rejects a reused reference ID, so it
+# identifies a submission.
+IDEMPOTENT_ACTIONS = {
+    'Authorize': 'AuthorizationReferenceId',
+    'AuthorizeOnBillingAgreement': 'AuthorizationReferenceId',
+    'Capture': 'CaptureReferenceId',
+    'Refund': 'RefundReferenceId'}
+
+
+def idempotency_key(params, merchant_id):
+    """Return the idempotency key of a request, or None if its Action is not
+    idempotent. Keys are (SellerId, Action, reference ID) joined by '|'.
+    """
+    reference_param = IDEMPOTENT_ACTIONS.get(params.get('Action'))
+    if reference_param is None or not params.get(reference_param):
+        return None
+    return '|'.join((params.get('SellerId') or merchant_id,
+                     params['Action'],
+                     params[reference_param]))
+
+
+# Parameters that differ between two sends of the same request.
+UNSIGNED_PARAMS = ('Timestamp', 'Signature')
+
+
+def fingerprint(params):
+    """Hash of every request parameter except Timestamp and Signature, so
+    that a reference ID reused with another amount, note or MWSAuthToken is
+    recognized. Tokens are hashed as in singleflight.read_key.
+    """
+    items = {}
+    for name, value in params.items():
+        if name in UNSIGNED_PARAMS:
+            continue
+        if name in TOKEN_PARAMS and value is not None:
+            value = hashlib.sha256(value.encode('utf-8')).hexdigest()
+        items[name] = value
+    return hashlib.sha256(
+        json.dumps(sorted(items.items())).encode('utf-8')).hexdigest()
+
+
+def _reused(key):
+    return ValueError(
+        'Reference ID reused with different parameters ({}).'.format(key))
+
+
+class IdempotencyStore:
+
+    """Stores the responses of completed idempotent requests. get returns a
+    (fingerprint, xml) tuple or None, put records one.
+    """
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def put(self, key, fingerprint, xml):
+        raise NotImplementedError
+
+
+class MemoryIdempotencyStore(IdempotencyStore):
+
+    """Keeps the most recently used max_entries responses in memory"""
+
+    def __init__(self, max_entries=10000, ttl=None, clock=time.time):
+        """
+        Parameters
+        ----------
+        max_entries : integer, optional
+            Number of responses to keep. Default: 10000
+
+        ttl : float, optional
+            Seconds to keep a response, None keeps it until it is evicted.
+            Default: None
+
+        clock : callable, optional
+            Returns the current time in seconds. Default: time.time
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if self.ttl is not None and \
+                    self._clock() - entry[2] > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0], entry[1]
+
+    def put(self, key, fingerprint, xml):
+        with self._lock:
+            self._entries[key] = (fingerprint, xml, self._clock())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SqliteIdempotencyStore(IdempotencyStore):
+
+    """Keeps responses in an SQLite database, so that they survive restarts
+    and can be shared by processes on the same host
+    """
+
+    def __init__(self, path, ttl=None, clock=time.time):
+        """
+        Parameters
+        ----------
+        path : string, required
+            Database file, created if missing.
+
+        ttl : float, optional
+            Seconds to keep a response, None keeps it forever. Default: None
+
+        clock : callable, optional
+            Returns the current time in seconds. Default: time.time
+        """
+        self.path = path
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False,
+                                   isolation_level=None)
+        if path != ':memory:':
+            self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS idempotency ('
+            'key TEXT PRIMARY KEY, fingerprint TEXT, response TEXT, '
+            'created REAL)')
+
+    def get(self, key):
+        with self._lock:
+            row = self._db.execute(
+                'SELECT fingerprint, response, created FROM idempotency '
+                'WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            if self.ttl is not None and self._clock() - row[2] > self.ttl:
+                self._db.execute(
+                    'DELETE FROM idempotency WHERE key = ?', (key,))
+                return None
+            return row[0], row[1]
+
+    def put(self, key, fingerprint, xml):
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO idempotency VALUES (?, ?, ?, ?)',
+                (key, fingerprint, xml, self._clock()))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class IdempotentCalls:
+
+    """Runs idempotent requests at most once per key. Completed successful
+    responses are served from the store; concurrent submissions with the
+    same key wait for the first one and share its response or exception,
+    or raise ValueError if their parameters differ from it.
+    """
+
+    def __init__(self, store):
+        """
+        Parameters
+        ----------
+        store : IdempotencyStore, required
+            Where completed responses are kept.
+        """
+        self.store = store
+        self._flight = SingleFlight()
+
+    def call(self, key, params, send):
+        """Return the stored response for key or the response of send()"""
+        request_fingerprint = fingerprint(params)
+        response = self._stored(key, request_fingerprint)
+        if response is not None:
+            return response
+        # One call per key: a concurrent submission reusing the reference
+        # ID with other parameters would be rejected by MWS
+        leader_fingerprint, response = self._flight.do(
+            key, lambda: (request_fingerprint,
+                          self._send(key, request_fingerprint, send)))
+        if leader_fingerprint != request_fingerprint:
+            raise _reused(key)
+        return response
+
+    def _send(self, key, request_fingerprint, send):
+        response = self._stored(key, request_fingerprint)
+        if response is None:
+            response = send()
+            if response.success:
+                self.store.put(key, request_fingerprint, response.to_xml())
+        return response
+
+    def _stored(self, key, request_fingerprint):
+        stored = self.store.get(key)
+        if stored is None:
+            return None
+        if stored[0] != request_fingerprint:
+            raise _reused(key)
+        return PaymentResponse(stored[1])
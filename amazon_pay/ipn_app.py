@@ -0,0 +1,217 @@
+import asyncio
+import logging
+from amazon_pay.ipn_handler import IpnHandler, sns_header
+from amazon_pay.certificate_store import CertificateStore
+
+
+# SNS messages are at most 256 KB.
+DEFAULT_MAX_BODY = 256 * 1024
+
+STATUS_LINES = {
+    200: '200 OK',
+    400: '400 Bad Request',
+    405: '405 Method Not Allowed',
+    411: '411 Length Required',
+    413: '413 Payload Too Large',
+    500: '500 Internal Server Error',
+    503: '503 Service Unavailable'}
+
+
+def _header_name(name):
+    """Canonical form of a header name, e.g. X-Amz-Sns-Topic-Arn"""
+    return '-'.join(part.capitalize() for part in name.split('-'))
+
+
+class IpnEndpoint:
+
+    """HTTP-independent core of IpnWsgiApp and IpnAsgiApp. handle takes the
+    body and headers of a POST and returns the status code to answer with.
+
+    SubscriptionConfirmation messages are verified and, if
+    confirm_subscriptions is set, confirmed. Notifications are either
+    queued on an IpnPipeline or verified at once and passed to callback.
+    """
+
+    logger = logging.getLogger('__amazon_pay_sdk__')
+    logger.addHandler(logging.NullHandler())
+
+    def __init__(self, callback=None, pipeline=None, certificate_store=None,
+                 deduplicator=None, order_index=None,
+                 max_body=DEFAULT_MAX_BODY, confirm_subscriptions=True):
+        """
+        Parameters
+        ----------
+        callback : callable, optional
+            Called with the authenticated IpnHandler of every notification.
+            Default: None
+
+        pipeline : IpnPipeline, optional
+            Queue notifications on the pipeline instead of verifying them
+            while the request waits. Default: None
+
+        certificate_store : CertificateStore, optional
+            Cache of signing certificates. Default: a new CertificateStore
+
+        deduplicator : IpnDeduplicator, optional
+            Acknowledges notifications that were already processed without
+            verifying them again. Default: None
+
+        order_index : OrderIndex, optional
+            Passed to IpnHandler. Default: None
+
+        max_body : integer, optional
+            Largest accepted body in bytes. Default: DEFAULT_MAX_BODY
+
+        confirm_subscriptions : boolean, optional
+            Visit the SubscribeURL of verified SubscriptionConfirmation
+            messages. Default: True
+        """
+        self.callback = callback
+        self.pipeline = pipeline
+        self.certificate_store = certificate_store if certificate_store \
+            is not None else CertificateStore()
+        self.deduplicator = deduplicator
+        self.order_index = order_index
+        self.max_body = max_body
+        self.confirm_subscriptions = confirm_subscriptions
+
+    def handle(self, body, headers):
+        """Process one POSTed SNS message and return the HTTP status"""
+        if self.pipeline is not None and sns_header(
+                headers, 'X-Amz-Sns-Message-Type') == 'Notification':
+            try:
+                return self.pipeline.submit(body, headers)
+            except (ValueError, KeyError, TypeError) as ex:
+                # e.g. a body that is not UTF-8
+                self.logger.warning('Rejected SNS message: %s', ex)
+                return 400
+
+        ipn_handler = IpnHandler(
+            body, headers, order_index=self.order_index,
+            deduplicator=self.deduplicator,
+            certificate_store=self.certificate_store)
+        try:
+            message_type = ipn_handler._type
+            if message_type == 'Notification' and ipn_handler.is_duplicate():
+                return 200
+            ipn_handler.authenticate()
+            if message_type == 'SubscriptionConfirmation' and \
+                    self.confirm_subscriptions:
+                ipn_handler.confirm_subscription()
+        except (ValueError, KeyError, TypeError) as ex:
+            self.logger.warning('Rejected SNS message: %s', ex)
+            return 400
+        if message_type != 'Notification':
+            return 200
+        try:
+            if self.callback is not None:
+                self.callback(ipn_handler)
+        except Exception:
+            self.logger.exception('IPN callback failed')
+            return 500
+        ipn_handler.mark_processed()
+        return 200
+
+
+class IpnWsgiApp(IpnEndpoint):
+
+    """WSGI application receiving SNS messages, e.g.
+
+        app = IpnWsgiApp(callback=process)
+
+    See IpnEndpoint for the parameters.
+    """
+
+    def __call__(self, environ, start_response):
+        status = self._status(environ)
+        start_response(STATUS_LINES[status],
+                       [('Content-Type', 'text/plain'),
+                        ('Content-Length', '0')])
+        return [b'']
+
+    def _status(self, environ):
+        if environ.get('REQUEST_METHOD') != 'POST':
+            return 405
+        try:
+            length = int(environ.get('CONTENT_LENGTH') or '')
+        except ValueError:
+            return 411
+        if length < 0:
+            return 400
+        if length > self.max_body:
+            return 413
+        body = environ['wsgi.input'].read(length)
+        headers = {_header_name(key[5:].replace('_', '-')): value
+                   for key, value in environ.items()
+                   if key.startswith('HTTP_')}
+        if environ.get('CONTENT_TYPE'):
+            headers['Content-Type'] = environ['CONTENT_TYPE']
+        return self.handle(body, headers)
+
+
+class IpnAsgiApp(IpnEndpoint):
+
+    """ASGI application receiving SNS messages. Certificate download,
+    signature verification and the callback run in an executor, so the
+    event loop is never blocked by them.
+
+    Parameters
+    ----------
+    executor : concurrent.futures.Executor, optional
+        Where messages are processed. Default: the loop's default executor
+
+    See IpnEndpoint for the other parameters.
+    """
+
+    def __init__(self, *args, executor=None, **kwargs):
+        super(IpnAsgiApp, self).__init__(*args, **kwargs)
+        self.executor = executor
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            while True:
+                message = await receive()
+                if message['type'] == 'lifespan.startup':
+                    await send({'type': 'lifespan.startup.complete'})
+                elif message['type'] == 'lifespan.shutdown':
+                    await send({'type': 'lifespan.shutdown.complete'})
+                    return
+        if scope['type'] != 'http':
+            return
+        status = await self._status(scope, receive)
+        await send({'type': 'http.response.start',
+                    'status': status,
+                    'headers': [(b'content-type', b'text/plain'),
+                                (b'content-length', b'0')]})
+        await send({'type': 'http.response.body', 'body': b''})
+
+    async def _status(self, scope, receive):
+        if scope.get('method') != 'POST':
+            return 405
+        headers = {_header_name(name.decode('latin-1')):
+                   value.decode('latin-1')
+                   for name, value in scope.get('headers', ())}
+        try:
+            length = int(headers.get('Content-Length', 0))
+        except ValueError:
+            return 400
+        if length < 0:
+            return 400
+        if length > self.max_body:
+            return 413
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return 400
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > self.max_body:
+                return 413
+            chunks.append(chunk)
+            if not message.get('more_body', False):
+                break
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, self.handle, b''.join(chunks), headers)
@@ -0,0 +1,140 @@
+import asyncio
+from amazon_pay.ipn_handler import IpnHandler
+from amazon_pay.certificate_store import CertificateStore
+
+
+class AsyncCertificateStore:
+
+    """CertificateStore for asyncio applications. Cached certificates are
+    returned without leaving the event loop; a certificate that is not
+    cached is downloaded once in an executor, however many coroutines ask
+    for it at the same time.
+    """
+
+    def __init__(self, store=None, executor=None):
+        """
+        Parameters
+        ----------
+        store : CertificateStore, optional
+            Cache shared with threaded code. Default: a new CertificateStore
+
+        executor : concurrent.futures.Executor, optional
+            Where certificates are downloaded. Default: the loop's default
+            executor
+        """
+        self.store = store if store is not None else CertificateStore()
+        self.executor = executor
+        self.shared = 0
+        self._pending = {}
+
+    async def get(self, url):
+        """Return the PEM text of the certificate at url"""
+        pem = self.store._cached(url)
+        if pem is not None:
+            self.store.hits += 1
+            return pem
+        loop = asyncio.get_running_loop()
+        key = (loop, url)
+        future = self._pending.get(key)
+        if future is not None:
+            self.shared += 1
+            return await asyncio.shield(future)
+        future = loop.run_in_executor(self.executor, self.store.get, url)
+        self._pending[key] = future
+        try:
+            return await asyncio.shield(future)
+        finally:
+            if self._pending.get(key) is future:
+                del self._pending[key]
+
+    def put(self, url, pem):
+        """Cache a certificate, e.g. one shipped with the application"""
+        self.store.put(url, pem)
+
+
+_default_store = None
+
+
+def default_certificate_store():
+    """AsyncCertificateStore shared by AsyncIpnHandlers created without one"""
+    global _default_store
+    if _default_store is None:
+        _default_store = AsyncCertificateStore()
+    return _default_store
+
+
+class AsyncIpnHandler(IpnHandler):
+
+    """IpnHandler for asyncio applications. authenticate() is a coroutine
+    that fetches the signing certificate through an AsyncCertificateStore
+    and verifies the signature in an executor, so the event loop keeps
+    serving other requests. The message is decoded lazily, as by
+    IpnHandler, and only the cheap header and URL checks run on the loop.
+
+        ipn_handler = AsyncIpnHandler(body, headers)
+        await ipn_handler.authenticate()
+    """
+
+    def __init__(self, body, headers, order_index=None, deduplicator=None,
+                 certificate_store=None, executor=None):
+        """
+        Parameters
+        ----------
+        body : bytes or string, required
+            Body of the SNS message.
+
+        headers : dictionary, required
+            Headers of the SNS message.
+
+        order_index : OrderIndex, optional
+            See IpnHandler. Default: None
+
+        deduplicator : IpnDeduplicator, optional
+            See IpnHandler. Default: None
+
+        certificate_store : AsyncCertificateStore or CertificateStore,
+            optional
+            Cache of signing certificates.
+            Default: default_certificate_store()
+
+        executor : concurrent.futures.Executor, optional
+            Where signatures are verified. Default: the loop's default
+            executor
+        """
+        if certificate_store is None:
+            certificate_store = default_certificate_store()
+        elif isinstance(certificate_store, CertificateStore):
+            certificate_store = AsyncCertificateStore(certificate_store)
+        super(AsyncIpnHandler, self).__init__(
+            body, headers, order_index=order_index,
+            deduplicator=deduplicator)
+        self.async_certificate_store = certificate_store
+        self.executor = executor
+
+    async def authenticate(self):
+        """Validate the SNS message. Returns True on success and raises
+        ValueError otherwise.
+        """
+        self._validate_header()
+        self._validate_cert_url()
+        try:
+            self._pem = await self.async_certificate_store.get(
+                self._signing_cert_url)
+        except ValueError:
+            self.error = 'Error retrieving certificate.'
+            raise
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self._verify)
+
+    async def confirm_subscription(self, timeout=10):
+        """Confirm the subscription of an authenticated
+        SubscriptionConfirmation message, see IpnHandler
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, super(AsyncIpnHandler, self).confirm_subscription,
+            timeout)
+
+    def _verify(self):
+        self._validate_signature()
+        return self._authenticated()
@@ -0,0 +1,199 @@
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from amazon_pay.ipn_handler import sns_header
+
+
+# SNS retries a notification every hour for 14 days; remember messages a
+# day longer than that.
+DEFAULT_WINDOW = 15 * 24 * 3600
+
+
+class DedupStore:
+
+    """Remembers the keys of processed notifications until they expire"""
+
+    def seen(self, key):
+        raise NotImplementedError
+
+    def add(self, key, expires):
+        raise NotImplementedError
+
+
+class MemoryDedupStore(DedupStore):
+
+    """Keeps the keys of the last max_entries notifications in memory"""
+
+    def __init__(self, max_entries=100000, clock=time.time):
+        """
+        Parameters
+        ----------
+        max_entries : integer, optional
+            Number of keys to keep. Default: 100000
+
+        clock : callable, optional
+            Returns the current time in seconds. Default: time.time
+        """
+        self.max_entries = max_entries
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def seen(self, key):
+        with self._lock:
+            expires = self._entries.get(key)
+            if expires is None:
+                return False
+            if expires <= self._clock():
+                del self._entries[key]
+                return False
+            return True
+
+    def add(self, key, expires):
+        now = self._clock()
+        with self._lock:
+            self._entries[key] = expires
+            self._entries.move_to_end(key)
+            while self._entries and (
+                    len(self._entries) > self.max_entries or
+                    next(iter(self._entries.values())) <= now):
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SqliteDedupStore(DedupStore):
+
+    """Keeps keys in an SQLite database shared by the processes on a host,
+    e.g. the workers of a webhook server
+    """
+
+    def __init__(self, path, clock=time.time):
+        """
+        Parameters
+        ----------
+        path : string, required
+            Database file, created if missing.
+
+        clock : callable, optional
+            Returns the current time in seconds. Default: time.time
+        """
+        self.path = path
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False,
+                                   isolation_level=None)
+        if path != ':memory:':
+            self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS ipn_seen ('
+            'key TEXT PRIMARY KEY, expires REAL)')
+        self._db.execute(
+            'CREATE INDEX IF NOT EXISTS ipn_seen_expires ON ipn_seen (expires)')
+
+    def seen(self, key):
+        with self._lock:
+            row = self._db.execute(
+                'SELECT expires FROM ipn_seen WHERE key = ?',
+                (key,)).fetchone()
+        return row is not None and row[0] > self._clock()
+
+    def add(self, key, expires):
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO ipn_seen VALUES (?, ?)',
+                (key, expires))
+            self._db.execute(
+                'DELETE FROM ipn_seen WHERE expires <= ?', (self._clock(),))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class IpnDeduplicator:
+
+    """Recognizes notifications that were already processed, by their SNS
+    MessageId or their NotificationReferenceId, so that duplicates can be
+    acknowledged without verifying their signature again.
+
+    Check with is_duplicate(body, headers) before building an IpnHandler,
+    or pass the deduplicator to IpnHandler and call its is_duplicate().
+    Notifications are only marked by IpnHandler.mark_processed(), after
+    they were authenticated and processed, so neither an unverified message
+    nor one whose processing failed suppresses its retries.
+    """
+
+    def __init__(self, store=None, window=DEFAULT_WINDOW, max_entries=100000,
+                 clock=time.time):
+        """
+        Parameters
+        ----------
+        store : DedupStore, optional
+            Shared store consulted when a key is not in memory, e.g.
+            SqliteDedupStore. Default: None
+
+        window : float, optional
+            Seconds to remember a notification. Default: DEFAULT_WINDOW
+
+        max_entries : integer, optional
+            Number of keys kept in memory. Default: 100000
+
+        clock : callable, optional
+            Returns the current time in seconds. Default: time.time
+        """
+        self.store = store
+        self.window = window
+        self.duplicates = 0
+        self._clock = clock
+        self._memory = MemoryDedupStore(max_entries, clock)
+
+    def is_duplicate(self, body, headers):
+        """Return True if the SNS message was already processed. The
+        X-Amz-Sns-Message-Id header is checked before the body is decoded.
+        """
+        message_id = sns_header(headers, 'X-Amz-Sns-Message-Id')
+        if message_id is not None and self._seen('message:' + message_id):
+            self.duplicates += 1
+            return True
+        if isinstance(body, bytes):
+            body = body.decode('utf-8')
+        try:
+            payload = json.loads(body)
+            message = json.loads(payload['Message'])
+        except (ValueError, KeyError, TypeError):
+            return False
+        return self.seen(payload.get('MessageId'),
+                         message.get('NotificationReferenceId'))
+
+    def seen(self, message_id, notification_reference_id=None):
+        """Return True if a notification with either ID was processed"""
+        if any(self._seen(key) for key in self._keys(
+                message_id, notification_reference_id)):
+            self.duplicates += 1
+            return True
+        return False
+
+    def mark(self, message_id, notification_reference_id=None):
+        """Remember a processed notification for window seconds"""
+        expires = self._clock() + self.window
+        for key in self._keys(message_id, notification_reference_id):
+            self._memory.add(key, expires)
+            if self.store is not None:
+                self.store.add(key, expires)
+
+    def _keys(self, message_id, notification_reference_id):
+        keys = []
+        if message_id:
+            keys.append('message:' + message_id)
+        if notification_reference_id:
+            keys.append('notification:' + notification_reference_id)
+        return keys
+
+    def _seen(self, key):
+        if self._memory.seen(key):
+            return True
+        return self.store is not None and self.store.seen(key)
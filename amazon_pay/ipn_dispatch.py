@@ -0,0 +1,195 @@
+import logging
+
+
+def _slots(fields):
+    return tuple(name for name, path in fields)
+
+
+class NotificationEvent:
+
+    """Compact, typed view of an IPN. Subclasses list the values they read
+    from NotificationData in _fields as (attribute, path) pairs; missing
+    elements are None.
+
+    Properties
+    ----------
+    notification_type : string
+        NotificationType of the SNS message.
+
+    notification_reference_id : string
+        NotificationReferenceId, the same for every retry of a notification.
+
+    seller_id : string
+        SellerId the notification is for.
+
+    timestamp : string
+        Time the notification was sent.
+
+    is_sample : boolean
+        True for sample notifications sent from Seller Central.
+
+    notification : IpnHandler
+        The full notification, e.g. for notification.to_dict().
+    """
+
+    __slots__ = ('notification_type', 'notification_reference_id',
+                 'seller_id', 'timestamp', 'is_sample', 'notification')
+    _fields = ()
+
+    def __init__(self, notification):
+        message = notification._message
+        self.notification_type = message.get('NotificationType')
+        self.notification_reference_id = message.get(
+            'NotificationReferenceId')
+        self.seller_id = message.get('SellerId')
+        self.timestamp = message.get('Timestamp')
+        self.is_sample = bool(message.get('IsSample'))
+        self.notification = notification
+        response = notification._notification_response()
+        root, ns = response._root, response._ns
+        for name, path in self._fields:
+            value = root.findtext(path.format(ns=ns))
+            if value is not None:
+                value = value.strip() or None
+            setattr(self, name, value)
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, ', '.join(
+            '{}={!r}'.format(name, getattr(self, name))
+            for name, path in self._fields))
+
+
+class OrderReferenceEvent(NotificationEvent):
+
+    _fields = (
+        ('order_reference_id', './/{ns}AmazonOrderReferenceId'),
+        ('state', './/{ns}OrderReferenceStatus/{ns}State'),
+        ('reason_code', './/{ns}OrderReferenceStatus/{ns}ReasonCode'),
+        ('last_update', './/{ns}OrderReferenceStatus/{ns}LastUpdateTimestamp'),
+        ('amount', './/{ns}OrderTotal/{ns}Amount'),
+        ('currency_code', './/{ns}OrderTotal/{ns}CurrencyCode'))
+    __slots__ = _slots(_fields)
+
+
+class AuthorizationEvent(NotificationEvent):
+
+    _fields = (
+        ('authorization_id', './/{ns}AmazonAuthorizationId'),
+        ('reference_id', './/{ns}AuthorizationReferenceId'),
+        ('state', './/{ns}AuthorizationStatus/{ns}State'),
+        ('reason_code', './/{ns}AuthorizationStatus/{ns}ReasonCode'),
+        ('last_update', './/{ns}AuthorizationStatus/{ns}LastUpdateTimestamp'),
+        ('amount', './/{ns}AuthorizationAmount/{ns}Amount'),
+        ('currency_code', './/{ns}AuthorizationAmount/{ns}CurrencyCode'),
+        ('captured_amount', './/{ns}CapturedAmount/{ns}Amount'))
+    __slots__ = _slots(_fields)
+
+
+class CaptureEvent(NotificationEvent):
+
+    _fields = (
+        ('capture_id', './/{ns}AmazonCaptureId'),
+        ('reference_id', './/{ns}CaptureReferenceId'),
+        ('state', './/{ns}CaptureStatus/{ns}State'),
+        ('reason_code', './/{ns}CaptureStatus/{ns}ReasonCode'),
+        ('last_update', './/{ns}CaptureStatus/{ns}LastUpdateTimestamp'),
+        ('amount', './/{ns}CaptureAmount/{ns}Amount'),
+        ('currency_code', './/{ns}CaptureAmount/{ns}CurrencyCode'),
+        ('refunded_amount', './/{ns}RefundedAmount/{ns}Amount'))
+    __slots__ = _slots(_fields)
+
+
+class RefundEvent(NotificationEvent):
+
+    _fields = (
+        ('refund_id', './/{ns}AmazonRefundId'),
+        ('reference_id', './/{ns}RefundReferenceId'),
+        ('state', './/{ns}RefundStatus/{ns}State'),
+        ('reason_code', './/{ns}RefundStatus/{ns}ReasonCode'),
+        ('last_update', './/{ns}RefundStatus/{ns}LastUpdateTimestamp'),
+        ('amount', './/{ns}RefundAmount/{ns}Amount'),
+        ('currency_code', './/{ns}RefundAmount/{ns}CurrencyCode'))
+    __slots__ = _slots(_fields)
+
+
+class BillingAgreementEvent(NotificationEvent):
+
+    _fields = (
+        ('billing_agreement_id', './/{ns}AmazonBillingAgreementId'),
+        ('state', './/{ns}BillingAgreementStatus/{ns}State'),
+        ('reason_code', './/{ns}BillingAgreementStatus/{ns}ReasonCode'),
+        ('last_update',
+         './/{ns}BillingAgreementStatus/{ns}LastUpdateTimestamp'))
+    __slots__ = _slots(_fields)
+
+
+class ChargebackEvent(NotificationEvent):
+
+    _fields = (
+        ('chargeback_id', './/{ns}AmazonChargebackId'),
+        ('capture_id', './/{ns}AmazonCaptureReferenceId'),
+        ('order_reference_id', './/{ns}AmazonOrderReferenceId'),
+        ('state', './/{ns}ChargebackState'),
+        ('reason_code', './/{ns}ChargebackReason'),
+        ('amount', './/{ns}ChargebackAmount/{ns}Amount'),
+        ('currency_code', './/{ns}ChargebackAmount/{ns}CurrencyCode'))
+    __slots__ = _slots(_fields)
+
+
+# Event class built for each NotificationType.
+EVENT_TYPES = {
+    'OrderReferenceNotification': OrderReferenceEvent,
+    'AuthorizationNotification': AuthorizationEvent,
+    'CaptureNotification': CaptureEvent,
+    'RefundNotification': RefundEvent,
+    'BillingAgreementNotification': BillingAgreementEvent,
+    'ChargebackDetailedNotification': ChargebackEvent}
+
+
+class IpnDispatcher:
+
+    """Routes authenticated notifications to the callbacks registered for
+    their NotificationType. The type is read from the SNS message, so
+    NotificationData is only parsed, into one typed event shared by the
+    callbacks, for types that have a callback.
+    """
+
+    logger = logging.getLogger('__amazon_pay_sdk__')
+    logger.addHandler(logging.NullHandler())
+
+    def __init__(self):
+        self._callbacks = {notification_type: []
+                           for notification_type in EVENT_TYPES}
+        self.dispatched = 0
+        self.ignored = 0
+
+    def register(self, notification_type, callback):
+        """Call callback(event) for every notification of the type"""
+        if notification_type not in self._callbacks:
+            raise ValueError('Invalid notification type ({}).'.format(
+                notification_type))
+        self._callbacks[notification_type].append(callback)
+
+    def unregister(self, notification_type, callback):
+        """Remove a callback added with register"""
+        try:
+            self._callbacks[notification_type].remove(callback)
+        except (KeyError, ValueError):
+            raise ValueError('Callback not registered for {}.'.format(
+                notification_type))
+
+    def dispatch(self, ipn_handler):
+        """Pass an authenticated IpnHandler to the callbacks of its type.
+        Returns the event, or None if the type has no callbacks.
+        """
+        notification_type = ipn_handler.notification_type
+        callbacks = self._callbacks.get(notification_type)
+        if not callbacks:
+            self.ignored += 1
+            self.logger.debug('Ignored %s', notification_type)
+            return None
+        event = EVENT_TYPES[notification_type](ipn_handler)
+        self.dispatched += 1
+        for callback in list(callbacks):
+            callback(event)
+        return event
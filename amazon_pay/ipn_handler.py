@@ -3,10 +3,39 @@ import json
 import base64
 import logging
 from urllib import request
-from OpenSSL import crypto
-from urllib.error import HTTPError
+from urllib.error import HTTPError, URLError
 from urllib.parse import urlparse
 from amazon_pay.payment_response import PaymentResponse
+from amazon_pay.response_cache import OBJECT_ID
+from amazon_pay.certificate_store import validate_sns_url
+from amazon_pay.ipn_signature import default_verifier
+
+
+# Fields of an SNS message covered by its signature, in signing order.
+# Optional fields are skipped when absent or null.
+NOTIFICATION_SIGNED_FIELDS = ('Message', 'MessageId', 'Subject', 'Timestamp',
+                              'TopicArn', 'Type')
+SUBSCRIPTION_SIGNED_FIELDS = ('Message', 'MessageId', 'SubscribeURL',
+                              'Timestamp', 'Token', 'TopicArn', 'Type')
+
+
+def sns_header(headers, name):
+    """Return a header of an SNS request, matched case-insensitively, or
+    None
+    """
+    value = headers.get(name)
+    if value is not None:
+        return value
+    name = name.lower()
+    for key, value in headers.items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+def _payload_field(name):
+    """Property reading a field of the SNS message"""
+    return property(lambda self: self._payload[name])
 
 
 class IpnHandler():
@@ -36,7 +65,8 @@ class IpnHandler():
     managed push notification service.
     """
 
-    def __init__(self, body, headers):
+    def __init__(self, body, headers, order_index=None, deduplicator=None,
+                 certificate_store=None):
         """
         Parameters
         ----------
@@ -46,6 +76,18 @@ class IpnHandler():
         headers : dictionary
             The headers of the SNS message.
 
+        order_index : OrderIndex, optional
+            Records the objects of the notification once it is
+            authenticated. Default: None
+
+        deduplicator : IpnDeduplicator, optional
+            Remembers the notification once mark_processed() is called, so
+            that is_duplicate() recognizes SNS retries of it. Default: None
+
+        certificate_store : CertificateStore, optional
+            Cache of signing certificates to use instead of downloading the
+            certificate for every message. Default: None
+
 
         Properties
         ----------
@@ -54,28 +96,67 @@ class IpnHandler():
         """
 
         self.error = None
+        self.order_index = order_index
+        self.deduplicator = deduplicator
+        self.certificate_store = certificate_store
 
-        self._root = None
-        self._ns = None
-        self._response_type = None
+        self._verified = False
         self._headers = headers
-        self._payload = json.loads(body.decode('utf-8'))
+        self._body = body
         self._pem = None
 
-        self._message_encoded = self._payload['Message']
-        self._message = json.loads(self._payload['Message'])
-        self._message_id = self._payload['MessageId']
-        self._topic_arn = self._payload['TopicArn']
-        self._notification_data = self._message['NotificationData']
-        self._signing_cert_url = self._payload['SigningCertURL']
-        self._signature = self._payload['Signature']
-        self._timestamp = self._payload['Timestamp']
-        self._type = self._payload['Type']
-        self._xml = self._notification_data.replace(
-            '<?xml version="1.0" encoding="UTF-8"?>\n',
-            '')
-        self.logger.debug('IPN Response: %s', 
-            self._sanitize_response_data(self._xml))
+        # Decoded and parsed on first use, see _payload, _message, _xml and
+        # _notification_response
+        self._decoded_payload = None
+        self._decoded_message = None
+        self._stripped_xml = None
+        self._response = None
+        self._dict = None
+
+    _message_encoded = _payload_field('Message')
+    _message_id = _payload_field('MessageId')
+    _topic_arn = _payload_field('TopicArn')
+    _signing_cert_url = _payload_field('SigningCertURL')
+    _signature = _payload_field('Signature')
+    _timestamp = _payload_field('Timestamp')
+    _type = _payload_field('Type')
+
+    @property
+    def _payload(self):
+        """The SNS message, decoded on first use"""
+        if self._decoded_payload is None:
+            body = self._body
+            if isinstance(body, bytes):
+                body = body.decode('utf-8')
+            self._decoded_payload = json.loads(body)
+        return self._decoded_payload
+
+    @property
+    def _message(self):
+        """The notification wrapped in the SNS message, decoded on first use"""
+        if self._decoded_message is None:
+            self._decoded_message = json.loads(self._message_encoded)
+        return self._decoded_message
+
+    @property
+    def notification_type(self):
+        """NotificationType of the notification, read without parsing the
+        NotificationData XML
+        """
+        return self._message.get('NotificationType')
+
+    @property
+    def _notification_data(self):
+        return self._message['NotificationData']
+
+    @property
+    def _xml(self):
+        """NotificationData without its XML declaration"""
+        if self._stripped_xml is None:
+            self._stripped_xml = self._notification_data.replace(
+                '<?xml version="1.0" encoding="UTF-8"?>\n',
+                '')
+        return self._stripped_xml
 
     def authenticate(self):
         """Attempt to validate a SNS message received from Amazon
@@ -91,14 +172,67 @@ class IpnHandler():
         self._validate_cert_url()
         self._get_cert()
         self._validate_signature()
+        return self._authenticated()
+
+    def _authenticated(self):
+        """Record a notification whose signature was verified"""
+        self._verified = True
+        if self._type != 'Notification':
+            return True
+        if self.order_index is not None:
+            # A valid notification stays valid if the index update fails
+            try:
+                self.order_index.record_notification(self)
+            except Exception:
+                self.logger.exception('Order index update failed')
+        return True
 
+    def mark_processed(self):
+        """Remember the authenticated notification in the deduplicator.
+        Call once the application has processed it: a retry of a
+        notification whose processing failed must not be acknowledged as a
+        duplicate.
+        """
+        if not self._verified:
+            raise ValueError('Notification not authenticated.')
+        if self.deduplicator is not None and self._type == 'Notification':
+            self.deduplicator.mark(
+                self._message_id, self._message.get('NotificationReferenceId'))
+        return True
+
+    def is_duplicate(self):
+        """Return True if the deduplicator has seen this notification
+        processed before. Duplicates can be acknowledged without calling
+        authenticate.
+        """
+        if self.deduplicator is None:
+            return False
+        return self.deduplicator.seen(
+            self._message_id, self._message.get('NotificationReferenceId'))
+
+    def confirm_subscription(self, timeout=10):
+        """Confirm the subscription of an authenticated
+        SubscriptionConfirmation message by visiting its SubscribeURL
+        """
+        if self._type != 'SubscriptionConfirmation':
+            raise ValueError('Not a SubscriptionConfirmation message.')
+        subscribe_url = self._payload['SubscribeURL']
+        validate_sns_url(subscribe_url)
+        try:
+            with request.urlopen(request.Request(subscribe_url),
+                                 timeout=timeout):
+                pass
+        except URLError as ex:
+            self.error = 'Error confirming subscription.'
+            raise ValueError(
+                'Error confirming subscription. {}'.format(ex.reason))
         return True
 
     def _validate_header(self):
         """Compare the header topic_arn to the body topic_arn """
-        if 'X-Amz-Sns-Topic-Arn' in self._headers:
-            if self._topic_arn != self._headers.get(
-                    'X-Amz-Sns-Topic-Arn'):
+        topic_arn = sns_header(self._headers, 'X-Amz-Sns-Topic-Arn')
+        if topic_arn is not None:
+            if self._topic_arn != topic_arn:
                 self.error = 'Invalid TopicArn.'
                 raise ValueError('Invalid TopicArn')
         else:
@@ -129,6 +263,13 @@ class IpnHandler():
         return True
 
     def _get_cert(self):
+        if self.certificate_store is not None:
+            try:
+                self._pem = self.certificate_store.get(self._signing_cert_url)
+            except ValueError:
+                self.error = 'Error retrieving certificate.'
+                raise
+            return True
         try:
             cert_req = request.urlopen(
                 url=request.Request(self._signing_cert_url))
@@ -143,41 +284,68 @@ class IpnHandler():
 
     def _validate_signature(self):
         """Generate signing string and validate signature"""
-        signing_string = '{}\n{}\n{}\n{}\n{}\n{}\n{}\n{}\n{}\n{}\n'.format(
-            'Message',
-            self._message_encoded,
-            'MessageId',
-            self._message_id,
-            'Timestamp',
-            self._timestamp,
-            'TopicArn',
-            self._topic_arn,
-            'Type',
-            self._type)
-
-        crt = crypto.load_certificate(crypto.FILETYPE_PEM, self._pem)
-        signature = base64.b64decode(self._signature)
+        if self._type in ('SubscriptionConfirmation',
+                          'UnsubscribeConfirmation'):
+            names = SUBSCRIPTION_SIGNED_FIELDS
+        else:
+            names = NOTIFICATION_SIGNED_FIELDS
+        # Fields that are missing or null are not signed
+        signing_string = ''.join([
+            '{}\n{}\n'.format(name, self._payload[name])
+            for name in names if self._payload.get(name) is not None])
 
         try:
-            crypto.verify(
-                crt,
-                signature,
+            default_verifier.verify(
+                self._pem,
+                base64.b64decode(self._signature),
                 signing_string.encode('utf-8'),
-                'sha1')
-        except:
+                self._payload.get('SignatureVersion', '1'))
+        except ValueError as ex:
+            self.error = str(ex)
+            raise
+        except Exception:
             self.error = 'Invalid signature.'
             raise ValueError('Invalid signature.')
 
         return True
 
     def to_json(self):
-        """Retuns notification message as JSON""" 
-        return PaymentResponse(self._xml).to_json()
+        """Retuns notification message as JSON"""
+        return json.dumps(self.to_dict(), ensure_ascii=False)
 
     def to_xml(self):
         """Retuns notification message as XML"""
-        return PaymentResponse(self._xml).to_xml()
-    
+        return self._xml
+
+    def to_dict(self):
+        """Retuns notification message as Dictionary. The dictionary is
+        built once and shared by every call.
+        """
+        if self._dict is None:
+            self._dict = self._notification_response().to_dict()
+        return self._dict
+
+    def object_ids(self):
+        """Returns the IDs of the Amazon objects in the notification, e.g.
+        to pass to AmazonPayClient.invalidate_cache
+        """
+        ids = set()
+        for element in self._notification_response()._root.iter():
+            text = (element.text or '').strip()
+            if OBJECT_ID.match(text):
+                ids.add(text)
+        return sorted(ids)
+
+    def _notification_response(self):
+        """Parse NotificationData once"""
+        if self._response is None:
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug('IPN Response: %s',
+                                  self._sanitize_response_data(self._xml))
+            self._response = PaymentResponse(
+                self._notification_data.encode('utf-8'), keep_xml=False)
+        return self._response
+
     def _sanitize_response_data(self, text):
         editText = text
         patterns = []
@@ -0,0 +1,305 @@
+import os
+import json
+import queue
+import logging
+import threading
+from amazon_pay.ipn_handler import IpnHandler
+from amazon_pay.certificate_store import CertificateStore
+
+
+class SpillLog:
+
+    """Append-only NDJSON log of accepted notifications. Each notification
+    is written before it is acknowledged and marked done once processed, so
+    notifications acknowledged but not processed before a crash are
+    processed again on the next start. The file is truncated whenever no
+    notification is pending, and rewritten with only the pending
+    notifications once compact_after of them were marked done.
+    """
+
+    def __init__(self, path, fsync=True, compact_after=1000):
+        """
+        Parameters
+        ----------
+        path : string, required
+            Log file, created if missing. Notifications it holds that were
+            not marked done are available from recover().
+
+        fsync : boolean, optional
+            Flush every entry to disk before acknowledging. Default: True
+
+        compact_after : integer, optional
+            Entries marked done while others are pending before the file is
+            compacted. Default: 1000
+        """
+        self.path = path
+        self.fsync = fsync
+        self.compact_after = compact_after
+        self._lock = threading.Lock()
+        self._next_id = 1
+        # Logged line of every pending notification, in id order
+        self._pending = {}
+        self._done = 0
+        self._file = open(path, 'a+')
+        self._load()
+
+    def recover(self):
+        """Return the (id, body, headers) of the notifications that were
+        logged but not marked done when the log was opened
+        """
+        with self._lock:
+            recovered = self._recovered
+            self._recovered = []
+            return recovered
+
+    def append(self, body, headers):
+        """Log a notification and return its id"""
+        if isinstance(body, bytes):
+            body = body.decode('utf-8')
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            line = json.dumps({'id': entry_id, 'body': body,
+                               'headers': dict(headers)}) + '\n'
+            self._write(line)
+            self._pending[entry_id] = line
+            return entry_id
+
+    def done(self, entry_id):
+        with self._lock:
+            self._pending.pop(entry_id, None)
+            if not self._pending:
+                self._file.seek(0)
+                self._file.truncate()
+                self._file.flush()
+                self._done = 0
+                return
+            self._write(json.dumps({'done': entry_id}) + '\n')
+            self._done += 1
+            if self._done >= self.compact_after:
+                self._compact()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+    def _load(self):
+        """Read the pending notifications and continue after the highest id
+        in the file
+        """
+        self._file.seek(0)
+        entries = {}
+        for line in self._file:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # Partially written last line
+                continue
+            if 'done' in entry:
+                entries.pop(entry['done'], None)
+            else:
+                entries[entry['id']] = entry
+                self._next_id = max(self._next_id, entry['id'] + 1)
+        self._recovered = [
+            (e['id'], e['body'].encode('utf-8'), e['headers'])
+            for e in sorted(entries.values(), key=lambda e: e['id'])]
+        self._pending = {entry_id: json.dumps(
+            {'id': entry_id, 'body': body.decode('utf-8'),
+             'headers': headers}) + '\n'
+            for entry_id, body, headers in self._recovered}
+        self._compact()
+
+    def _compact(self):
+        """Replace the file by one holding only the pending notifications"""
+        temporary = self.path + '.tmp'
+        with open(temporary, 'w') as f:
+            f.writelines(self._pending.values())
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        self._file.close()
+        os.replace(temporary, self.path)
+        self._file = open(self.path, 'a+')
+        self._done = 0
+
+    def _write(self, line):
+        self._file.write(line)
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+
+class IpnPipeline:
+
+    """Accepts IPNs on a bounded queue and verifies, deduplicates and
+    dispatches them on a pool of worker threads, so that the HTTP endpoint
+    can answer SNS at once. When the queue is full submit returns 503 and
+    SNS delivers the notification again later.
+
+    Notifications that fail authentication are dropped and counted in
+    stats['failed']. Notifications whose callback raised, or whose
+    certificate could not be downloaded, are counted as failed as well but
+    stay pending in the spill log, so they are processed again on the next
+    start.
+    """
+
+    logger = logging.getLogger('__amazon_pay_sdk__')
+    logger.addHandler(logging.NullHandler())
+
+    def __init__(self, dispatcher=None, callback=None, deduplicator=None,
+                 order_index=None, workers=4, max_queue=1000,
+                 spill_path=None, certificate_store=None):
+        """
+        Parameters
+        ----------
+        dispatcher : IpnDispatcher, optional
+            Receives every authenticated notification. Default: None
+
+        callback : callable, optional
+            Called with every authenticated IpnHandler. Default: None
+
+        deduplicator : IpnDeduplicator, optional
+            Drops notifications that were already processed, checked when
+            they are submitted and again before they are verified.
+            Default: None
+
+        order_index : OrderIndex, optional
+            Passed to IpnHandler. Default: None
+
+        workers : integer, optional
+            Number of worker threads. Default: 4
+
+        max_queue : integer, optional
+            Notifications waiting for a worker before submit returns 503.
+            Default: 1000
+
+        spill_path : string, optional
+            Log accepted notifications to this file so that they survive a
+            restart, see SpillLog. Default: None
+
+        certificate_store : CertificateStore, optional
+            Cache of signing certificates. Default: a new CertificateStore
+        """
+        self.dispatcher = dispatcher
+        self.callback = callback
+        self.deduplicator = deduplicator
+        self.order_index = order_index
+        self.certificate_store = certificate_store if certificate_store \
+            is not None else CertificateStore()
+        self.workers = workers
+        self.spill_log = SpillLog(spill_path) if spill_path else None
+        self.stats = {'accepted': 0, 'rejected': 0, 'duplicates': 0,
+                      'processed': 0, 'failed': 0}
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the workers and queue the notifications recovered from the
+        spill log
+        """
+        for number in range(self.workers):
+            thread = threading.Thread(
+                target=self._work, name='ipn-worker-{}'.format(number),
+                daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        if self.spill_log is not None:
+            for entry_id, body, headers in self.spill_log.recover():
+                self._queue.put((entry_id, body, headers))
+        return self
+
+    def stop(self, timeout=None):
+        """Process the queued notifications and stop the workers"""
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        if self.spill_log is not None:
+            self.spill_log.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def submit(self, body, headers):
+        """Queue a notification and return the HTTP status to answer SNS
+        with: 200 if it was accepted or is a duplicate, 503 if the queue is
+        full.
+        """
+        if self.deduplicator is not None and \
+                self.deduplicator.is_duplicate(body, headers):
+            self._count('duplicates')
+            return 200
+        if self._queue.full():
+            self._count('rejected')
+            return 503
+        entry_id = None
+        if self.spill_log is not None:
+            entry_id = self.spill_log.append(body, headers)
+        try:
+            self._queue.put_nowait((entry_id, body, headers))
+        except queue.Full:
+            if entry_id is not None:
+                self.spill_log.done(entry_id)
+            self._count('rejected')
+            return 503
+        self._count('accepted')
+        return 200
+
+    def pending(self):
+        """Number of queued notifications"""
+        return self._queue.qsize()
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            entry_id, body, headers = item
+            try:
+                finished = self._process(body, headers)
+            except Exception:
+                # Keep the worker alive whatever a notification raises
+                self._count('failed')
+                self.logger.exception('IPN processing failed')
+                finished = False
+            if finished and entry_id is not None:
+                self.spill_log.done(entry_id)
+
+    def _process(self, body, headers):
+        """Verify and dispatch one notification. Return False if it should
+        stay pending in the spill log and be processed again.
+        """
+        ipn_handler = IpnHandler(
+            body, headers, order_index=self.order_index,
+            deduplicator=self.deduplicator,
+            certificate_store=self.certificate_store)
+        try:
+            if ipn_handler.is_duplicate():
+                self._count('duplicates')
+                return True
+            ipn_handler.authenticate()
+        except (ValueError, KeyError, TypeError) as ex:
+            self._count('failed')
+            self.logger.warning('Rejected IPN: %s', ex)
+            return ipn_handler.error != 'Error retrieving certificate.'
+        try:
+            if self.dispatcher is not None:
+                self.dispatcher.dispatch(ipn_handler)
+            if self.callback is not None:
+                self.callback(ipn_handler)
+        except Exception:
+            self._count('failed')
+            self.logger.exception('IPN callback failed')
+            return False
+        ipn_handler.mark_processed()
+        self._count('processed')
+        return True
@@ -0,0 +1,348 @@
+"""Replay stored IPNs, e.g. after an outage.
+
+    python -m amazon_pay.ipn_replay messages.ndjson \\
+        --cert https://sns.us-east-1.amazonaws.com/SimpleNotificationService-x.pem cert.pem
+"""
+import sys
+import json
+import time
+import zlib
+import logging
+import argparse
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from amazon_pay.ipn_handler import IpnHandler
+from amazon_pay.certificate_store import CertificateStore
+from amazon_pay.response_cache import object_root
+
+
+def read_messages(lines):
+    """Yield (line_number, body, headers) for each stored message. A line is
+    either an object with body and headers, as written by SpillLog, or the
+    SNS message itself, in which case the headers are rebuilt from it.
+    Lines that are not JSON are yielded with body None.
+    """
+    for line_number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            yield line_number, None, None
+            continue
+        if isinstance(entry, dict) and 'body' in entry:
+            yield line_number, entry['body'], entry.get('headers') or {}
+        else:
+            yield line_number, line, _headers(entry)
+
+
+def _headers(payload):
+    if not isinstance(payload, dict):
+        return {}
+    return {'X-Amz-Sns-Message-Type': payload.get('Type', ''),
+            'X-Amz-Sns-Message-Id': payload.get('MessageId', ''),
+            'X-Amz-Sns-Topic-Arn': payload.get('TopicArn', '')}
+
+
+def _missing_certificate(url):
+    raise ValueError('Certificate not cached ({}).'.format(url))
+
+
+def offline_certificate_store(certificates):
+    """Return a CertificateStore holding the given certificates that never
+    downloads one
+
+    Parameters
+    ----------
+    certificates : dictionary, required
+        PEM text of each SigningCertURL.
+    """
+    store = CertificateStore(max_entries=max(32, len(certificates)),
+                             ttl=float('inf'), fetch=_missing_certificate)
+    for url, pem in certificates.items():
+        store.put(url, pem)
+    return store
+
+
+# Elements holding the ID a notification is about, in order of preference.
+# The order reference comes first: an order created from a billing agreement
+# also lists the agreement's ID in its ParentDetails.
+ORDER_KEY_ELEMENTS = ('AmazonOrderReferenceId', 'AmazonAuthorizationId',
+                      'AmazonCaptureId', 'AmazonRefundId',
+                      'AmazonCaptureReferenceId', 'AmazonBillingAgreementId')
+
+
+def order_key(ipn_handler):
+    """Order reference (or billing agreement) a notification belongs to,
+    e.g. P01-1234567-1234567 for a capture of that order
+    """
+    response = ipn_handler._notification_response()
+    for name in ORDER_KEY_ELEMENTS:
+        element = response._root.find('.//{}{}'.format(response._ns, name))
+        if element is not None and (element.text or '').strip():
+            return object_root(element.text.strip())
+    ids = ipn_handler.object_ids()
+    if ids:
+        return object_root(ids[0])
+    return ipn_handler._message_id
+
+
+class ReplayReport:
+
+    """Outcome of IpnReplayer.replay
+
+    Properties
+    ----------
+    read : integer
+        Messages read.
+
+    verified : integer
+        Messages whose signature was verified.
+
+    duplicates : integer
+        Messages skipped because the deduplicator had seen them.
+
+    failed : integer
+        Messages that could not be read or verified.
+
+    applied : integer
+        Verified messages passed to the callbacks.
+
+    apply_failed : integer
+        Messages whose callback raised.
+
+    skipped : integer
+        Messages not applied because an earlier message of the same order
+        failed.
+
+    errors : list
+        (line_number, error) of the first max_errors failures.
+
+    elapsed : float
+        Seconds the replay took.
+    """
+
+    def __init__(self, max_errors=100):
+        self.read = 0
+        self.verified = 0
+        self.duplicates = 0
+        self.failed = 0
+        self.applied = 0
+        self.apply_failed = 0
+        self.skipped = 0
+        self.errors = []
+        self.elapsed = 0.0
+        self.max_errors = max_errors
+        self._lock = threading.Lock()
+
+    @property
+    def throughput(self):
+        """Messages read per second"""
+        return self.read / self.elapsed if self.elapsed else 0.0
+
+    def to_dict(self):
+        return {'read': self.read,
+                'verified': self.verified,
+                'duplicates': self.duplicates,
+                'failed': self.failed,
+                'applied': self.applied,
+                'apply_failed': self.apply_failed,
+                'skipped': self.skipped,
+                'elapsed': round(self.elapsed, 3),
+                'throughput': round(self.throughput, 1),
+                'errors': [{'line': line, 'error': error}
+                           for line, error in self.errors]}
+
+    def _count(self, name, line_number=None, error=None):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+            if error is not None and len(self.errors) < self.max_errors:
+                self.errors.append((line_number, error))
+
+
+class IpnReplayer:
+
+    """Replays stored IPNs through IpnHandler and the application's
+    callbacks. Messages are read as a stream and verified in parallel; the
+    verified notifications of each order are then applied in Timestamp
+    order. Orders are sharded over the workers by key, so notifications of
+    one order are applied by one worker, one at a time, while different
+    orders proceed in parallel. When a callback raises, the later
+    notifications of that order are skipped. Only the stored message of a
+    verified notification is kept; its IpnHandler is created again when it
+    is applied.
+
+    With a certificate store from offline_certificate_store the replay
+    needs no network access.
+    """
+
+    logger = logging.getLogger('__amazon_pay_sdk__')
+    logger.addHandler(logging.NullHandler())
+
+    def __init__(self, callback=None, dispatcher=None, certificate_store=None,
+                 deduplicator=None, order_index=None, workers=4):
+        """
+        Parameters
+        ----------
+        callback : callable, optional
+            Called with each verified IpnHandler. Default: None
+
+        dispatcher : IpnDispatcher, optional
+            Receives each verified notification. Default: None
+
+        certificate_store : CertificateStore, optional
+            Source of signing certificates. Default: a new CertificateStore
+
+        deduplicator : IpnDeduplicator, optional
+            Skips notifications that were already processed. Default: None
+
+        order_index : OrderIndex, optional
+            Passed to IpnHandler. Default: None
+
+        workers : integer, optional
+            Threads verifying and applying notifications. Default: 4
+        """
+        self.callback = callback
+        self.dispatcher = dispatcher
+        self.certificate_store = certificate_store if certificate_store \
+            is not None else CertificateStore()
+        self.deduplicator = deduplicator
+        self.order_index = order_index
+        self.workers = workers
+
+    def replay_file(self, path):
+        """Replay a file with one stored message per line"""
+        with open(path, encoding='utf-8') as lines:
+            return self.replay(lines)
+
+    def replay(self, lines):
+        """Replay an iterable of stored messages, see read_messages, and
+        return a ReplayReport
+        """
+        report = ReplayReport()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(self.workers) as executor:
+            shards = self._verify(executor, lines, report)
+            for future in [executor.submit(self._apply, shard, report)
+                           for shard in shards if shard]:
+                future.result()
+        report.elapsed = time.perf_counter() - started
+        return report
+
+    def _verify(self, executor, lines, report):
+        """Verify messages with at most a few per worker in flight and
+        group them by order into one shard per worker. Only the stored
+        message is kept for each event, not its parsed IpnHandler, so the
+        memory held until the replay ends stays close to the input size.
+        """
+        shards = [{} for _ in range(self.workers)]
+        in_flight = deque()
+
+        def collect(future):
+            result = future.result()
+            if result is not None:
+                key, event = result
+                shard = shards[zlib.crc32(key.encode('utf-8')) % self.workers]
+                shard.setdefault(key, []).append(event)
+
+        for line_number, body, headers in read_messages(lines):
+            report._count('read')
+            if body is None:
+                report._count('failed', line_number, 'Invalid JSON.')
+                continue
+            in_flight.append(executor.submit(
+                self._verify_one, line_number, body, headers, report))
+            if len(in_flight) >= self.workers * 4:
+                collect(in_flight.popleft())
+        while in_flight:
+            collect(in_flight.popleft())
+        return shards
+
+    def _handler(self, body, headers):
+        return IpnHandler(
+            body, headers, order_index=self.order_index,
+            deduplicator=self.deduplicator,
+            certificate_store=self.certificate_store)
+
+    def _verify_one(self, line_number, body, headers, report):
+        try:
+            ipn_handler = self._handler(body, headers)
+            if ipn_handler.is_duplicate():
+                report._count('duplicates')
+                return None
+            ipn_handler.authenticate()
+            timestamp = ipn_handler._message.get('Timestamp') or \
+                ipn_handler._timestamp
+            key = order_key(ipn_handler)
+        except (ValueError, KeyError, TypeError) as ex:
+            report._count('failed', line_number, str(ex))
+            return None
+        report._count('verified')
+        return key, (timestamp, line_number, body, headers)
+
+    def _apply(self, shard, report):
+        for events in shard.values():
+            events.sort(key=lambda event: event[:2])
+            for position, (timestamp, line_number, body, headers) in \
+                    enumerate(events):
+                ipn_handler = self._handler(body, headers)
+                # The signature was verified by _verify_one
+                ipn_handler._verified = True
+                # The same notification may be stored more than once
+                if ipn_handler.is_duplicate():
+                    report._count('duplicates')
+                    continue
+                try:
+                    if self.dispatcher is not None:
+                        self.dispatcher.dispatch(ipn_handler)
+                    if self.callback is not None:
+                        self.callback(ipn_handler)
+                except Exception as ex:
+                    self.logger.exception('IPN callback failed')
+                    report._count('apply_failed', line_number, repr(ex))
+                    for _ in events[position + 1:]:
+                        report._count('skipped')
+                    break
+                ipn_handler.mark_processed()
+                report._count('applied')
+            events.clear()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        'path', help='file with one stored SNS message per line')
+    parser.add_argument(
+        '--cert', nargs=2, action='append', default=[],
+        metavar=('URL', 'PEM_FILE'),
+        help='signing certificate to use for SigningCertURL URL')
+    parser.add_argument(
+        '--download', action='store_true',
+        help='download certificates not given with --cert')
+    parser.add_argument(
+        '--workers', type=int, default=4,
+        help='number of worker threads (default: 4)')
+    args = parser.parse_args(argv)
+
+    certificates = {}
+    for url, path in args.cert:
+        with open(path) as pem:
+            certificates[url] = pem.read()
+    if args.download:
+        store = CertificateStore()
+        for url, pem in certificates.items():
+            store.put(url, pem)
+    else:
+        store = offline_certificate_store(certificates)
+
+    report = IpnReplayer(certificate_store=store,
+                         workers=args.workers).replay_file(args.path)
+    json.dump(report.to_dict(), sys.stdout, indent=2)
+    sys.stdout.write('\n')
+    return report
+
+
+if __name__ == '__main__':
+    main()
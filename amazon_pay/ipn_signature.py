@@ -0,0 +1,97 @@
+import threading
+from collections import OrderedDict
+
+try:
+    from cryptography.x509 import load_pem_x509_certificate
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.asymmetric import padding
+except ImportError:
+    load_pem_x509_certificate = None
+    from OpenSSL import crypto
+
+
+# Digest used for each SNS SignatureVersion.
+DIGESTS = {'1': 'sha1', '2': 'sha256'}
+
+
+class SignatureVerifier:
+
+    """Verifies SNS message signatures with the public key of the signing
+    certificate. Parsed keys are cached per certificate, so a certificate
+    is loaded once rather than for every message.
+
+    The cryptography package is used when it is installed, as it is with
+    any current pyOpenSSL; OpenSSL.crypto is the fallback.
+    """
+
+    def __init__(self, max_entries=32):
+        """
+        Parameters
+        ----------
+        max_entries : integer, optional
+            Number of certificates to keep. Default: 32
+        """
+        self.max_entries = max_entries
+        self.backend = 'cryptography' if load_pem_x509_certificate \
+            else 'pyopenssl'
+        self._keys = OrderedDict()
+        self._lock = threading.Lock()
+
+    def verify(self, pem, signature, data, version='1'):
+        """Return True if signature is a valid signature of data by the
+        certificate pem, raise ValueError otherwise
+
+        Parameters
+        ----------
+        pem : string, required
+            Signing certificate in PEM format.
+
+        signature : bytes, required
+            Decoded signature.
+
+        data : bytes, required
+            The signed string.
+
+        version : string, optional
+            SignatureVersion of the message, '1' for SHA1 or '2' for SHA256.
+            Default: '1'
+        """
+        digest = DIGESTS.get(str(version))
+        if digest is None:
+            raise ValueError('Invalid signature version.')
+        key = self._key(pem)
+        try:
+            if load_pem_x509_certificate is not None:
+                key.verify(signature, data, padding.PKCS1v15(),
+                           hashes.SHA1() if digest == 'sha1'
+                           else hashes.SHA256())
+            else:
+                crypto.verify(key, signature, data, digest)
+        except Exception:
+            raise ValueError('Invalid signature.')
+        return True
+
+    def _key(self, pem):
+        with self._lock:
+            key = self._keys.get(pem)
+            if key is not None:
+                self._keys.move_to_end(pem)
+                return key
+        try:
+            if load_pem_x509_certificate is not None:
+                key = load_pem_x509_certificate(
+                    pem.encode('utf-8') if isinstance(pem, str) else pem
+                ).public_key()
+            else:
+                key = crypto.load_certificate(crypto.FILETYPE_PEM, pem)
+        except Exception:
+            raise ValueError('Invalid certificate.')
+        with self._lock:
+            self._keys[pem] = key
+            while len(self._keys) > self.max_entries:
+                self._keys.popitem(last=False)
+        return key
+
+
+# Verifier shared by IpnHandler instances.
+default_verifier = SignatureVerifier()
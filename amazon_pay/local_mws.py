@@ -0,0 +1,938 @@
+import re
+import hmac
+import time
+import gzip
+import uuid
+import zlib
+import base64
+import random
+import hashlib
+import datetime
+import threading
+import xml.etree.ElementTree as et
+from urllib import parse
+from collections import Counter
+from socketserver import ThreadingMixIn
+from http.server import HTTPServer, BaseHTTPRequestHandler
+import amazon_pay.version as ap_version
+
+
+NAMESPACE = 'http://mws.amazonservices.com/schema/OffAmazonPayments/{}'.format(
+    ap_version.versions['api_version'])
+
+
+class MwsError(Exception):
+
+    """Raised by LocalMwsState to produce an MWS ErrorResponse"""
+
+    def __init__(self, code, message, status=400):
+        super(MwsError, self).__init__(message)
+        self.code = code
+        self.message = message
+        self.status = status
+
+
+class LocalMwsState:
+
+    """In-memory model of the Off-Amazon Payments objects (order references,
+    billing agreements, authorizations, captures and refunds) and their state
+    transitions. One instance backs a LocalMwsServer; tests can use it to
+    seed or inspect objects.
+
+    Order references are normally created by the Amazon Pay widgets, so with
+    auto_create enabled any well formed order reference or billing agreement
+    ID that has not been seen before is created in the Draft state.
+    """
+
+    ORDER_ID = re.compile(r'^[PS]\d{2}-\d{7}-\d{7}$')
+    BILLING_AGREEMENT_ID = re.compile(r'^[BC]\d{2}-\d{7}-\d{7}$')
+
+    def __init__(self, auto_create=True, seed=None):
+        self.auto_create = auto_create
+        self.orders = {}
+        self.billing_agreements = {}
+        self.authorizations = {}
+        self.captures = {}
+        self.refunds = {}
+        self._reference_ids = {}
+        self._next_tokens = {}
+        self._rng = random.Random(seed)
+        self._sequence = 0
+        self._lock = threading.RLock()
+
+    def create_order(self, amazon_order_reference_id=None, amount=None,
+                     currency_code='USD', seller_order_id=None, state='Draft'):
+        """Add an order reference and return its ID"""
+        with self._lock:
+            order_id = amazon_order_reference_id or self._new_id('S01')
+            now = _timestamp()
+            self.orders[order_id] = {
+                'id': order_id,
+                'state': state,
+                'reason_code': None,
+                'amount': amount,
+                'currency_code': currency_code,
+                'seller_note': None,
+                'platform_id': None,
+                'seller_order_id': seller_order_id,
+                'store_name': None,
+                'custom_information': None,
+                'authorizations': [],
+                'created': now,
+                'updated': now}
+            return order_id
+
+    def create_billing_agreement(self, amazon_billing_agreement_id=None,
+                                 state='Draft'):
+        """Add a billing agreement and return its ID"""
+        with self._lock:
+            agreement_id = amazon_billing_agreement_id or self._new_id('C01')
+            now = _timestamp()
+            self.billing_agreements[agreement_id] = {
+                'id': agreement_id,
+                'state': state,
+                'reason_code': None,
+                'seller_note': None,
+                'platform_id': None,
+                'seller_billing_agreement_id': None,
+                'store_name': None,
+                'custom_information': None,
+                'created': now,
+                'updated': now}
+            return agreement_id
+
+    def handle(self, action, params):
+        """Run action and return the children of its Result element as a
+        list of (tag, value) pairs.
+        """
+        handler = getattr(self, '_action_{}'.format(action), None)
+        if handler is None:
+            raise MwsError(
+                'InvalidAction', 'Unknown Action {}.'.format(action))
+        with self._lock:
+            return handler(params)
+
+    def _new_id(self, prefix):
+        self._sequence += 1
+        return '{}-{:07d}-{:07d}'.format(
+            prefix, self._sequence, self._rng.randint(0, 9999999))
+
+    def _child_id(self, parent_id, kind):
+        self._sequence += 1
+        return '{}-{}{:06d}'.format(parent_id, kind, self._sequence % 1000000)
+
+    def _require(self, params, name):
+        value = params.get(name)
+        if value in (None, ''):
+            raise MwsError(
+                'MissingParameter',
+                'The request must contain the parameter {}.'.format(name))
+        return value
+
+    def _amount(self, params, name):
+        value = self._require(params, name)
+        try:
+            amount = float(value)
+        except ValueError:
+            raise MwsError(
+                'InvalidParameterValue', 'Invalid amount for {}.'.format(name))
+        if amount < 0:
+            raise MwsError(
+                'InvalidParameterValue', 'Invalid amount for {}.'.format(name))
+        return amount
+
+    def _order(self, order_id):
+        order = self.orders.get(order_id)
+        if order is None:
+            if self.auto_create and self.ORDER_ID.match(order_id or ''):
+                self.create_order(order_id)
+                return self.orders[order_id]
+            raise MwsError(
+                'InvalidOrderReferenceId',
+                'The OrderReferenceId {} is invalid.'.format(order_id))
+        return order
+
+    def _billing_agreement(self, agreement_id):
+        agreement = self.billing_agreements.get(agreement_id)
+        if agreement is None:
+            if (self.auto_create and
+                    self.BILLING_AGREEMENT_ID.match(agreement_id or '')):
+                self.create_billing_agreement(agreement_id)
+                return self.billing_agreements[agreement_id]
+            raise MwsError(
+                'InvalidBillingAgreementId',
+                'The BillingAgreementId {} is invalid.'.format(agreement_id))
+        return agreement
+
+    def _lookup(self, store, object_id, code):
+        obj = store.get(object_id)
+        if obj is None:
+            raise MwsError(code, 'The Id {} is invalid.'.format(object_id))
+        return obj
+
+    def _reserve_reference(self, kind, reference_id):
+        key = (kind, reference_id)
+        if key in self._reference_ids:
+            raise MwsError(
+                'DuplicateReferenceId',
+                'The {}ReferenceId {} has already been used.'.format(
+                    kind, reference_id))
+        self._reference_ids[key] = True
+
+    def _set_state(self, obj, state, reason_code=None):
+        obj['state'] = state
+        obj['reason_code'] = reason_code
+        obj['updated'] = _timestamp()
+
+    def _set_order_attributes(self, order, params, prefix):
+        mapping = (
+            ('amount', prefix + 'OrderTotal.Amount'),
+            ('currency_code', prefix + 'OrderTotal.CurrencyCode'),
+            ('seller_note', prefix + 'SellerNote'),
+            ('platform_id', prefix + 'PlatformId'),
+            ('seller_order_id',
+             prefix + 'SellerOrderAttributes.SellerOrderId'),
+            ('store_name', prefix + 'SellerOrderAttributes.StoreName'),
+            ('custom_information',
+             prefix + 'SellerOrderAttributes.CustomInformation'))
+        for key, name in mapping:
+            if params.get(name) is not None:
+                order[key] = params[name]
+        order['updated'] = _timestamp()
+
+    def _status(self, obj):
+        status = [('State', obj['state']),
+                  ('LastUpdateTimestamp', obj['updated'])]
+        if obj['reason_code']:
+            status.append(('ReasonCode', obj['reason_code']))
+        return status
+
+    def _money(self, amount, currency_code):
+        return [('CurrencyCode', currency_code),
+                ('Amount', '{:.2f}'.format(float(amount or 0)))]
+
+    def _order_details(self, order):
+        return [
+            ('AmazonOrderReferenceId', order['id']),
+            ('ExpirationTimestamp', order['created']),
+            ('OrderTotal', self._money(order['amount'],
+                                       order['currency_code'])),
+            ('SellerNote', order['seller_note']),
+            ('PlatformId', order['platform_id']),
+            ('Buyer', [('Name', 'Local Buyer'),
+                       ('Email', 'buyer@example.com')]),
+            ('Destination', [
+                ('DestinationType', 'Physical'),
+                ('PhysicalDestination', [
+                    ('Name', 'Local Buyer'),
+                    ('AddressLine1', '410 Terry Ave N'),
+                    ('City', 'Seattle'),
+                    ('StateOrRegion', 'WA'),
+                    ('PostalCode', '98109'),
+                    ('CountryCode', 'US')])]),
+            ('ReleaseEnvironment', 'Sandbox'),
+            ('SellerOrderAttributes', [
+                ('SellerOrderId', order['seller_order_id']),
+                ('StoreName', order['store_name']),
+                ('CustomInformation', order['custom_information'])]),
+            ('IdList', [('member', i) for i in order['authorizations']]),
+            ('OrderReferenceStatus', self._status(order)),
+            ('CreationTimestamp', order['created'])]
+
+    def _order_summary(self, order):
+        return [
+            ('ReleaseEnvironment', 'Sandbox'),
+            ('OrderReferenceStatus', self._status(order)),
+            ('AmazonOrderReferenceId', order['id']),
+            ('CreationTimestamp', order['created']),
+            ('SellerOrderAttributes', [
+                ('SellerOrderId', order['seller_order_id']),
+                ('StoreName', order['store_name']),
+                ('CustomInformation', order['custom_information'])]),
+            ('OrderTotal', self._money(order['amount'],
+                                       order['currency_code']))]
+
+    def _billing_agreement_details(self, agreement):
+        return [
+            ('AmazonBillingAgreementId', agreement['id']),
+            ('SellerNote', agreement['seller_note']),
+            ('PlatformId', agreement['platform_id']),
+            ('SellerBillingAgreementAttributes', [
+                ('SellerBillingAgreementId',
+                 agreement['seller_billing_agreement_id']),
+                ('StoreName', agreement['store_name']),
+                ('CustomInformation', agreement['custom_information'])]),
+            ('Buyer', [('Name', 'Local Buyer'),
+                       ('Email', 'buyer@example.com')]),
+            ('ReleaseEnvironment', 'Sandbox'),
+            ('BillingAgreementStatus', self._status(agreement)),
+            ('CreationTimestamp', agreement['created'])]
+
+    def _authorization_details(self, authorization):
+        return [
+            ('AmazonAuthorizationId', authorization['id']),
+            ('AuthorizationReferenceId', authorization['reference_id']),
+            ('SellerAuthorizationNote', authorization['note']),
+            ('AuthorizationAmount', self._money(
+                authorization['amount'], authorization['currency_code'])),
+            ('CapturedAmount', self._money(
+                authorization['captured'], authorization['currency_code'])),
+            ('AuthorizationFee', self._money(
+                0, authorization['currency_code'])),
+            ('IdList', [('member', i) for i in authorization['captures']]),
+            ('CreationTimestamp', authorization['created']),
+            ('ExpirationTimestamp', authorization['created']),
+            ('AuthorizationStatus', self._status(authorization)),
+            ('SoftDecline', 'false'),
+            ('CaptureNow', authorization['capture_now']),
+            ('SoftDescriptor', authorization['soft_descriptor'])]
+
+    def _capture_details(self, capture):
+        return [
+            ('AmazonCaptureId', capture['id']),
+            ('CaptureReferenceId', capture['reference_id']),
+            ('SellerCaptureNote', capture['note']),
+            ('CaptureAmount', self._money(
+                capture['amount'], capture['currency_code'])),
+            ('RefundedAmount', self._money(
+                capture['refunded'], capture['currency_code'])),
+            ('CaptureFee', self._money(0, capture['currency_code'])),
+            ('IdList', [('member', i) for i in capture['refunds']]),
+            ('CreationTimestamp', capture['created']),
+            ('CaptureStatus', self._status(capture)),
+            ('SoftDescriptor', capture['soft_descriptor'])]
+
+    def _refund_details(self, refund):
+        return [
+            ('AmazonRefundId', refund['id']),
+            ('RefundReferenceId', refund['reference_id']),
+            ('SellerRefundNote', refund['note']),
+            ('RefundType', 'SellerInitiated'),
+            ('RefundAmount', self._money(
+                refund['amount'], refund['currency_code'])),
+            ('FeeRefunded', self._money(0, refund['currency_code'])),
+            ('CreationTimestamp', refund['created']),
+            ('RefundStatus', self._status(refund)),
+            ('SoftDescriptor', refund['soft_descriptor'])]
+
+    def _authorize(self, order, params, capture_now):
+        if order['state'] != 'Open':
+            raise MwsError(
+                'InvalidOrderReferenceStatus',
+                'The OrderReference {} is in the {} state.'.format(
+                    order['id'], order['state']))
+        reference_id = self._require(params, 'AuthorizationReferenceId')
+        amount = self._amount(params, 'AuthorizationAmount.Amount')
+        self._reserve_reference('Authorization', reference_id)
+        authorization = {
+            'id': self._child_id(order['id'], 'A'),
+            'order_id': order['id'],
+            'reference_id': reference_id,
+            'note': params.get('SellerAuthorizationNote'),
+            'amount': amount,
+            'captured': 0.0,
+            'currency_code': params.get(
+                'AuthorizationAmount.CurrencyCode', order['currency_code']),
+            'captures': [],
+            'capture_now': 'true' if capture_now else 'false',
+            'soft_descriptor': params.get('SoftDescriptor'),
+            'created': _timestamp()}
+        self._set_state(authorization, 'Open')
+        self.authorizations[authorization['id']] = authorization
+        order['authorizations'].append(authorization['id'])
+        if capture_now:
+            self._capture(authorization, reference_id, amount,
+                          params.get('SellerAuthorizationNote'),
+                          params.get('SoftDescriptor'))
+            self._set_state(authorization, 'Closed', 'MaxCapturesProcessed')
+        return authorization
+
+    def _capture(self, authorization, reference_id, amount, note,
+                 soft_descriptor):
+        if authorization['captured'] + amount > authorization['amount'] + 1e-9:
+            raise MwsError(
+                'InvalidCaptureAmount',
+                'The capture amount exceeds the authorized amount.')
+        capture = {
+            'id': self._child_id(authorization['order_id'], 'C'),
+            'order_id': authorization['order_id'],
+            'reference_id': reference_id,
+            'note': note,
+            'amount': amount,
+            'refunded': 0.0,
+            'currency_code': authorization['currency_code'],
+            'refunds': [],
+            'soft_descriptor': soft_descriptor,
+            'created': _timestamp()}
+        self._set_state(capture, 'Completed')
+        self.captures[capture['id']] = capture
+        authorization['captured'] += amount
+        authorization['captures'].append(capture['id'])
+        return capture
+
+    def _action_GetServiceStatus(self, params):
+        return [('Status', 'GREEN'), ('Timestamp', _timestamp())]
+
+    def _action_GetMerchantAccountStatus(self, params):
+        return [('AccountStatus', 'ACTIVE')]
+
+    def _action_CreateOrderReferenceForId(self, params):
+        source_id = self._require(params, 'Id')
+        self._require(params, 'IdType')
+        self._billing_agreement(source_id)
+        order = self.orders[self.create_order()]
+        self._set_order_attributes(order, params, 'OrderReferenceAttributes.')
+        if params.get('ConfirmNow') == 'true':
+            self._set_state(order, 'Open')
+        return [('OrderReferenceDetails', self._order_details(order))]
+
+    def _action_GetOrderReferenceDetails(self, params):
+        order = self._order(self._require(params, 'AmazonOrderReferenceId'))
+        return [('OrderReferenceDetails', self._order_details(order))]
+
+    def _action_SetOrderReferenceDetails(self, params):
+        order = self._order(self._require(params, 'AmazonOrderReferenceId'))
+        if order['state'] != 'Draft':
+            raise MwsError(
+                'InvalidOrderReferenceStatus',
+                'The OrderReference {} is not in the Draft state.'.format(
+                    order['id']))
+        self._amount(params, 'OrderReferenceAttributes.OrderTotal.Amount')
+        self._set_order_attributes(order, params, 'OrderReferenceAttributes.')
+        return [('OrderReferenceDetails', self._order_details(order))]
+
+    def _action_SetOrderAttributes(self, params):
+        order = self._order(self._require(params, 'AmazonOrderReferenceId'))
+        if order['state'] not in ('Draft', 'Open'):
+            raise MwsError(
+                'InvalidOrderReferenceStatus',
+                'The OrderReference {} is in the {} state.'.format(
+                    order['id'], order['state']))
+        self._set_order_attributes(order, params, 'OrderAttributes.')
+        return [('OrderReferenceDetails', self._order_details(order))]
+
+    def _action_ConfirmOrderReference(self, params):
+        order = self._order(self._require(params, 'AmazonOrderReferenceId'))
+        if order['state'] != 'Draft' or order['amount'] is None:
+            raise MwsError(
+                'InvalidOrderReferenceStatus',
+                'The OrderReference {} cannot be confirmed.'.format(
+                    order['id']))
+        self._set_state(order, 'Open')
+        return []
+
+    def _action_CancelOrderReference(self, params):
+        order = self._order(self._require(params, 'AmazonOrderReferenceId'))
+        if order['state'] not in ('Draft', 'Open', 'Suspended'):
+            raise MwsError(
+                'InvalidOrderReferenceStatus',
+                'The OrderReference {} cannot be canceled.'.format(
+                    order['id']))
+        self._set_state(order, 'Canceled', 'SellerCanceled')
+        return []
+
+    def _action_CloseOrderReference(self, params):
+        order = self._order(self._require(params, 'AmazonOrderReferenceId'))
+        if order['state'] not in ('Open', 'Suspended'):
+            raise MwsError(
+                'InvalidOrderReferenceStatus',
+                'The OrderReference {} cannot be closed.'.format(order['id']))
+        self._set_state(order, 'Closed', 'SellerClosed')
+        return []
+
+    def _action_ListOrderReference(self, params):
+        query_id = self._require(params, 'QueryId')
+        start = params.get('CreatedTimeRange.StartTime')
+        end = params.get('CreatedTimeRange.EndTime')
+        statuses = [v for k, v in params.items()
+                    if k.startswith('OrderReferenceStatusListFilter.')]
+        matches = [
+            order_id for order_id, order in self.orders.items()
+            if order['seller_order_id'] == query_id and
+            (not start or order['created'] >= start) and
+            (not end or order['created'] < end) and
+            (not statuses or order['state'] in statuses)]
+        matches.sort(key=lambda i: self.orders[i]['created'],
+                     reverse=params.get('SortOrder') == 'Descending')
+        return self._list_page(matches, params.get('PageSize'))
+
+    def _action_ListOrderReferenceByNextToken(self, params):
+        token = self._require(params, 'NextPageToken')
+        try:
+            matches, page_size = self._next_tokens.pop(token)
+        except KeyError:
+            raise MwsError('InvalidParameterValue', 'Invalid NextPageToken.')
+        return self._list_page(matches, page_size)
+
+    def _list_page(self, matches, page_size):
+        page_size = int(page_size) if page_size else 100
+        page, rest = matches[:page_size], matches[page_size:]
+        result = [('OrderReferenceList', [
+            ('OrderReference', self._order_summary(self.orders[i]))
+            for i in page])]
+        if rest:
+            token = base64.b64encode(uuid.uuid4().bytes).decode()
+            self._next_tokens[token] = (rest, page_size)
+            result.append(('NextPageToken', token))
+        return result
+
+    def _action_Authorize(self, params):
+        order = self._order(self._require(params, 'AmazonOrderReferenceId'))
+        authorization = self._authorize(
+            order, params, params.get('CaptureNow') == 'true')
+        return [('AuthorizationDetails',
+                 self._authorization_details(authorization))]
+
+    def _action_GetAuthorizationDetails(self, params):
+        authorization = self._lookup(
+            self.authorizations,
+            self._require(params, 'AmazonAuthorizationId'),
+            'InvalidAuthorizationId')
+        return [('AuthorizationDetails',
+                 self._authorization_details(authorization))]
+
+    def _action_CloseAuthorization(self, params):
+        authorization = self._lookup(
+            self.authorizations,
+            self._require(params, 'AmazonAuthorizationId'),
+            'InvalidAuthorizationId')
+        if authorization['state'] != 'Open':
+            raise MwsError(
+                'InvalidAuthorizationStatus',
+                'The Authorization {} is not Open.'.format(
+                    authorization['id']))
+        self._set_state(authorization, 'Closed', 'SellerClosed')
+        return []
+
+    def _action_Capture(self, params):
+        authorization = self._lookup(
+            self.authorizations,
+            self._require(params, 'AmazonAuthorizationId'),
+            'InvalidAuthorizationId')
+        if authorization['state'] != 'Open':
+            raise MwsError(
+                'InvalidAuthorizationStatus',
+                'The Authorization {} is not Open.'.format(
+                    authorization['id']))
+        reference_id = self._require(params, 'CaptureReferenceId')
+        amount = self._amount(params, 'CaptureAmount.Amount')
+        self._reserve_reference('Capture', reference_id)
+        capture = self._capture(
+            authorization, reference_id, amount,
+            params.get('SellerCaptureNote'), params.get('SoftDescriptor'))
+        return [('CaptureDetails', self._capture_details(capture))]
+
+    def _action_GetCaptureDetails(self, params):
+        capture = self._lookup(
+            self.captures, self._require(params, 'AmazonCaptureId'),
+            'InvalidCaptureId')
+        return [('CaptureDetails', self._capture_details(capture))]
+
+    def _action_Refund(self, params):
+        capture = self._lookup(
+            self.captures, self._require(params, 'AmazonCaptureId'),
+            'InvalidCaptureId')
+        reference_id = self._require(params, 'RefundReferenceId')
+        amount = self._amount(params, 'RefundAmount.Amount')
+        if capture['refunded'] + amount > capture['amount'] + 1e-9:
+            raise MwsError(
+                'InvalidRefundAmount',
+                'The refund amount exceeds the captured amount.')
+        self._reserve_reference('Refund', reference_id)
+        refund = {
+            'id': self._child_id(capture['order_id'], 'R'),
+            'reference_id': reference_id,
+            'note': params.get('SellerRefundNote'),
+            'amount': amount,
+            'currency_code': capture['currency_code'],
+            'soft_descriptor': params.get('SoftDescriptor'),
+            'created': _timestamp()}
+        self._set_state(refund, 'Completed')
+        self.refunds[refund['id']] = refund
+        capture['refunded'] += amount
+        capture['refunds'].append(refund['id'])
+        return [('RefundDetails', self._refund_details(refund))]
+
+    def _action_GetRefundDetails(self, params):
+        refund = self._lookup(
+            self.refunds, self._require(params, 'AmazonRefundId'),
+            'InvalidRefundId')
+        return [('RefundDetails', self._refund_details(refund))]
+
+    def _action_GetBillingAgreementDetails(self, params):
+        agreement = self._billing_agreement(
+            self._require(params, 'AmazonBillingAgreementId'))
+        return [('BillingAgreementDetails',
+                 self._billing_agreement_details(agreement))]
+
+    def _action_SetBillingAgreementDetails(self, params):
+        agreement = self._billing_agreement(
+            self._require(params, 'AmazonBillingAgreementId'))
+        if agreement['state'] != 'Draft':
+            raise MwsError(
+                'InvalidBillingAgreementStatus',
+                'The BillingAgreement {} is not in the Draft state.'.format(
+                    agreement['id']))
+        prefix = 'BillingAgreementAttributes.'
+        mapping = (
+            ('seller_note', prefix + 'SellerNote'),
+            ('platform_id', prefix + 'PlatformId'),
+            ('seller_billing_agreement_id',
+             prefix + 'SellerBillingAgreementAttributes.'
+             'SellerBillingAgreementId'),
+            ('store_name',
+             prefix + 'SellerBillingAgreementAttributes.StoreName'),
+            ('custom_information',
+             prefix + 'SellerBillingAgreementAttributes.CustomInformation'))
+        for key, name in mapping:
+            if params.get(name) is not None:
+                agreement[key] = params[name]
+        agreement['updated'] = _timestamp()
+        return [('BillingAgreementDetails',
+                 self._billing_agreement_details(agreement))]
+
+    def _action_ConfirmBillingAgreement(self, params):
+        agreement = self._billing_agreement(
+            self._require(params, 'AmazonBillingAgreementId'))
+        if agreement['state'] != 'Draft':
+            raise MwsError(
+                'InvalidBillingAgreementStatus',
+                'The BillingAgreement {} is not in the Draft state.'.format(
+                    agreement['id']))
+        self._set_state(agreement, 'Open')
+        return []
+
+    def _action_ValidateBillingAgreement(self, params):
+        agreement = self._billing_agreement(
+            self._require(params, 'AmazonBillingAgreementId'))
+        result = 'Success' if agreement['state'] == 'Open' else 'Failure'
+        return [('ValidationResult', result),
+                ('BillingAgreementStatus', self._status(agreement))]
+
+    def _action_CloseBillingAgreement(self, params):
+        agreement = self._billing_agreement(
+            self._require(params, 'AmazonBillingAgreementId'))
+        if agreement['state'] not in ('Draft', 'Open', 'Suspended'):
+            raise MwsError(
+                'InvalidBillingAgreementStatus',
+                'The BillingAgreement {} cannot be closed.'.format(
+                    agreement['id']))
+        self._set_state(agreement, 'Closed', 'SellerClosed')
+        return []
+
+    def _action_AuthorizeOnBillingAgreement(self, params):
+        agreement = self._billing_agreement(
+            self._require(params, 'AmazonBillingAgreementId'))
+        if agreement['state'] != 'Open':
+            raise MwsError(
+                'InvalidBillingAgreementStatus',
+                'The BillingAgreement {} is not Open.'.format(agreement['id']))
+        amount = self._amount(params, 'AuthorizationAmount.Amount')
+        order = self.orders[self.create_order(
+            amount=amount,
+            currency_code=params.get('AuthorizationAmount.CurrencyCode',
+                                     'USD'),
+            seller_order_id=params.get('SellerOrderAttributes.SellerOrderId'),
+            state='Open')]
+        order['seller_note'] = params.get('SellerNote')
+        order['store_name'] = params.get('SellerOrderAttributes.StoreName')
+        authorization = self._authorize(
+            order, params, params.get('CaptureNow') == 'true')
+        return [('AmazonOrderReferenceId', order['id']),
+                ('AuthorizationDetails',
+                 self._authorization_details(authorization))]
+
+
+class LocalMwsServer:
+
+    """Local stand-in for the Off-Amazon Payments MWS endpoint, for load
+    tests, benchmarks and soak tests that run without network access.
+
+    The server verifies Signature Version 2 on every request, keeps order,
+    authorization, capture and refund state in a LocalMwsState and answers
+    every Action implemented by AmazonPayClient. Latency, 503 throttling and
+    500 errors can be injected.
+
+    Example
+    -------
+    with LocalMwsServer() as server:
+        client = AmazonPayClient(
+            mws_access_key=server.mws_access_key,
+            mws_secret_key=server.mws_secret_key,
+            merchant_id='merchant_id',
+            region='na',
+            currency_code='USD',
+            mws_endpoint=server.endpoint)
+        client.get_service_status()
+    """
+
+    def __init__(
+            self,
+            mws_access_key='local_access_key',
+            mws_secret_key='local_secret_key',
+            host='127.0.0.1',
+            port=0,
+            sandbox=True,
+            latency=0,
+            throttle_rate=0,
+            error_rate=0,
+            ssl_context=None,
+            state=None,
+            seed=None,
+            compression=True):
+        """
+        Parameters
+        ----------
+        mws_access_key, mws_secret_key : string, optional
+            The only credentials the server accepts.
+
+        host : string, optional
+            Interface to bind. Default: 127.0.0.1
+
+        port : integer, optional
+            Port to bind, 0 picks a free port. Default: 0
+
+        sandbox : boolean, optional
+            Serve the OffAmazonPayments_Sandbox path. Default: True
+
+        latency : float or tuple (float, float), optional
+            Seconds to wait before answering, or a (min, max) range to draw
+            from uniformly. Default: 0
+
+        throttle_rate : float, optional
+            Probability of answering 503 RequestThrottled. Default: 0
+
+        error_rate : float, optional
+            Probability of answering 500 InternalServerError. Default: 0
+
+        ssl_context : ssl.SSLContext, optional
+            Serve HTTPS with this server side context. Default: None
+
+        state : LocalMwsState, optional
+            Object state to serve. Default: a new LocalMwsState
+
+        seed : integer, optional
+            Seed for fault injection and generated IDs. Default: None
+
+        compression : boolean, optional
+            Encode responses with gzip or deflate when the request accepts
+            it. Default: True
+        """
+        self.mws_access_key = mws_access_key
+        self.mws_secret_key = mws_secret_key
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.error_rate = error_rate
+        self.compression = compression
+        self.state = state or LocalMwsState(seed=seed)
+        self.stats = Counter()
+
+        self._ssl_context = ssl_context
+        self._path = '/{}/{}'.format(
+            'OffAmazonPayments_Sandbox' if sandbox else 'OffAmazonPayments',
+            ap_version.versions['api_version'])
+        self._rng = random.Random(seed)
+        self._forced = []
+        self._lock = threading.Lock()
+        self._thread = None
+        self._httpd = _ThreadingHTTPServer((host, port), _MwsRequestHandler)
+        self._httpd.mws = self
+        if ssl_context is not None:
+            self._httpd.socket = ssl_context.wrap_socket(
+                self._httpd.socket, server_side=True)
+
+    @property
+    def endpoint(self):
+        """URL to pass as AmazonPayClient(mws_endpoint=...)"""
+        host, port = self._httpd.server_address[:2]
+        return '{}://{}:{}{}'.format(
+            'https' if self._ssl_context is not None else 'http',
+            host, port, self._path)
+
+    def start(self):
+        """Serve requests on a background thread"""
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._httpd.serve_forever,
+                kwargs={'poll_interval': 0.05},
+                name='local-mws')
+            self._thread.daemon = True
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving and close the listening socket"""
+        if self._thread is not None:
+            self._httpd.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def fail_next(self, status=503, count=1):
+        """Answer the next count requests with status (503 or 500)"""
+        with self._lock:
+            self._forced.extend([status] * count)
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _fault(self):
+        with self._lock:
+            if self._forced:
+                return self._forced.pop(0)
+            roll = self._rng.random()
+        if roll < self.throttle_rate:
+            return 503
+        if roll < self.throttle_rate + self.error_rate:
+            return 500
+        return None
+
+    def _delay(self):
+        if isinstance(self.latency, (tuple, list)):
+            with self._lock:
+                return self._rng.uniform(*self.latency)
+        return self.latency
+
+    def _verify_signature(self, host, path, params):
+        """Recompute the Signature Version 2 of a request"""
+        if params.get('AWSAccessKeyId') != self.mws_access_key:
+            raise MwsError(
+                'InvalidAccessKeyId', 'The AWS Access Key Id is invalid.', 401)
+        if params.get('SignatureVersion') != '2':
+            raise MwsError(
+                'InvalidParameterValue', 'Invalid SignatureVersion.')
+        digests = {'HmacSHA256': hashlib.sha256, 'HmacSHA1': hashlib.sha1}
+        digestmod = digests.get(params.get('SignatureMethod'))
+        if digestmod is None:
+            raise MwsError(
+                'InvalidParameterValue', 'Invalid SignatureMethod.')
+
+        unsigned = sorted((k, v) for k, v in params.items()
+                          if k != 'Signature')
+        string_to_sign = 'POST\n{}\n{}\n{}'.format(
+            host,
+            path,
+            parse.urlencode(unsigned).replace(
+                '+', '%20').replace('*', '%2A').replace('%7E', '~'))
+        expected = base64.b64encode(hmac.new(
+            self.mws_secret_key.encode('utf_8'),
+            msg=string_to_sign.encode('utf_8'),
+            digestmod=digestmod).digest()).decode()
+        if not hmac.compare_digest(expected, params.get('Signature', '')):
+            raise MwsError(
+                'SignatureDoesNotMatch',
+                'The request signature we calculated does not match the '
+                'signature you provided.', 403)
+
+    def _dispatch(self, host, path, body):
+        """Return (status, xml) for a request"""
+        self._count('requests')
+        delay = self._delay()
+        if delay:
+            time.sleep(delay)
+
+        params = dict(parse.parse_qsl(body, keep_blank_values=True))
+        action = params.get('Action', '')
+        self._count(action)
+        try:
+            if path != self._path:
+                raise MwsError('InvalidAddress', 'Invalid path.', 404)
+            self._verify_signature(host, path, params)
+            fault = self._fault()
+            if fault == 503:
+                self._count('throttled')
+                raise MwsError(
+                    'RequestThrottled', 'Request is throttled.', 503)
+            if fault == 500:
+                self._count('errors')
+                raise MwsError(
+                    'InternalServerError', 'Internal server error.', 500)
+            result = self.state.handle(action, params)
+        except MwsError as ex:
+            return ex.status, _error_xml(ex)
+        return 200, _response_xml(action, result)
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _MwsRequestHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        self.server.mws._count('connections')
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length).decode('utf-8')
+        status, xml = self.server.mws._dispatch(
+            self.headers.get('Host', ''), parse.urlparse(self.path).path, body)
+        payload = xml.encode('utf-8')
+        encoding = self._content_encoding()
+        if encoding == 'gzip':
+            payload = gzip.compress(payload)
+        elif encoding == 'deflate':
+            payload = zlib.compress(payload)
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/xml')
+        if encoding is not None:
+            self.send_header('Content-Encoding', encoding)
+        self.send_header('Content-Length', str(len(payload)))
+        self.send_header('x-mws-request-id', str(uuid.uuid4()))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _content_encoding(self):
+        if not self.server.mws.compression:
+            return None
+        accepted = [value.split(';')[0].strip().lower() for value in
+                    self.headers.get('Accept-Encoding', '').split(',')]
+        for encoding in ('gzip', 'deflate'):
+            if encoding in accepted:
+                return encoding
+        return None
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _timestamp():
+    return datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.%f')[
+        :-3] + 'Z'
+
+
+def _build(parent, items):
+    for tag, value in items:
+        child = et.SubElement(parent, tag)
+        if isinstance(value, list):
+            _build(child, value)
+        elif value is not None:
+            child.text = str(value)
+
+
+def _response_xml(action, result):
+    root = et.Element('{}Response'.format(action), xmlns=NAMESPACE)
+    _build(root, [('{}Result'.format(action), result),
+                  ('ResponseMetadata', [('RequestId', str(uuid.uuid4()))])])
+    return '<?xml version="1.0"?>\n' + et.tostring(root, encoding='unicode')
+
+
+def _error_xml(error):
+    root = et.Element('ErrorResponse', xmlns=NAMESPACE)
+    _build(root, [('Error', [('Type', 'Sender' if error.status < 500
+                              else 'Receiver'),
+                             ('Code', error.code),
+                             ('Message', error.message)]),
+                  ('RequestId', str(uuid.uuid4()))])
+    return '<?xml version="1.0"?>\n' + et.tostring(root, encoding='unicode')
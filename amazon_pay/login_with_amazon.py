@@ -1,3 +1,9 @@
+import time
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import requests
 import amazon_pay.lwa_region as lwa_region
 
@@ -6,7 +12,9 @@ class LoginWithAmazon:
 
     """Login with Amazon class to wrap the get login profile method"""
 
-    def __init__(self, client_id, region, sandbox=False):
+    def __init__(self, client_id, region, sandbox=False, session=None,
+                 cache_ttl=0, max_entries=1024, clock=time.time,
+                 concurrent=False):
         """
         Parameters
         ----------
@@ -18,6 +26,28 @@ class LoginWithAmazon:
 
         sandbox : string, optional
             Toggle sandbox mode. Default: False
+
+        session : requests.Session, optional
+            Session whose connection pool is reused for every call.
+            Default: None (a new connection per call)
+
+        cache_ttl : float, optional
+            Seconds to keep the profile of a validated access token, never
+            longer than the token is valid. 0 disables the cache.
+            Default: 0
+
+        max_entries : integer, optional
+            Number of access tokens to keep. Default: 1024
+
+        clock : callable, optional
+            Returns the current time in seconds. Default: time.time
+
+        concurrent : boolean, optional
+            Request the profile while the token is being validated, so a
+            login takes one round-trip instead of two. The profile is
+            discarded unless the token was issued to client_id. Call
+            close(), or use the object as a context manager, to stop the
+            threads sending the requests. Default: False
         """
         self._client_id = client_id
 
@@ -31,16 +61,72 @@ class LoginWithAmazon:
             self._sandbox_str,
             self.region)
 
+        self.session = session
+        self.cache_ttl = cache_ttl
+        self.max_entries = max_entries
+        self._clock = clock
+        self.concurrent = concurrent
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = None
+
     def get_login_profile(self, access_token):
         """Get profile associated with LWA user."""
-        token_info = requests.get(
-            url='{}/auth/o2/tokeninfo'.format(self._endpoint),
+        key = self._cache_key(access_token)
+        profile = self._cached(key)
+        if profile is not None:
+            return profile
+
+        if not self.concurrent:
+            token_decoded = self._get(
+                '/auth/o2/tokeninfo', access_token).json()
+            self._validate(token_decoded)
+            profile = self._get('/user/profile', access_token).json()
+        else:
+            profile_future = self._pool().submit(
+                self._get, '/user/profile', access_token)
+            try:
+                token_decoded = self._get(
+                    '/auth/o2/tokeninfo', access_token).json()
+                self._validate(token_decoded)
+            except Exception:
+                profile_future.cancel()
+                raise
+            profile = profile_future.result().json()
+
+        self._store(key, token_decoded, profile)
+        return profile
+
+    def close(self):
+        """Shut down the threads started for concurrent requests"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    4, thread_name_prefix='lwa')
+            return self._executor
+
+    def _get(self, path, access_token):
+        http = self.session if self.session is not None else requests
+        return http.get(
+            url='{}{}'.format(self._endpoint, path),
             headers={'x-amz-access-token': access_token},
             params=None,
             verify=True)
 
-        token_decoded = token_info.json()
-
+    def _validate(self, token_decoded):
+        """Raise ValueError unless the token was issued to client_id"""
         if 'error' in token_decoded:
             raise ValueError(token_decoded['error'])
 
@@ -50,10 +136,97 @@ class LoginWithAmazon:
         if token_decoded['aud'] != self._client_id:
             raise ValueError('Invalid client Id.')
 
-        profile = requests.get(
-            url='{}/user/profile'.format(self._endpoint),
-            headers={'x-amz-access-token': access_token},
-            params=None,
-            verify=True)
+    def _cache_key(self, access_token):
+        if not self.cache_ttl:
+            return None
+        return hashlib.sha256(access_token.encode('utf-8')).hexdigest()
+
+    def _cached(self, key):
+        if key is None:
+            return None
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= self._clock():
+                del self._cache[key]
+                return None
+            self._cache.move_to_end(key)
+            return dict(entry[1])
+
+    def _store(self, key, token_decoded, profile):
+        """Cache a profile until cache_ttl passes or the token expires"""
+        if key is None or not isinstance(profile, dict) or \
+                'error' in profile:
+            return
+        ttl = self.cache_ttl
+        try:
+            ttl = min(ttl, float(token_decoded['exp']))
+        except (KeyError, TypeError, ValueError):
+            pass
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._cache[key] = (self._clock() + ttl, dict(profile))
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+
+
+class AsyncLoginWithAmazon(LoginWithAmazon):
+
+    """LoginWithAmazon for asyncio applications. get_login_profile is a
+    coroutine; the HTTP calls run in an executor so the event loop is not
+    blocked. With concurrent=True the tokeninfo and profile requests are
+    issued together and the profile is discarded unless the token was
+    issued to client_id.
+
+        lwa = AsyncLoginWithAmazon(client_id, 'na', concurrent=True)
+        profile = await lwa.get_login_profile(access_token)
+    """
+
+    def __init__(self, *args, executor=None, **kwargs):
+        """
+        Parameters
+        ----------
+        executor : concurrent.futures.Executor, optional
+            Where the HTTP calls run. Default: the loop's default executor
+
+        See LoginWithAmazon for the other parameters.
+        """
+        super(AsyncLoginWithAmazon, self).__init__(*args, **kwargs)
+        self.executor = executor
+
+    async def get_login_profile(self, access_token):
+        """Get profile associated with LWA user."""
+        key = self._cache_key(access_token)
+        profile = self._cached(key)
+        if profile is not None:
+            return profile
+
+        loop = asyncio.get_running_loop()
+
+        def get(path):
+            return loop.run_in_executor(
+                self.executor, lambda: self._get(path, access_token).json())
+
+        if not self.concurrent:
+            token_decoded = await get('/auth/o2/tokeninfo')
+            self._validate(token_decoded)
+            profile = await get('/user/profile')
+        else:
+            profile_future = get('/user/profile')
+            try:
+                token_decoded = await get('/auth/o2/tokeninfo')
+                self._validate(token_decoded)
+            except BaseException:
+                # Retrieve the profile's outcome so it is not reported as
+                # an unhandled exception, and drop it.
+                profile_future.add_done_callback(
+                    lambda future: future.cancelled() or future.exception())
+                profile_future.cancel()
+                raise
+            profile = await profile_future
 
-        return profile.json()
+        self._store(key, token_decoded, profile)
+        return profile
@@ -0,0 +1,147 @@
+import bisect
+import threading
+
+
+class MetricsSink:
+
+    """Interface for receiving SDK metrics. Subclass this to forward metrics
+    to your own monitoring system.
+
+    Every metric carries a dictionary of labels. The SDK uses the labels
+    action and seller_id on every metric, plus status on request counts and
+    phase on latency histograms.
+    """
+
+    def increment(self, name, labels, value=1):
+        """Add value to the counter name"""
+        raise NotImplementedError
+
+    def observe(self, name, labels, value):
+        """Record value in the histogram name"""
+        raise NotImplementedError
+
+
+class InMemoryMetricsSink(MetricsSink):
+
+    """Thread safe sink keeping counters and histograms in memory. Use
+    to_prometheus() to expose them in the Prometheus text format.
+    """
+
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+                       5.0, 10.0)
+
+    def __init__(self, buckets=None, prefix='amazon_pay_'):
+        """
+        Parameters
+        ----------
+        buckets : tuple (float), optional
+            Upper bounds of the histogram buckets in seconds.
+            Default: InMemoryMetricsSink.DEFAULT_BUCKETS
+
+        prefix : string, optional
+            Prepended to every metric name on export. Default: amazon_pay_
+        """
+        self.buckets = tuple(sorted(buckets or self.DEFAULT_BUCKETS))
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    def increment(self, name, labels, value=1):
+        key = (name, self._label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        key = (name, self._label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = {'buckets': [0] * len(self.buckets),
+                             'count': 0,
+                             'sum': 0.0}
+                self._histograms[key] = histogram
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                histogram['buckets'][index] += 1
+            histogram['count'] += 1
+            histogram['sum'] += value
+
+    def counter(self, name, **labels):
+        """Return the value of a counter, 0 if it was never incremented"""
+        with self._lock:
+            return self._counters.get((name, self._label_key(labels)), 0)
+
+    def histogram(self, name, **labels):
+        """Return a copy of a histogram as a dictionary with the keys
+        buckets (non cumulative counts per bucket), count and sum, or None.
+        """
+        with self._lock:
+            histogram = self._histograms.get((name, self._label_key(labels)))
+            if histogram is None:
+                return None
+            return {'buckets': list(histogram['buckets']),
+                    'count': histogram['count'],
+                    'sum': histogram['sum']}
+
+    def reset(self):
+        """Drop every recorded value"""
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def to_prometheus(self):
+        """Return all metrics in the Prometheus text exposition format"""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(
+                (key, dict(value, buckets=list(value['buckets'])))
+                for key, value in self._histograms.items())
+
+        lines = []
+        declared = set()
+        for (name, labels), value in counters:
+            metric = self.prefix + name
+            if metric not in declared:
+                declared.add(metric)
+                lines.append('# TYPE {} counter'.format(metric))
+            lines.append('{}{} {}'.format(
+                metric, self._format_labels(labels), self._format_value(value)))
+
+        for (name, labels), histogram in histograms:
+            metric = self.prefix + name
+            if metric not in declared:
+                declared.add(metric)
+                lines.append('# TYPE {} histogram'.format(metric))
+            cumulative = 0
+            for bound, count in zip(self.buckets, histogram['buckets']):
+                cumulative += count
+                lines.append('{}_bucket{} {}'.format(
+                    metric,
+                    self._format_labels(labels + (('le', repr(bound)),)),
+                    cumulative))
+            lines.append('{}_bucket{} {}'.format(
+                metric,
+                self._format_labels(labels + (('le', '+Inf'),)),
+                histogram['count']))
+            lines.append('{}_sum{} {}'.format(
+                metric, self._format_labels(labels),
+                self._format_value(histogram['sum'])))
+            lines.append('{}_count{} {}'.format(
+                metric, self._format_labels(labels), histogram['count']))
+
+        return '\n'.join(lines) + '\n' if lines else ''
+
+    def _label_key(self, labels):
+        return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def _format_labels(self, labels):
+        if not labels:
+            return ''
+        return '{' + ','.join(
+            '{}="{}"'.format(k, v.replace('\\', '\\\\').replace(
+                '"', '\\"').replace('\n', '\\n'))
+            for k, v in labels) + '}'
+
+    def _format_value(self, value):
+        return repr(float(value)) if isinstance(value, float) else str(value)
@@ -0,0 +1,326 @@
+import time
+import sqlite3
+import datetime
+import threading
+from amazon_pay.response_cache import object_root
+
+
+# Elements describing a payment object, with the kind of object, its ID,
+# reference ID, status and amount elements.
+PAYMENT_ELEMENTS = {
+    'AuthorizationDetails': ('authorization', 'AmazonAuthorizationId',
+                             'AuthorizationReferenceId',
+                             'AuthorizationStatus', 'AuthorizationAmount'),
+    'CaptureDetails': ('capture', 'AmazonCaptureId', 'CaptureReferenceId',
+                       'CaptureStatus', 'CaptureAmount'),
+    'RefundDetails': ('refund', 'AmazonRefundId', 'RefundReferenceId',
+                      'RefundStatus', 'RefundAmount')}
+ORDER_ELEMENTS = ('OrderReferenceDetails', 'OrderReference')
+# Kind of the objects listed in the IdList of an order or payment object.
+CHILD_KINDS = {'order': 'authorization',
+               'authorization': 'capture',
+               'capture': 'refund'}
+
+_SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS orders ('
+    'order_id TEXT PRIMARY KEY, seller_order_id TEXT, state TEXT, '
+    'reason_code TEXT, amount TEXT, currency_code TEXT, created TEXT, '
+    'updated TEXT)',
+    'CREATE TABLE IF NOT EXISTS payments ('
+    'object_id TEXT PRIMARY KEY, order_id TEXT, kind TEXT, parent_id TEXT, '
+    'reference_id TEXT, state TEXT, reason_code TEXT, amount TEXT, '
+    'currency_code TEXT, created TEXT, updated TEXT)',
+    'CREATE TABLE IF NOT EXISTS checkpoints ('
+    'name TEXT PRIMARY KEY, value TEXT)',
+    'CREATE INDEX IF NOT EXISTS orders_seller_order_id '
+    'ON orders (seller_order_id)',
+    'CREATE INDEX IF NOT EXISTS payments_order_id ON payments (order_id)')
+
+_UPSERT_ORDER = (
+    'INSERT INTO orders VALUES (?, ?, ?, ?, ?, ?, ?, ?) '
+    'ON CONFLICT (order_id) DO UPDATE SET '
+    'seller_order_id = coalesce(excluded.seller_order_id, seller_order_id), '
+    'state = coalesce(excluded.state, state), '
+    'reason_code = excluded.reason_code, '
+    'amount = coalesce(excluded.amount, amount), '
+    'currency_code = coalesce(excluded.currency_code, currency_code), '
+    'created = coalesce(excluded.created, created), '
+    'updated = coalesce(excluded.updated, updated) '
+    "WHERE coalesce(excluded.updated, '') >= coalesce(orders.updated, '')")
+
+_UPSERT_PAYMENT = (
+    'INSERT INTO payments VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) '
+    'ON CONFLICT (object_id) DO UPDATE SET '
+    'parent_id = coalesce(excluded.parent_id, parent_id), '
+    'reference_id = coalesce(excluded.reference_id, reference_id), '
+    'state = coalesce(excluded.state, state), '
+    'reason_code = excluded.reason_code, '
+    'amount = coalesce(excluded.amount, amount), '
+    'currency_code = coalesce(excluded.currency_code, currency_code), '
+    'created = coalesce(excluded.created, created), '
+    'updated = coalesce(excluded.updated, updated) '
+    "WHERE coalesce(excluded.updated, '') >= coalesce(payments.updated, '')")
+
+
+def _timestamp(value):
+    return value.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def _as_list(value):
+    return value if isinstance(value, list) else [value]
+
+
+def _money(details, name):
+    money = details.get(name) or {}
+    return money.get('Amount'), money.get('CurrencyCode')
+
+
+def _status(details, name):
+    status = details.get(name) or {}
+    return (status.get('State'), status.get('ReasonCode'),
+            status.get('LastUpdateTimestamp'))
+
+
+def _members(details):
+    id_list = details.get('IdList') or {}
+    return [member for member in _as_list(id_list.get('member') or [])
+            if member]
+
+
+def list_orders(client, query_id, query_id_type, start, end, page_size=100,
+                **kwargs):
+    """Yield the OrderReference summaries of every page list_order_reference
+    returns for orders created between the start and end datetimes. Extra
+    keyword arguments (merchant_id, mws_auth_token) are passed to the calls.
+    """
+    response = client.list_order_reference(
+        query_id=query_id,
+        query_id_type=query_id_type,
+        created_time_range_start=_timestamp(start),
+        created_time_range_end=_timestamp(end),
+        page_size=page_size,
+        stream=True,
+        **kwargs)
+    while True:
+        if not response.success:
+            raise ValueError('Listing orders failed: {}'.format(
+                response.to_xml()))
+        for order_reference in response:
+            yield order_reference
+        if response.next_page_token is None:
+            return
+        response = client.list_order_reference_by_next_token(
+            next_page_token=response.next_page_token, stream=True, **kwargs)
+
+
+class OrderIndex:
+
+    """Local SQLite index of order references and their authorizations,
+    captures and refunds, fed by API responses and IPNs.
+
+    Pass it as AmazonPayClient(order_index=...) and IpnHandler(...,
+    order_index=...) to record every successful response and every
+    authenticated notification. Records are only replaced by records with
+    the same or a later LastUpdateTimestamp, so a late IPN does not undo a
+    newer response. Objects only known from the IdList of their parent are
+    indexed without state until their details are seen.
+    """
+
+    def __init__(self, path=':memory:'):
+        """
+        Parameters
+        ----------
+        path : string, optional
+            Database file, created if missing. Default: ':memory:'
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False,
+                                   isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        if path != ':memory:':
+            self._db.execute('PRAGMA journal_mode=WAL')
+        for statement in _SCHEMA:
+            self._db.execute(statement)
+
+    def record_response(self, response):
+        """Index the objects in a PaymentResponse. Returns their number."""
+        if not response.success:
+            return 0
+        return self.record(response.to_dict())
+
+    def record_notification(self, ipn_handler):
+        """Index the objects in an IPN. Returns their number."""
+        return self.record(ipn_handler.to_dict())
+
+    def record(self, data):
+        """Index the objects in a dictionary in the format of
+        PaymentResponse.to_dict(), e.g. {'OrderReference': order} for the
+        items of an OrderReferenceStream. Returns their number.
+        """
+        found = []
+        self._find(data, found)
+        with self._lock:
+            self._db.execute('BEGIN')
+            try:
+                for element, details in found:
+                    if element in ORDER_ELEMENTS:
+                        self._record_order(details)
+                    else:
+                        self._record_payment(
+                            PAYMENT_ELEMENTS[element], details)
+                self._db.execute('COMMIT')
+            except BaseException:
+                self._db.execute('ROLLBACK')
+                raise
+        return len(found)
+
+    def order(self, order_id):
+        """Return the indexed order reference, or None"""
+        return self._one(
+            'SELECT * FROM orders WHERE order_id = ?', (order_id,))
+
+    def orders_by_seller_order_id(self, seller_order_id):
+        """Return the order references with a SellerOrderId"""
+        return self._all(
+            'SELECT * FROM orders WHERE seller_order_id = ? '
+            'ORDER BY created', (seller_order_id,))
+
+    def payment(self, object_id):
+        """Return the indexed authorization, capture or refund, or None"""
+        return self._one(
+            'SELECT * FROM payments WHERE object_id = ?', (object_id,))
+
+    def payments(self, order_id, kind=None):
+        """Return the authorizations, captures and refunds of an order, or
+        only those of one kind ('authorization', 'capture' or 'refund')
+        """
+        if kind is None:
+            return self._all(
+                'SELECT * FROM payments WHERE order_id = ? '
+                'ORDER BY object_id', (order_id,))
+        return self._all(
+            'SELECT * FROM payments WHERE order_id = ? AND kind = ? '
+            'ORDER BY object_id', (order_id, kind))
+
+    def checkpoint(self, name):
+        """Return the value stored under name, or None"""
+        row = self._one('SELECT value FROM checkpoints WHERE name = ?',
+                        (name,))
+        return row['value'] if row else None
+
+    def set_checkpoint(self, name, value):
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO checkpoints VALUES (?, ?)',
+                (name, value))
+
+    def sync(self, client, query_id, query_id_type='SellerOrderId',
+             start=None, end=None, page_size=100, overlap=300,
+             clock=time.time):
+        """Index the order references list_order_reference returns for
+        query_id that were created since the last sync, and return their
+        number.
+
+        Parameters
+        ----------
+        client : AmazonPayClient, required
+            Client to list orders with.
+
+        query_id, query_id_type : string, required
+            Passed to list_order_reference.
+
+        start : datetime, optional
+            Start of the CreatedTimeRange. Default: the end of the last sync
+            for query_id minus overlap; required for the first sync.
+
+        end : datetime, optional
+            End of the CreatedTimeRange. Default: now
+
+        page_size : integer, optional
+            Orders per page. Default: 100
+
+        overlap : float, optional
+            Seconds before the last sync's end to start from, to pick up
+            orders created with a skewed clock. Default: 300
+        """
+        name = 'list:{}:{}'.format(query_id_type, query_id)
+        if start is None:
+            last = self.checkpoint(name)
+            if last is None:
+                raise ValueError(
+                    'No checkpoint for {}, start is required.'.format(name))
+            start = datetime.datetime.strptime(
+                last, '%Y-%m-%dT%H:%M:%SZ') - datetime.timedelta(
+                    seconds=overlap)
+        if end is None:
+            end = datetime.datetime.utcfromtimestamp(int(clock()))
+
+        count = 0
+        for order_reference in list_orders(
+                client, query_id, query_id_type, start, end, page_size):
+            count += self.record({'OrderReference': order_reference})
+        self.set_checkpoint(name, _timestamp(end))
+        return count
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _find(self, value, found):
+        if not isinstance(value, dict):
+            return
+        for name, child in value.items():
+            for item in _as_list(child):
+                if not isinstance(item, dict):
+                    continue
+                if name in ORDER_ELEMENTS or name in PAYMENT_ELEMENTS:
+                    found.append((name, item))
+                else:
+                    self._find(item, found)
+
+    def _record_order(self, details):
+        order_id = details.get('AmazonOrderReferenceId')
+        if not order_id:
+            return
+        state, reason_code, updated = _status(
+            details, 'OrderReferenceStatus')
+        amount, currency_code = _money(details, 'OrderTotal')
+        attributes = details.get('SellerOrderAttributes') or {}
+        self._db.execute(_UPSERT_ORDER, (
+            order_id, attributes.get('SellerOrderId'), state, reason_code,
+            amount, currency_code, details.get('CreationTimestamp'),
+            updated))
+        self._record_children(order_id, 'order', order_id, details)
+
+    def _record_payment(self, element, details):
+        kind, id_name, reference_name, status_name, amount_name = element
+        object_id = details.get(id_name)
+        if not object_id:
+            return
+        order_id = object_root(object_id)
+        state, reason_code, updated = _status(details, status_name)
+        amount, currency_code = _money(details, amount_name)
+        self._db.execute(_UPSERT_PAYMENT, (
+            object_id, order_id, kind, None, details.get(reference_name),
+            state, reason_code, amount, currency_code,
+            details.get('CreationTimestamp'), updated))
+        self._record_children(order_id, kind, object_id, details)
+
+    def _record_children(self, order_id, kind, parent_id, details):
+        for child_id in _members(details):
+            self._db.execute(
+                'INSERT INTO payments (object_id, order_id, kind, parent_id) '
+                'VALUES (?, ?, ?, ?) ON CONFLICT (object_id) DO UPDATE SET '
+                'parent_id = excluded.parent_id',
+                (child_id, order_id, CHILD_KINDS[kind], parent_id))
+
+    def _one(self, query, args):
+        with self._lock:
+            row = self._db.execute(query, args).fetchone()
+        return dict(row) if row is not None else None
+
+    def _all(self, query, args):
+        with self._lock:
+            rows = self._db.execute(query, args).fetchall()
+        return [dict(row) for row in rows]
@@ -8,7 +8,13 @@ import logging
 import re
 from urllib import parse
 from collections import OrderedDict
-from amazon_pay.payment_response import PaymentResponse, PaymentErrorResponse
+from urllib3.response import HTTPResponse
+from amazon_pay.payment_response import PaymentResponse, \
+    PaymentErrorResponse, PaymentCircuitOpenResponse, OrderReferenceStream
+from amazon_pay.profiler import NULL_PHASE
+
+
+STREAM_CHUNK_SIZE = 16384
 
 
 class PaymentRequest:
@@ -33,6 +39,8 @@ class PaymentRequest:
             Dictionary containing configuration information.
             Required keys: mws_access_key, mws_secret_key, api_version,
                 merchant_id, mws_endpoint, headers, handle_throttle
+            Optional keys: circuit_breaker, metrics, hooks, transport,
+                profiler, keep_response_xml, stream, timeout
         """
         self.success = False
         self.response = None
@@ -47,6 +55,22 @@ class PaymentRequest:
         self._mws_endpoint = config['mws_endpoint']
         self._headers = config['headers']
         self._should_throttle = False
+        self._circuit_breaker = config.get('circuit_breaker')
+        self._metrics = config.get('metrics')
+        self._labels = None
+        if self._metrics is not None:
+            self._labels = {
+                'action': params.get('Action'),
+                'seller_id': params.get('SellerId', self.merchant_id)}
+        self.timings = None
+        self._hooks = config.get('hooks') or None
+        self._attempt = 0
+        self._transport = config.get('transport')
+        self._profiler = config.get('profiler')
+        self._keep_response_xml = config.get('keep_response_xml', True)
+        self._stream = config.get('stream', False)
+        self._timeout = config.get('timeout')
+        self._outcome_recorded = False
 
     def _sign(self, string_to_sign):
         """Generate the signature for the request"""
@@ -106,42 +130,214 @@ class PaymentRequest:
                 sorted(parameters.items())).replace(
                     '+', '%20').replace('*', '%2A').replace('%7E', '~'))
 
-        parameters['Signature'] = self._sign(string_to_sign)
+        with self._phase('sign'):
+            parameters['Signature'] = self._sign(string_to_sign)
 
         ordered_parameters = OrderedDict(sorted(parameters.items()))
         ordered_parameters.move_to_end('Signature')
         return parse.urlencode(ordered_parameters).encode(encoding='utf_8')
 
     def _request(self, retry_time):
+        self._attempt += 1
+        if self._circuit_breaker is not None and \
+                not self._circuit_breaker.allow_request():
+            self._should_throttle = False
+            self.response = PaymentCircuitOpenResponse()
+            self.logger.debug('Circuit open for %s, request not sent',
+                self._mws_endpoint)
+            if self._metrics is not None:
+                self._metrics.increment(
+                    'requests_total', dict(self._labels, status='circuit_open'))
+            return
+        self._outcome_recorded = False
+        try:
+            self._send(retry_time)
+        finally:
+            # Give back a half-open probe slot when the attempt raised
+            # before its outcome was recorded
+            if self._circuit_breaker is not None and \
+                    not self._outcome_recorded:
+                self._circuit_breaker.release()
+
+    def _send(self, retry_time):
+        """Sign, send and parse one attempt of the call"""
+        if retry_time and self._metrics is not None:
+            self._metrics.increment('retries_total', self._labels)
+            self._metrics.increment(
+                'throttle_sleep_seconds_total', self._labels, retry_time)
+        if retry_time:
+            self._fire('before_retry', retry_time=retry_time)
         time.sleep(retry_time)
-        data = self._querystring(self._params)
+        self._fire('before_sign')
+        started = time.perf_counter()
+        with self._phase('querystring'):
+            data = self._querystring(self._params)
+        signed = time.perf_counter()
+        self._fire('before_send', timings={'sign': signed - started})
         
-        self.logger.debug('Request Header: %s', 
-            self._sanitize_request_data(str(self._headers)))
-
-        r = requests.post(
-            url=self._mws_endpoint,
-            data=data,
-            headers=self._headers,
-            verify=True)
-        r.encoding = 'utf-8'
+        if self.logger.isEnabledFor(logging.DEBUG):
+            with self._phase('sanitize'):
+                self.logger.debug('Request Header: %s', 
+                    self._sanitize_request_data(str(self._headers)))
+
+        try:
+            with self._phase('http'):
+                if self._transport is None and self._stream:
+                    r = requests.post(
+                        url=self._mws_endpoint,
+                        data=data,
+                        headers=self._headers,
+                        verify=True,
+                        stream=True,
+                        timeout=self._timeout)
+                elif self._transport is None:
+                    r = requests.post(
+                        url=self._mws_endpoint,
+                        data=data,
+                        headers=self._headers,
+                        verify=True,
+                        timeout=self._timeout)
+                else:
+                    r = self._transport.post(
+                        self._mws_endpoint, data, self._headers,
+                        timeout=self._timeout)
+        except requests.exceptions.RequestException:
+            self._record_outcome(False)
+            if self._metrics is not None:
+                self._metrics.increment(
+                    'requests_total', dict(self._labels, status='error'))
+            raise
+        received = time.perf_counter()
         self._status_code = r.status_code
+        if self._stream and self._transport is None and \
+                self._status_code == 200:
+            body = None
+        else:
+            body = r.content
+        self._fire('after_receive', status_code=self._status_code,
+                   timings={'sign': signed - started,
+                            'network': received - signed})
+
+        self._record_outcome(self._status_code < 500)
 
         if self._status_code == 200:
             self.success = True
             self._should_throttle = False
-            self.response = PaymentResponse(r.text)
-            self.logger.debug('Response: %s', 
-                self._sanitize_response_data(r.text))
+            if self._stream:
+                self.response = self._order_reference_stream(r, body)
+            else:
+                with self._phase('parse'):
+                    self.response = PaymentResponse(
+                        body, self._keep_response_xml)
+                self._log_response(body)
         elif (self._status_code == 500 or self._status_code ==
               503) and self.handle_throttle:
             self._should_throttle = True
             self.response = PaymentErrorResponse(
                 '<error>{}</error>'.format(r.status_code))
         else:
-            self.response = PaymentErrorResponse(r.text)
-            self.logger.debug('Response: %s', 
-                self._sanitize_response_data(r.text))
+            with self._phase('parse'):
+                self.response = PaymentErrorResponse(
+                    body, self._keep_response_xml)
+            self._log_response(body)
+        if self._profiler is not None:
+            self.response._profiler = self._profiler
+            self.response._action = self._params.get('Action')
+
+        self.timings = {'sign': signed - started,
+                        'network': received - signed,
+                        'parse': time.perf_counter() - received}
+        if self._metrics is not None:
+            self._record_metrics(data, body, r)
+        self._fire('after_parse', status_code=self._status_code,
+                   request_id=self.response.request_id, timings=self.timings)
+
+    def _record_outcome(self, success):
+        """Report the outcome of the attempt to the circuit breaker"""
+        if self._circuit_breaker is None:
+            return
+        self._outcome_recorded = True
+        if success:
+            self._circuit_breaker.record_success()
+        else:
+            self._circuit_breaker.record_failure()
+
+    def _order_reference_stream(self, r, body):
+        """Wrap a streamed response body in an incremental parser. body is
+        None if the response has not been read yet; requests decompresses it
+        chunk by chunk while the parser consumes it.
+        """
+        if body is not None:
+            return OrderReferenceStream((body,))
+        stream = OrderReferenceStream(
+            r.iter_content(chunk_size=STREAM_CHUNK_SIZE),
+            close=lambda: self._close_stream(r, stream))
+        return stream
+
+    def _close_stream(self, r, stream):
+        """Release the connection of a streamed response and count its
+        bytes once it has been read
+        """
+        if self._metrics is not None:
+            self._record_response_bytes(stream.response_bytes, r)
+        r.close()
+
+    def _log_response(self, body):
+        """Log the sanitized response body. The body is only decoded and
+        sanitized when debug logging is enabled.
+        """
+        if self.logger.isEnabledFor(logging.DEBUG):
+            with self._phase('sanitize'):
+                self.logger.debug('Response: %s', 
+                    self._sanitize_response_data(body.decode('utf-8')))
+
+    def _phase(self, name):
+        """Context manager timing a phase of the call when it is profiled"""
+        if self._profiler is None:
+            return NULL_PHASE
+        return self._profiler.phase(self._params.get('Action'), name)
+
+    def _fire(self, event, **data):
+        """Invoke the lifecycle callbacks for event, if any"""
+        if self._hooks is not None:
+            self._hooks.fire(event, action=self._params.get('Action'),
+                             attempt=self._attempt, **data)
+
+    def _record_metrics(self, data, body, r):
+        """Send the counters and phase timings of one attempt to the sink.
+        body is None for streamed responses, whose bytes are counted when
+        the stream has been read.
+        """
+        labels = self._labels
+        self._metrics.increment(
+            'requests_total', dict(labels, status=str(self._status_code)))
+        self._metrics.increment('request_bytes_total', labels, len(data))
+        if body is not None:
+            self._record_response_bytes(len(body), r)
+        if self._should_throttle:
+            self._metrics.increment('throttles_total', labels)
+        for phase, seconds in self.timings.items():
+            self._metrics.observe(
+                'phase_seconds', dict(labels, phase=phase), seconds)
+
+    def _record_response_bytes(self, size, r):
+        """Count the decompressed body size and the bytes received on the
+        wire, which are smaller when the response was gzip or deflate encoded
+        """
+        self._metrics.increment('response_bytes_total', self._labels, size)
+        self._metrics.increment(
+            'response_wire_bytes_total', self._labels,
+            self._wire_bytes(r, size))
+
+    @staticmethod
+    def _wire_bytes(r, size):
+        """Number of body bytes read from the connection before content
+        decoding, or size if the response does not tell
+        """
+        raw = getattr(r, 'raw', None)
+        if isinstance(raw, HTTPResponse):
+            return raw.tell()
+        return size
 
     def send_post(self):
         """Call request to send to MWS endpoint and handle throttle if set."""
@@ -153,7 +349,8 @@ class PaymentRequest:
         else:
             self._request(0)
             
-    def _sanitize_request_data(self, text):
+    @staticmethod
+    def _sanitize_request_data(text):
         editText = text
         patterns = []
         patterns.append(r'(?s)(SellerNote).*(&)')
@@ -166,7 +363,8 @@ class PaymentRequest:
             editText = re.sub(pattern, replacement, editText)
         return editText
     
-    def _sanitize_response_data(self, text):
+    @staticmethod
+    def _sanitize_response_data(text):
         editText = text
         patterns = []
         patterns.append(r'(?s)(<Buyer>).*(</Buyer>)')
@@ -2,6 +2,7 @@ import re
 import json
 import xml.etree.ElementTree as et
 from collections import defaultdict
+from amazon_pay.profiler import NULL_PHASE
 
 
 class PaymentResponse:
@@ -10,8 +11,13 @@ class PaymentResponse:
 
     Parameters
     ----------
-    xml : string
-        XML response from Amazon.
+    xml : string or bytes
+        XML response from Amazon. Bytes are parsed directly and only decoded
+        if to_xml() is called.
+
+    keep_xml : boolean
+        Keep the XML after parsing. If False, to_xml() serializes the parsed
+        tree instead. Default: True
 
 
     Properties
@@ -32,10 +38,13 @@ class PaymentResponse:
         XML response from Amazon.
     """
 
-    def __init__(self, xml):
+    _profiler = None
+    _action = None
+
+    def __init__(self, xml, keep_xml=True):
         """Initialize response"""
         self.success = True
-        self._xml = xml
+        self._xml = xml if keep_xml else None
         try:
             self._root = et.fromstring(xml)
             self._ns = self._namespace(self._root)
@@ -63,15 +72,35 @@ class PaymentResponse:
 
     def to_xml(self):
         """Return XML"""
+        if self._xml is None:
+            if self._ns:
+                # Write the namespace as xmlns="..." like MWS does instead
+                # of an ns0: prefix on every element
+                return et.tostring(self._root, encoding='unicode',
+                                   default_namespace=self._ns.strip('{}'))
+            return et.tostring(self._root, encoding='unicode')
+        if isinstance(self._xml, bytes):
+            self._xml = self._xml.decode('utf-8')
         return self._xml
 
     def to_json(self):
         """Return JSON"""
-        return json.dumps(self._etree_to_dict(self._root), ensure_ascii=False)
+        with self._phase('to_json'):
+            return json.dumps(
+                self._etree_to_dict(self._root), ensure_ascii=False)
 
     def to_dict(self):
         """Return Dictionary"""
-        return self._etree_to_dict(self._root)
+        with self._phase('to_dict'):
+            return self._etree_to_dict(self._root)
+
+    def _phase(self, name):
+        """Time a conversion when the call that produced this response was
+        profiled
+        """
+        if self._profiler is None:
+            return NULL_PHASE
+        return self._profiler.phase(self._action, name)
 
     def _etree_to_dict(self, t):
         """Convert XML to Dictionary"""
@@ -103,7 +132,94 @@ class PaymentErrorResponse(PaymentResponse):
 
     """Error response subclass"""
 
-    def __init__(self, xml):
+    def __init__(self, xml, keep_xml=True):
 
-        super(PaymentErrorResponse, self).__init__(xml)
+        super(PaymentErrorResponse, self).__init__(xml, keep_xml)
         self.success = False
+
+
+class PaymentCircuitOpenResponse(PaymentErrorResponse):
+
+    """Returned without calling MWS while the circuit breaker for the
+    endpoint is open.
+    """
+
+    def __init__(self, xml='<error>CircuitOpen</error>'):
+
+        super(PaymentCircuitOpenResponse, self).__init__(xml)
+
+
+class OrderReferenceStream:
+
+    """Incremental parser for ListOrderReference and
+    ListOrderReferenceByNextToken responses requested with stream=True.
+
+    Iterating yields every OrderReference as a dictionary, in the format of
+    to_dict(), as soon as its closing tag has been read from the connection.
+    Parsed elements are discarded right away, so the time to the first order
+    and the memory used do not grow with the page size. The response can be
+    iterated once; next_page_token and request_id are set when iteration is
+    complete.
+    """
+
+    success = True
+    _namespace = PaymentResponse._namespace
+    _etree_to_dict = PaymentResponse._etree_to_dict
+
+    def __init__(self, chunks, close=None):
+        """
+        Parameters
+        ----------
+        chunks : iterable of bytes, required
+            Response body, e.g. requests.Response.iter_content().
+
+        close : callable, optional
+            Called when iteration ends, e.g. to release the connection.
+        """
+        self._chunks = chunks
+        self._close = close
+        self._consumed = False
+        self._ns = ''
+        self.next_page_token = None
+        self.request_id = None
+        self.response_bytes = 0
+
+    def __iter__(self):
+        if self._consumed:
+            raise ValueError('Response stream already consumed.')
+        self._consumed = True
+        parser = et.XMLPullParser(events=('start', 'end'))
+        stack = []
+        try:
+            for chunk in self._chunks:
+                self.response_bytes += len(chunk)
+                parser.feed(chunk)
+                for order_reference in self._read_events(parser, stack):
+                    yield order_reference
+            parser.close()
+            for order_reference in self._read_events(parser, stack):
+                yield order_reference
+        except et.ParseError:
+            raise ValueError('Invalid XML.')
+        finally:
+            if self._close is not None:
+                self._close()
+
+    def _read_events(self, parser, stack):
+        for event, element in parser.read_events():
+            if event == 'start':
+                if not stack:
+                    self._ns = self._namespace(element)
+                stack.append(element)
+                continue
+            stack.pop()
+            tag = element.tag.replace(self._ns, '')
+            if tag == 'OrderReference' and stack and \
+                    stack[-1].tag == self._ns + 'OrderReferenceList':
+                yield self._etree_to_dict(element)['OrderReference']
+                element.clear()
+                stack[-1].remove(element)
+            elif tag == 'NextPageToken':
+                self.next_page_token = element.text
+            elif tag in ('RequestId', 'RequestID'):
+                self.request_id = element.text
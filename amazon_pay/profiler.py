@@ -0,0 +1,164 @@
+import sys
+import time
+import random
+import threading
+from collections import defaultdict
+
+
+class _NullPhase:
+
+    """Context manager used for calls that are not being profiled"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_PHASE = _NullPhase()
+
+
+class _Phase:
+
+    def __init__(self, profiler, action, name):
+        self._profiler = profiler
+        self._action = action
+        self._name = name
+
+    def __enter__(self):
+        stack = self._profiler._stack()
+        stack.append(self._name)
+        self._path = (self._action,) + tuple(stack)
+        self._blocks = sys.getallocatedblocks()
+        self._cpu = time.thread_time()
+        self._wall = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        wall = time.perf_counter() - self._wall
+        cpu = time.thread_time() - self._cpu
+        blocks = sys.getallocatedblocks() - self._blocks
+        self._profiler._stack().pop()
+        self._profiler._record(self._path, wall, cpu, blocks)
+        return False
+
+
+class Profiler:
+
+    """Attributes wall and CPU time spent inside the SDK to phases of each
+    Action. Pass an instance as AmazonPayClient(profiler=...).
+
+    Phases are querystring (building the request, including sign), sign,
+    http, parse (building the PaymentResponse), sanitize (log sanitizers) and
+    to_dict (PaymentResponse.to_dict/to_json). Phases nest, e.g. sign is
+    recorded inside querystring. Allocation counts are the net number of
+    memory blocks allocated by the interpreter while the phase ran, so they
+    include other threads' allocations.
+
+    Only a sample_rate share of calls is measured. Calls that are not
+    sampled pay a single random() call.
+    """
+
+    def __init__(self, sample_rate=1.0, seed=None):
+        """
+        Parameters
+        ----------
+        sample_rate : float, optional
+            Share of calls to profile, between 0 and 1. Default: 1.0
+
+        seed : integer, optional
+            Seed for the sampling decisions. Default: None
+        """
+        if not 0 <= sample_rate <= 1:
+            raise ValueError('Invalid sample_rate.')
+        self.sample_rate = sample_rate
+        self._random = random.Random(seed).random
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._data = defaultdict(lambda: [0, 0.0, 0.0, 0])
+        self.sampled_calls = 0
+
+    def sample(self):
+        """Return True if the next call should be profiled"""
+        if self.sample_rate < 1 and self._random() >= self.sample_rate:
+            return False
+        with self._lock:
+            self.sampled_calls += 1
+        return True
+
+    def phase(self, action, name):
+        """Context manager measuring one phase of action"""
+        return _Phase(self, action, name)
+
+    def reset(self):
+        """Drop all measurements"""
+        with self._lock:
+            self._data.clear()
+            self.sampled_calls = 0
+
+    def stats(self):
+        """Return the measurements keyed by (Action, phase, nested phase...)
+        with the keys calls, wall_s, cpu_s and alloc_blocks.
+        """
+        with self._lock:
+            data = dict(self._data)
+        return {path: {'calls': calls,
+                       'wall_s': wall,
+                       'cpu_s': cpu,
+                       'alloc_blocks': blocks}
+                for path, (calls, wall, cpu, blocks) in data.items()}
+
+    def report(self):
+        """Return a text table of the measurements, one row per phase"""
+        lines = ['{:<48} {:>8} {:>12} {:>12} {:>12} {:>10}'.format(
+            'action/phase', 'calls', 'wall ms', 'wall us/call',
+            'cpu us/call', 'blocks')]
+        for path, values in sorted(self.stats().items()):
+            calls = values['calls']
+            lines.append('{:<48} {:>8} {:>12.3f} {:>12.1f} {:>12.1f} {:>10}'.format(
+                '/'.join(path),
+                calls,
+                values['wall_s'] * 1e3,
+                values['wall_s'] / calls * 1e6,
+                values['cpu_s'] / calls * 1e6,
+                values['alloc_blocks']))
+        return '\n'.join(lines) + '\n'
+
+    def collapsed(self):
+        """Return the measurements in the collapsed stack format read by
+        flamegraph.pl and speedscope: one line per stack with its self wall
+        time in microseconds.
+        """
+        stats = self.stats()
+        children = defaultdict(float)
+        for path, values in stats.items():
+            if len(path) > 2:
+                children[path[:-1]] += values['wall_s']
+
+        lines = []
+        for path, values in sorted(stats.items()):
+            self_time = values['wall_s'] - children.get(path, 0.0)
+            micros = int(round(max(self_time, 0.0) * 1e6))
+            if micros:
+                lines.append('amazon_pay;{} {}'.format(';'.join(path), micros))
+        return '\n'.join(lines) + '\n' if lines else ''
+
+    def write_collapsed(self, path):
+        """Write collapsed() to a file"""
+        with open(path, 'w') as f:
+            f.write(self.collapsed())
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _record(self, path, wall, cpu, blocks):
+        with self._lock:
+            values = self._data[path]
+            values[0] += 1
+            values[1] += wall
+            values[2] += cpu
+            values[3] += blocks
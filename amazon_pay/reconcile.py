@@ -0,0 +1,317 @@
+import os
+import json
+import time
+import datetime
+import threading
+from decimal import Decimal
+from concurrent.futures import ThreadPoolExecutor
+from amazon_pay.order_index import OrderIndex, list_orders
+
+
+# (burst, restore rate per second) of the MWS calls a reconciliation makes,
+# per seller account.
+QUOTAS = {
+    'ListOrderReference': (10, 1.0),
+    'ListOrderReferenceByNextToken': (10, 1.0),
+    'GetOrderReferenceDetails': (20, 2.0),
+    'GetAuthorizationDetails': (20, 2.0),
+    'GetCaptureDetails': (20, 2.0),
+    'GetRefundDetails': (20, 2.0)}
+
+# States after which an object no longer changes. A Completed capture can
+# still be refunded, so only Closed and Declined are final for captures.
+FINAL_STATES = {
+    'order': ('Canceled', 'Closed'),
+    'authorization': ('Declined', 'Closed'),
+    'capture': ('Declined', 'Closed'),
+    'refund': ('Declined', 'Completed')}
+
+# Fields of a local record that are compared with Amazon's.
+FIELDS = ('state', 'amount', 'captured', 'refunded')
+
+
+def time_windows(start, end, size):
+    """Split [start, end) into consecutive windows of size seconds"""
+    step = datetime.timedelta(seconds=size)
+    while start < end:
+        yield start, min(start + step, end)
+        start += step
+
+
+class Quota:
+
+    """Token bucket per MWS Action. acquire blocks until a call of the Action
+    is allowed.
+    """
+
+    def __init__(self, quotas=None, clock=time.monotonic, sleep=time.sleep):
+        """
+        Parameters
+        ----------
+        quotas : dictionary, optional
+            (burst, restore rate per second) per Action, merged into QUOTAS.
+            Actions without a quota are not limited. Default: None
+        """
+        self.quotas = dict(QUOTAS)
+        self.quotas.update(quotas or {})
+        self._clock = clock
+        self._sleep = sleep
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, action):
+        quota = self.quotas.get(action)
+        if quota is None:
+            return
+        burst, rate = quota
+        while True:
+            with self._lock:
+                now = self._clock()
+                tokens, updated = self._buckets.get(action, (burst, now))
+                tokens = min(burst, tokens + (now - updated) * rate)
+                if tokens >= 1:
+                    self._buckets[action] = (tokens - 1, now)
+                    return
+                self._buckets[action] = (tokens, now)
+                wait = (1 - tokens) / rate
+            self._sleep(wait)
+
+
+class Difference:
+
+    """One difference between Amazon's view of an order and the local one.
+
+    Properties
+    ----------
+    order_id : string
+        AmazonOrderReferenceId.
+
+    field : string
+        One of FIELDS, or None if the order is missing locally.
+
+    amazon, local : string
+        The differing values.
+    """
+
+    def __init__(self, order_id, field=None, amazon=None, local=None):
+        self.order_id = order_id
+        self.field = field
+        self.amazon = amazon
+        self.local = local
+
+    def to_dict(self):
+        return {'order_id': self.order_id, 'field': self.field,
+                'amazon': self.amazon, 'local': self.local}
+
+    def __repr__(self):
+        return 'Difference({!r}, {!r}, {!r}, {!r})'.format(
+            self.order_id, self.field, self.amazon, self.local)
+
+
+class Reconciler:
+
+    """Compares the orders Amazon Pay lists for a query ID with a local
+    order database.
+
+    The created-time range is split into windows that are listed
+    concurrently. Order and payment details are only fetched for objects
+    that are new, were updated since they were indexed, or are not in a
+    final state; everything else is answered by the OrderIndex. Windows are
+    recorded in a JSON checkpoint file as their differences are yielded, so
+    an interrupted run resumes where it stopped.
+    """
+
+    def __init__(self, client, local, index=None, window=3600, workers=4,
+                 quotas=None, checkpoint_path=None, page_size=100):
+        """
+        Parameters
+        ----------
+        client : AmazonPayClient, required
+            Client to call MWS with.
+
+        local : mapping, required
+            The local order database: local.get(AmazonOrderReferenceId)
+            returns None or a dictionary with any of the keys state, amount,
+            captured and refunded. Only the keys present are compared.
+
+        index : OrderIndex, optional
+            Index of the orders seen so far. Default: client.order_index, or
+            a new in-memory OrderIndex
+
+        window : integer, optional
+            Seconds of created time listed per window. Default: 3600
+
+        workers : integer, optional
+            Number of windows scanned concurrently. Default: 4
+
+        quotas : dictionary, optional
+            Overrides of QUOTAS; an Action mapped to None is not limited.
+            Default: None
+
+        checkpoint_path : string, optional
+            JSON file recording the scanned windows. Default: None
+
+        page_size : integer, optional
+            Orders per list page. Default: 100
+        """
+        self.client = client
+        self.local = local
+        if index is None:
+            index = client.order_index if client.order_index is not None \
+                else OrderIndex()
+        self.index = index
+        self.window = window
+        self.workers = workers
+        self.quota = Quota(quotas)
+        self.checkpoint_path = checkpoint_path
+        self.page_size = page_size
+        self.stats = {'windows': 0, 'orders': 0, 'fetched': 0, 'calls': 0}
+        self._stats_lock = threading.Lock()
+        self._thread = threading.local()
+
+    def reconcile(self, query_id, start, end, query_id_type='SellerOrderId',
+                  merchant_id=None, mws_auth_token=None):
+        """Yield a Difference for every order created between the start and
+        end datetimes whose Amazon state differs from the local one.
+        """
+        kwargs = {'merchant_id': merchant_id,
+                  'mws_auth_token': mws_auth_token}
+        query = '{}:{}'.format(query_id_type, query_id)
+        done = self._load_checkpoint(query)
+        windows = [w for w in time_windows(start, end, self.window)
+                   if self._window_key(w) not in done]
+
+        self.client.hooks.register('before_sign', self._acquire)
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                futures = [executor.submit(
+                    self._scan, query_id, query_id_type, w, kwargs)
+                    for w in windows]
+                try:
+                    for window, future in zip(windows, futures):
+                        for difference in future.result():
+                            yield difference
+                        done.add(self._window_key(window))
+                        self._save_checkpoint(query, done)
+                finally:
+                    for future in futures:
+                        future.cancel()
+        finally:
+            self.client.hooks.unregister('before_sign', self._acquire)
+
+    def _acquire(self, event):
+        if getattr(self._thread, 'active', False):
+            self.quota.acquire(event.action)
+            with self._stats_lock:
+                self.stats['calls'] += 1
+
+    def _scan(self, query_id, query_id_type, window, kwargs):
+        self._thread.active = True
+        try:
+            differences = []
+            for summary in list_orders(self.client, query_id, query_id_type,
+                                       window[0], window[1], self.page_size,
+                                       **kwargs):
+                order_id = summary['AmazonOrderReferenceId']
+                fetched = self._refresh(order_id, summary, kwargs)
+                with self._stats_lock:
+                    self.stats['orders'] += 1
+                    self.stats['fetched'] += fetched
+                differences.extend(self._compare(order_id))
+            with self._stats_lock:
+                self.stats['windows'] += 1
+            return differences
+        finally:
+            self._thread.active = False
+
+    def _refresh(self, order_id, summary, kwargs):
+        """Fetch the details of the order and of its payments that may have
+        changed since they were indexed. Returns the number of calls made.
+        """
+        status = summary.get('OrderReferenceStatus') or {}
+        known = self.index.order(order_id)
+        payments = self.index.payments(order_id)
+        if known is not None and \
+                known['updated'] == status.get('LastUpdateTimestamp') and \
+                known['state'] in FINAL_STATES['order'] and \
+                all(self._final(p) for p in payments):
+            return 0
+
+        calls = 1
+        self._record(self.client.get_order_reference_details(
+            amazon_order_reference_id=order_id, **kwargs))
+        for kind, method, name in (
+                ('authorization', self.client.get_authorization_details,
+                 'amazon_authorization_id'),
+                ('capture', self.client.get_capture_details,
+                 'amazon_capture_id'),
+                ('refund', self.client.get_refund_details,
+                 'amazon_refund_id')):
+            for payment in self.index.payments(order_id, kind=kind):
+                if not self._final(payment):
+                    calls += 1
+                    self._record(method(**dict(
+                        kwargs, **{name: payment['object_id']})))
+        return calls
+
+    def _record(self, response):
+        if not response.success:
+            raise ValueError('Fetching details failed: {}'.format(
+                response.to_xml()))
+        if self.index is not self.client.order_index:
+            self.index.record_response(response)
+
+    def _final(self, payment):
+        return payment['state'] in FINAL_STATES[payment['kind']]
+
+    def _amazon_values(self, order_id):
+        order = self.index.order(order_id)
+        values = {'state': order['state'], 'amount': order['amount']}
+        for kind, field in (('capture', 'captured'), ('refund', 'refunded')):
+            values[field] = str(sum(
+                (Decimal(p['amount']) for p in self.index.payments(
+                    order_id, kind=kind)
+                 if p['amount'] is not None and
+                 p['state'] in ('Completed', 'Closed')),
+                Decimal('0')))
+        return values
+
+    def _compare(self, order_id):
+        local = self.local.get(order_id)
+        if local is None:
+            return [Difference(order_id)]
+        amazon = self._amazon_values(order_id)
+        differences = []
+        for field in FIELDS:
+            if field not in local:
+                continue
+            if field == 'state':
+                equal = local[field] == amazon[field]
+            else:
+                equal = Decimal(str(local[field])) == Decimal(
+                    amazon[field] or '0')
+            if not equal:
+                differences.append(Difference(
+                    order_id, field, amazon[field], local[field]))
+        return differences
+
+    def _window_key(self, window):
+        return '{}/{}'.format(window[0].isoformat(), window[1].isoformat())
+
+    def _load_checkpoint(self, query):
+        if self.checkpoint_path is None or \
+                not os.path.exists(self.checkpoint_path):
+            return set()
+        with open(self.checkpoint_path) as checkpoint:
+            data = json.load(checkpoint)
+        if data.get('query') != query:
+            return set()
+        return set(data.get('done', ()))
+
+    def _save_checkpoint(self, query, done):
+        if self.checkpoint_path is None:
+            return
+        temporary = self.checkpoint_path + '.tmp'
+        with open(temporary, 'w') as checkpoint:
+            json.dump({'query': query, 'done': sorted(done)}, checkpoint)
+        os.replace(temporary, self.checkpoint_path)
@@ -0,0 +1,300 @@
+import re
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from amazon_pay.payment_response import PaymentResponse
+from amazon_pay.singleflight import read_key
+
+
+# Seconds a successful response of each read-only Action is served from the
+# cache. Actions missing here are never cached.
+DEFAULT_TTLS = {
+    'GetOrderReferenceDetails': 30,
+    'GetAuthorizationDetails': 30,
+    'GetCaptureDetails': 30,
+    'GetRefundDetails': 30,
+    'GetBillingAgreementDetails': 30,
+    'GetMerchantAccountStatus': 300}
+
+# Request parameters holding the ID of an Amazon object.
+OBJECT_ID_PARAMS = ('AmazonOrderReferenceId', 'AmazonAuthorizationId',
+                    'AmazonCaptureId', 'AmazonRefundId',
+                    'AmazonBillingAgreementId', 'Id')
+
+# Amazon object IDs, e.g. P01-1234567-1234567 for an order reference and
+# P01-1234567-1234567-A123456 for one of its authorizations. The first
+# three groups are the order root shared by the order and its children.
+OBJECT_ID = re.compile(r'^([A-Z]\d{2}-\d{7}-\d{7})(-[A-Z]?\d{6,7})?$')
+
+
+def object_root(object_id):
+    """Return the order or billing agreement root of an object ID"""
+    match = OBJECT_ID.match(object_id)
+    return match.group(1) if match else object_id
+
+
+class CacheBackend:
+
+    """Stores cached responses. Every entry is indexed under the roots of
+    the object IDs it belongs to, so that invalidate(root) drops it.
+    """
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, xml, ttl, roots):
+        raise NotImplementedError
+
+    def invalidate(self, root):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class MemoryCacheBackend(CacheBackend):
+
+    """In-process LRU cache bounded to max_entries responses"""
+
+    def __init__(self, max_entries=1000, clock=time.time):
+        """
+        Parameters
+        ----------
+        max_entries : integer, optional
+            Number of responses to keep. Default: 1000
+
+        clock : callable, optional
+            Returns the current time in seconds. Default: time.time
+        """
+        self.max_entries = max_entries
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._roots = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= self._clock():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, xml, ttl, roots):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (xml, self._clock() + ttl, roots)
+            for root in roots:
+                self._roots.setdefault(root, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, root):
+        with self._lock:
+            keys = list(self._roots.get(root, ()))
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._roots.clear()
+
+    def _remove(self, key):
+        xml, expires, roots = self._entries.pop(key)
+        for root in roots:
+            keys = self._roots.get(root)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._roots[root]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SqliteCacheBackend(CacheBackend):
+
+    """Cache kept in an SQLite database, shared by the processes on a host"""
+
+    def __init__(self, path, max_entries=10000, clock=time.time):
+        """
+        Parameters
+        ----------
+        path : string, required
+            Database file, created if missing.
+
+        max_entries : integer, optional
+            Number of responses to keep. Default: 10000
+
+        clock : callable, optional
+            Returns the current time in seconds. Default: time.time
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False,
+                                   isolation_level=None)
+        if path != ':memory:':
+            self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS cache ('
+            'key TEXT PRIMARY KEY, response TEXT, expires REAL, used REAL)')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS cache_roots (root TEXT, key TEXT)')
+        self._db.execute(
+            'CREATE INDEX IF NOT EXISTS cache_roots_root '
+            'ON cache_roots (root)')
+        self._db.execute(
+            'CREATE INDEX IF NOT EXISTS cache_roots_key ON cache_roots (key)')
+        self._db.execute(
+            'CREATE INDEX IF NOT EXISTS cache_used ON cache (used)')
+
+    def get(self, key):
+        now = self._clock()
+        with self._lock:
+            row = self._db.execute(
+                'SELECT response, expires FROM cache WHERE key = ?',
+                (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                self._remove(key)
+                return None
+            self._db.execute(
+                'UPDATE cache SET used = ? WHERE key = ?', (now, key))
+            return row[0]
+
+    def set(self, key, xml, ttl, roots):
+        now = self._clock()
+        with self._lock:
+            self._db.execute('BEGIN')
+            try:
+                self._remove(key)
+                self._db.execute(
+                    'INSERT INTO cache VALUES (?, ?, ?, ?)',
+                    (key, xml, now + ttl, now))
+                self._db.executemany(
+                    'INSERT INTO cache_roots VALUES (?, ?)',
+                    [(root, key) for root in roots])
+                excess = self._db.execute(
+                    'SELECT COUNT(*) FROM cache').fetchone()[0] - \
+                    self.max_entries
+                if excess > 0:
+                    for (old_key,) in self._db.execute(
+                            'SELECT key FROM cache ORDER BY used LIMIT ?',
+                            (excess,)).fetchall():
+                        self._remove(old_key)
+                self._db.execute('COMMIT')
+            except BaseException:
+                self._db.execute('ROLLBACK')
+                raise
+
+    def invalidate(self, root):
+        with self._lock:
+            keys = [key for (key,) in self._db.execute(
+                'SELECT key FROM cache_roots WHERE root = ?',
+                (root,)).fetchall()]
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._db.execute('DELETE FROM cache')
+            self._db.execute('DELETE FROM cache_roots')
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _remove(self, key):
+        self._db.execute('DELETE FROM cache WHERE key = ?', (key,))
+        self._db.execute('DELETE FROM cache_roots WHERE key = ?', (key,))
+
+
+class ResponseCache:
+
+    """Read-through cache for the read-only API calls of AmazonPayClient.
+
+    Successful responses of the Actions in ttls are kept for their TTL.
+    Calls of any other Action that carry an object ID, e.g. capture or
+    close_order_reference, invalidate everything cached for that ID's order
+    or billing agreement. Call invalidate with the IDs of an IPN
+    (IpnHandler.object_ids()) to drop state changed on Amazon's side.
+    """
+
+    def __init__(self, backend=None, ttls=None):
+        """
+        Parameters
+        ----------
+        backend : CacheBackend, optional
+            Where responses are kept. Default: MemoryCacheBackend()
+
+        ttls : dictionary, optional
+            Seconds to cache each Action, merged into DEFAULT_TTLS. A TTL of
+            0 or None disables caching for that Action. Default: None
+        """
+        self.backend = backend if backend is not None \
+            else MemoryCacheBackend()
+        self.ttls = dict(DEFAULT_TTLS)
+        self.ttls.update(ttls or {})
+        self.hits = 0
+        self.misses = 0
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def call(self, params, merchant_id, send):
+        """Return the cached response for params or the response of send()"""
+        roots = {object_root(params[name]) for name in OBJECT_ID_PARAMS
+                 if params.get(name)}
+        action = params.get('Action')
+        if action not in self.ttls:
+            if not roots:
+                return send()
+            try:
+                return send()
+            finally:
+                self.invalidate(*roots)
+
+        ttl = self.ttls[action]
+        if not ttl:
+            return send()
+        key = read_key(params, merchant_id, self.ttls)
+        xml = self.backend.get(key)
+        if xml is not None:
+            with self._lock:
+                self.hits += 1
+            return PaymentResponse(xml)
+
+        with self._lock:
+            self.misses += 1
+            generation = self._generation
+        response = send()
+        if response.success:
+            with self._lock:
+                if generation == self._generation:
+                    self.backend.set(key, response.to_xml(), ttl, roots)
+        return response
+
+    def invalidate(self, *object_ids):
+        """Drop every cached response of the orders or billing agreements
+        the object IDs belong to. Returns the number of dropped responses.
+        """
+        with self._lock:
+            self._generation += 1
+            return sum(self.backend.invalidate(root) for root in
+                       {object_root(object_id) for object_id in object_ids})
+
+    def clear(self):
+        """Drop every cached response"""
+        with self._lock:
+            self._generation += 1
+            self.backend.clear()
@@ -0,0 +1,79 @@
+import json
+import hashlib
+import threading
+
+
+# Read-only Actions whose concurrent identical calls may share one request.
+COALESCED_ACTIONS = ('GetOrderReferenceDetails', 'GetAuthorizationDetails',
+                     'GetCaptureDetails', 'GetRefundDetails',
+                     'GetBillingAgreementDetails', 'GetMerchantAccountStatus',
+                     'GetServiceStatus')
+# Parameters that are hashed before they become part of a key.
+TOKEN_PARAMS = ('MWSAuthToken', 'AccessToken', 'AddressConsentToken')
+
+
+def read_key(params, merchant_id, actions=COALESCED_ACTIONS):
+    """Return the key of a read request, or None if its Action is not in
+    actions. The key covers every parameter, with tokens hashed.
+    """
+    if params.get('Action') not in actions:
+        return None
+    items = dict(params)
+    items.setdefault('SellerId', merchant_id)
+    for name in TOKEN_PARAMS:
+        if items.get(name) is not None:
+            items[name] = hashlib.sha256(
+                items[name].encode('utf-8')).hexdigest()
+    return json.dumps(sorted(items.items()))
+
+
+class _Call:
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+
+    """Runs at most one call per key at a time. Callers arriving while a call
+    for their key is running wait for it and receive the same result or
+    exception instead of running their own.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.shared = 0
+
+    def do(self, key, func):
+        """Return func(), or the result of the running call for key"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.shared += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+            return call.result
+        except BaseException as ex:
+            call.error = ex
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def in_flight(self):
+        """Number of keys with a running call"""
+        with self._lock:
+            return len(self._calls)
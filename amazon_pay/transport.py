@@ -0,0 +1,265 @@
+import gzip
+import json
+import time
+import threading
+import requests
+from urllib import parse
+from collections import defaultdict, deque
+
+
+class Transport:
+
+    """Sends a signed request body to MWS. Pass an instance to
+    AmazonPayClient(transport=...) to replace the default requests.post call.
+    post receives the client's timeout and must return an object with a
+    status_code and the response body as bytes in content, like
+    requests.Response.
+    """
+
+    def post(self, url, data, headers, timeout=None):
+        raise NotImplementedError
+
+
+class TransportResponse:
+
+    """Minimal stand-in for requests.Response used by replayed calls"""
+
+    def __init__(self, status_code, content, headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+        self.encoding = 'utf-8'
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding or 'utf-8')
+
+
+class RequestsTransport(Transport):
+
+    """Default transport, posting with requests"""
+
+    def post(self, url, data, headers, timeout=None):
+        return requests.post(url=url, data=data, headers=headers, verify=True,
+                             timeout=timeout)
+
+
+# Request parameters that change on every call or identify the caller.
+VOLATILE_PARAMS = ('AWSAccessKeyId', 'Signature', 'SignatureMethod',
+                   'SignatureVersion', 'Timestamp', 'Version')
+SECRET_PARAMS = ('AWSAccessKeyId', 'Signature', 'MWSAuthToken',
+                 'AccessToken', 'AddressConsentToken')
+# Request parameters holding buyer facing free text, matching the fields
+# removed by PaymentRequest._sanitize_request_data.
+PII_PARAMS = ('SellerNote', 'SellerAuthorizationNote', 'SellerCaptureNote',
+              'SellerRefundNote')
+
+
+def redact_params(params):
+    """Return a copy of params with secrets and buyer facing notes removed"""
+    redacted = {}
+    for key, value in params.items():
+        name = key.rsplit('.', 1)[-1]
+        if key in SECRET_PARAMS or name in PII_PARAMS:
+            value = 'REMOVED'
+        redacted[key] = value
+    return redacted
+
+
+def request_key(params):
+    """Key used to match a request against recorded calls"""
+    return json.dumps(
+        sorted((k, v) for k, v in redact_params(params).items()
+               if k not in VOLATILE_PARAMS))
+
+
+def _open(path, mode):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+class RecordingTransport(Transport):
+
+    """Passes every call to another transport and appends the request and
+    response to a cassette file, one JSON object per line. Secrets and
+    buyer data are redacted with the SDK's sanitizers before anything is
+    written. Cassettes whose name ends in .gz are gzip compressed.
+    """
+
+    def __init__(self, cassette_path, transport=None):
+        """
+        Parameters
+        ----------
+        cassette_path : string, required
+            File to append recorded calls to.
+
+        transport : Transport, optional
+            Transport that really sends the requests.
+            Default: RequestsTransport()
+        """
+        self.cassette_path = cassette_path
+        self._transport = transport or RequestsTransport()
+        self._lock = threading.Lock()
+        self._started = time.time()
+
+    def post(self, url, data, headers, timeout=None):
+        from amazon_pay.payment_request import PaymentRequest
+        params = dict(parse.parse_qsl(data.decode('utf-8'),
+                                      keep_blank_values=True))
+        entry = {'offset': round(time.time() - self._started, 6),
+                 'params': redact_params(params),
+                 'request_bytes': len(data)}
+        started = time.perf_counter()
+        try:
+            r = self._transport.post(url, data, headers, timeout=timeout)
+        except requests.exceptions.RequestException as ex:
+            entry['elapsed'] = round(time.perf_counter() - started, 6)
+            entry['error'] = type(ex).__name__
+            self._write(entry)
+            raise
+        entry['elapsed'] = round(time.perf_counter() - started, 6)
+        entry['status'] = r.status_code
+        entry['body'] = PaymentRequest._sanitize_response_data(
+            r.content.decode('utf-8'))
+        entry['response_bytes'] = len(r.content)
+        self._write(entry)
+        return r
+
+    def _write(self, entry):
+        line = json.dumps(entry, ensure_ascii=False, sort_keys=True)
+        with self._lock:
+            with _open(self.cassette_path, 'a') as f:
+                f.write(line + '\n')
+
+
+def load_cassette(cassette_path):
+    """Return the recorded calls of a cassette as a list of dictionaries"""
+    with _open(cassette_path, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class ReplayTransport(Transport):
+
+    """Answers requests from a cassette written by RecordingTransport without
+    any network access. Requests are matched on their parameters, ignoring
+    the signature, timestamp and redacted values. Identical requests are
+    answered in recorded order; once the recordings for a request are used
+    up the last one is repeated.
+    """
+
+    def __init__(self, cassette_path, timing_scale=None):
+        """
+        Parameters
+        ----------
+        cassette_path : string, required
+            Cassette written by RecordingTransport.
+
+        timing_scale : float, optional
+            Sleep for the recorded network time multiplied by this factor
+            before answering, e.g. 1.0 for original timings. None answers
+            immediately. Default: None
+        """
+        self.timing_scale = timing_scale
+        self.entries = load_cassette(cassette_path)
+        self._lock = threading.Lock()
+        self._recorded = defaultdict(deque)
+        for entry in self.entries:
+            self._recorded[request_key(entry['params'])].append(entry)
+
+    def post(self, url, data, headers, timeout=None):
+        params = dict(parse.parse_qsl(data.decode('utf-8'),
+                                      keep_blank_values=True))
+        key = request_key(params)
+        with self._lock:
+            recorded = self._recorded.get(key)
+            if not recorded:
+                raise ValueError(
+                    'No recorded response for {} request.'.format(
+                        params.get('Action')))
+            entry = recorded.popleft() if len(recorded) > 1 else recorded[0]
+
+        if self.timing_scale:
+            time.sleep(entry['elapsed'] * self.timing_scale)
+        if 'error' in entry:
+            raise getattr(requests.exceptions, entry['error'],
+                          requests.exceptions.RequestException)()
+        return TransportResponse(entry['status'], entry['body'].encode('utf-8'))
+
+
+def replay_traffic(client, cassette_path, speed=None, workers=8):
+    """Re-issue every call recorded in a cassette through client, which
+    would normally use a ReplayTransport for the same cassette, and return
+    throughput, CPU and latency figures for the run.
+
+    Parameters
+    ----------
+    client : AmazonPayClient, required
+        Client to send the calls with.
+
+    cassette_path : string, required
+        Cassette written by RecordingTransport.
+
+    speed : float, optional
+        Issue calls at their recorded offsets divided by speed, e.g. 2.0
+        replays at twice the recorded rate. None sends them as fast as the
+        workers allow. Default: None
+
+    workers : integer, optional
+        Number of threads issuing calls. Default: 8
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    entries = load_cassette(cassette_path)
+    latencies = defaultdict(list)
+    failures = defaultdict(int)
+    lock = threading.Lock()
+
+    def issue(entry):
+        params = {k: v for k, v in entry['params'].items()
+                  if k not in VOLATILE_PARAMS}
+        action = params.get('Action')
+        started = time.perf_counter()
+        try:
+            response = client._operation(params=params)
+            success = response.success
+        except Exception:
+            success = False
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies[action].append(elapsed)
+            if not success:
+                failures[action] += 1
+
+    cpu_started = time.process_time()
+    wall_started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for entry in entries:
+            if speed:
+                delay = entry['offset'] / speed - (
+                    time.perf_counter() - wall_started)
+                if delay > 0:
+                    time.sleep(delay)
+            executor.submit(issue, entry)
+    wall = time.perf_counter() - wall_started
+    try:
+        import resource
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    except ImportError:
+        max_rss = None
+
+    actions = {}
+    for action, values in latencies.items():
+        values.sort()
+        actions[action] = {
+            'count': len(values),
+            'failures': failures[action],
+            'p50_s': values[len(values) // 2],
+            'p95_s': values[min(int(len(values) * 0.95), len(values) - 1)],
+            'max_s': values[-1]}
+    return {'calls': len(entries),
+            'wall_s': wall,
+            'cpu_s': time.process_time() - cpu_started,
+            'calls_per_sec': len(entries) / wall if wall else None,
+            'max_rss_kb': max_rss,
+            'actions': actions}
@@ -0,0 +1,64 @@
+import itertools
+from amazon_pay.client import AmazonPayClient
+from amazon_pay.local_mws import LocalMwsServer
+from benchmarks.harness import Benchmark
+
+
+def _client(server):
+    return AmazonPayClient(
+        mws_access_key=server.mws_access_key,
+        mws_secret_key=server.mws_secret_key,
+        merchant_id='merchant_id',
+        region='na',
+        currency_code='USD',
+        handle_throttle=False,
+        mws_endpoint=server.endpoint)
+
+
+def _paid_order(client):
+    """Create an order with one authorization, capture and refund"""
+    order_id = 'S01-9999999-0000001'
+    client.set_order_reference_details(
+        amazon_order_reference_id=order_id, order_total='10.00')
+    client.confirm_order_reference(amazon_order_reference_id=order_id)
+    authorization_id = client.authorize(
+        amazon_order_reference_id=order_id,
+        authorization_reference_id='bench-auth',
+        authorization_amount='10.00').to_dict()['AuthorizeResponse'][
+            'AuthorizeResult']['AuthorizationDetails']['AmazonAuthorizationId']
+    capture_id = client.capture(
+        amazon_authorization_id=authorization_id,
+        capture_reference_id='bench-capture',
+        capture_amount='10.00').to_dict()['CaptureResponse'][
+            'CaptureResult']['CaptureDetails']['AmazonCaptureId']
+    client.refund(
+        amazon_capture_id=capture_id,
+        refund_reference_id='bench-refund',
+        refund_amount='1.00')
+    return order_id
+
+
+def benchmarks(context):
+    server = context.get(
+        'local_mws', lambda: LocalMwsServer(seed=1).start(),
+        lambda server: server.stop())
+    client = _client(server)
+    order_id = _paid_order(client)
+    sequence = itertools.count(1)
+
+    def charge():
+        number = next(sequence)
+        client.charge(
+            amazon_reference_id='S01-{:07d}-0000002'.format(number),
+            charge_amount='5.00',
+            authorize_reference_id='bench-charge-{}'.format(number),
+            charge_note='benchmark')
+
+    return [
+        Benchmark('client.operation.get_order_reference_details',
+                  lambda: client.get_order_reference_details(
+                      amazon_order_reference_id=order_id)),
+        Benchmark('client.charge', charge),
+        Benchmark('client.get_payment_details',
+                  lambda: client.get_payment_details(
+                      amazon_order_reference_id=order_id))]
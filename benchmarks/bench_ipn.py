@@ -0,0 +1,58 @@
+import json
+import base64
+import asyncio
+from amazon_pay.ipn_handler import IpnHandler, NOTIFICATION_SIGNED_FIELDS
+from amazon_pay.ipn_async import AsyncIpnHandler, AsyncCertificateStore
+from amazon_pay.ipn_signature import SignatureVerifier
+from amazon_pay.ipn_replay import IpnReplayer, offline_certificate_store
+from benchmarks.harness import Benchmark, fixture
+
+
+def benchmarks(context):
+    notification = json.loads(fixture('ipn_order_reference_notification.json'))
+    body = notification['body'].encode('utf-8')
+    headers = notification['headers']
+    pem = fixture('sns_signing_cert.pem')
+
+    def verify():
+        handler = IpnHandler(body, headers)
+        handler._validate_header()
+        handler._validate_cert_url()
+        handler._pem = pem
+        handler._validate_signature()
+
+    # Single-threaded, so ops/sec is verifications per second per core
+    verifier = SignatureVerifier()
+    signed = IpnHandler(body, headers)
+    signature = base64.b64decode(signed._signature)
+    signing_string = ''.join(
+        '{}\n{}\n'.format(name, signed._payload[name])
+        for name in NOTIFICATION_SIGNED_FIELDS
+        if name in signed._payload).encode('utf-8')
+
+    store = AsyncCertificateStore()
+    store.put(json.loads(notification['body'])['SigningCertURL'], pem)
+    loop = context.get('ipn_async_loop', asyncio.new_event_loop,
+                       lambda loop: loop.close())
+
+    async def verify_batch():
+        await asyncio.gather(*(
+            AsyncIpnHandler(body, headers,
+                            certificate_store=store).authenticate()
+            for _ in range(100)))
+
+    replayer = IpnReplayer(certificate_store=offline_certificate_store(
+        {json.loads(notification['body'])['SigningCertURL']: pem}))
+    backlog = [json.dumps({'body': notification['body'],
+                           'headers': headers})] * 100
+
+    handler = IpnHandler(body, headers)
+    return [
+        Benchmark('ipn.parse', lambda: IpnHandler(body, headers).to_dict()),
+        Benchmark('ipn.verify', verify),
+        Benchmark('ipn.signature.verify',
+                  lambda: verifier.verify(pem, signature, signing_string)),
+        Benchmark('ipn.verify_async',
+                  lambda: loop.run_until_complete(verify_batch()), ops=100),
+        Benchmark('ipn.replay', lambda: replayer.replay(backlog), ops=100),
+        Benchmark('ipn.to_json', handler.to_json)]
@@ -0,0 +1,96 @@
+import json
+import asyncio
+import threading
+import http.client
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import make_server, WSGIServer, \
+    WSGIRequestHandler
+from concurrent.futures import ThreadPoolExecutor
+from amazon_pay.certificate_store import CertificateStore
+from amazon_pay.ipn_app import IpnWsgiApp, IpnAsgiApp
+from benchmarks.harness import Benchmark, fixture
+
+
+# Concurrent requests per benchmark call
+CONCURRENCY = 16
+
+
+class _ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def _serve(app):
+    server = make_server('127.0.0.1', 0, app, _ThreadingWSGIServer,
+                         _QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _stop(server):
+    server.shutdown()
+    server.server_close()
+
+
+def benchmarks(context):
+    notification = json.loads(fixture('ipn_order_reference_notification.json'))
+    body = notification['body'].encode('utf-8')
+    headers = notification['headers']
+    headers['Content-Length'] = str(len(body))
+    store = CertificateStore()
+    store.put(json.loads(notification['body'])['SigningCertURL'],
+              fixture('sns_signing_cert.pem'))
+
+    server = context.get(
+        'ipn_wsgi_server',
+        lambda: _serve(IpnWsgiApp(certificate_store=store)), _stop)
+    port = server.server_address[1]
+    clients = context.get(
+        'ipn_clients', lambda: ThreadPoolExecutor(CONCURRENCY),
+        lambda executor: executor.shutdown())
+
+    def post():
+        connection = http.client.HTTPConnection('127.0.0.1', port)
+        try:
+            connection.request('POST', '/ipn', body, headers)
+            return connection.getresponse().status
+        finally:
+            connection.close()
+
+    def wsgi():
+        for status in clients.map(lambda _: post(), range(CONCURRENCY)):
+            assert status == 200, status
+
+    asgi_app = IpnAsgiApp(certificate_store=store)
+    scope = {'type': 'http', 'method': 'POST',
+             'headers': [(name.lower().encode(), value.encode())
+                         for name, value in headers.items()]}
+
+    async def asgi_request():
+        sent = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': body}
+
+        async def send(message):
+            sent.append(message)
+
+        await asgi_app(scope, receive, send)
+        assert sent[0]['status'] == 200, sent[0]
+
+    async def asgi_batch():
+        await asyncio.gather(*(asgi_request() for _ in range(CONCURRENCY)))
+
+    loop = context.get('ipn_asgi_loop', asyncio.new_event_loop,
+                       lambda loop: loop.close())
+
+    return [
+        Benchmark('ipn_app.wsgi', wsgi, ops=CONCURRENCY),
+        Benchmark('ipn_app.asgi',
+                  lambda: loop.run_until_complete(asgi_batch()),
+                  ops=CONCURRENCY)]
@@ -0,0 +1,32 @@
+from amazon_pay.payment_request import PaymentRequest
+from amazon_pay.payment_response import PaymentResponse, \
+    OrderReferenceStream
+from benchmarks.harness import Benchmark, fixture
+from benchmarks.bench_signing import CONFIG, SMALL_PARAMS
+
+
+def benchmarks(context):
+    small = fixture('get_order_reference_details.xml')
+    large = fixture('list_order_reference_200.xml')
+    large_bytes = large.encode('utf-8')
+    large_chunks = [large_bytes[i:i + 16384]
+                    for i in range(0, len(large_bytes), 16384)]
+    small_response = PaymentResponse(small)
+    large_response = PaymentResponse(large)
+    request = PaymentRequest(params=SMALL_PARAMS, config=CONFIG)
+    return [
+        Benchmark('parse.response.small', lambda: PaymentResponse(small)),
+        Benchmark('parse.response.large', lambda: PaymentResponse(large)),
+        Benchmark('parse.response.large.bytes',
+                  lambda: PaymentResponse(large_bytes)),
+        Benchmark('parse.stream.large',
+                  lambda: list(OrderReferenceStream(large_chunks))),
+        Benchmark('parse.stream.first.large',
+                  lambda: next(iter(OrderReferenceStream(large_chunks)))),
+        Benchmark('parse.to_dict.small', small_response.to_dict),
+        Benchmark('parse.to_dict.large', large_response.to_dict),
+        Benchmark('parse.to_json.large', large_response.to_json),
+        Benchmark('sanitize.response.small',
+                  lambda: request._sanitize_response_data(small)),
+        Benchmark('sanitize.response.large',
+                  lambda: request._sanitize_response_data(large))]
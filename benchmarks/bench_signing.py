@@ -0,0 +1,46 @@
+from amazon_pay.payment_request import PaymentRequest
+from benchmarks.harness import Benchmark
+
+
+CONFIG = {'mws_access_key': 'mws_access_key',
+          'mws_secret_key': 'mws_secret_key',
+          'api_version': '2013-01-01',
+          'merchant_id': 'merchant_id',
+          'mws_endpoint':
+              'https://mws.amazonservices.com/OffAmazonPayments/2013-01-01',
+          'headers': {},
+          'handle_throttle': False}
+
+SMALL_PARAMS = {'Action': 'GetOrderReferenceDetails',
+                'AmazonOrderReferenceId': 'S01-1234567-7654321'}
+
+LARGE_PARAMS = dict(
+    {'Action': 'SetOrderAttributes',
+     'AmazonOrderReferenceId': 'S01-1234567-7654321',
+     'OrderAttributes.OrderTotal.Amount': '42.50',
+     'OrderAttributes.OrderTotal.CurrencyCode': 'USD',
+     'OrderAttributes.SellerNote': 'Please gift wrap * with care ~ thanks',
+     'OrderAttributes.SellerOrderAttributes.SellerOrderId': 'ORDER-42',
+     'OrderAttributes.SellerOrderAttributes.StoreName': 'Example Store',
+     'OrderAttributes.SellerOrderAttributes.CustomInformation':
+         'customer-1001 & friends'},
+    **{'OrderAttributes.SellerOrderAttributes.OrderItemCategories.'
+       'OrderItemCategory.{}'.format(i): 'Category {}'.format(i)
+       for i in range(1, 21)})
+
+
+def benchmarks(context):
+    request = PaymentRequest(params=SMALL_PARAMS, config=CONFIG)
+    string_to_sign = 'POST\nmws.amazonservices.com\n' \
+        '/OffAmazonPayments/2013-01-01\n' + \
+        request._querystring(SMALL_PARAMS).decode()
+    querystring = request._querystring(LARGE_PARAMS).decode()
+    return [
+        Benchmark('signing.sign',
+                  lambda: request._sign(string_to_sign)),
+        Benchmark('signing.querystring.small',
+                  lambda: request._querystring(SMALL_PARAMS)),
+        Benchmark('signing.querystring.large',
+                  lambda: request._querystring(LARGE_PARAMS)),
+        Benchmark('sanitize.request',
+                  lambda: request._sanitize_request_data(querystring))]
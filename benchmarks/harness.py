@@ -0,0 +1,151 @@
+import os
+import sys
+import json
+import math
+import timeit
+import platform
+import datetime
+import subprocess
+import amazon_pay.version as ap_version
+
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def fixture(name, mode='r'):
+    """Return the content of a file in benchmarks/fixtures"""
+    with open(os.path.join(FIXTURES, name), mode) as f:
+        return f.read()
+
+
+class Context:
+
+    """Resources shared between benchmarks, e.g. a running LocalMwsServer.
+    Resources are created on first use and released by close().
+    """
+
+    def __init__(self):
+        self._resources = {}
+        self._closers = []
+
+    def get(self, name, factory, close=None):
+        if name not in self._resources:
+            self._resources[name] = factory()
+            if close is not None:
+                self._closers.append(
+                    lambda: close(self._resources[name]))
+        return self._resources[name]
+
+    def close(self):
+        while self._closers:
+            self._closers.pop()()
+        self._resources.clear()
+
+
+class Benchmark:
+
+    """A named callable to time. ops is the number of logical operations one
+    call performs and is used to compute ops_per_sec.
+    """
+
+    def __init__(self, name, func, ops=1):
+        self.name = name
+        self.func = func
+        self.ops = ops
+
+
+def measure(benchmark, min_time=0.2, repeat=5):
+    """Time benchmark and return a result dictionary"""
+    timer = timeit.Timer(benchmark.func)
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= min_time or number >= 10 ** 7:
+            break
+        number = max(number * 2, int(number * min_time / max(elapsed, 1e-9)))
+
+    samples = sorted(t / number for t in timer.repeat(repeat, number))
+    mean = sum(samples) / len(samples)
+    stdev = math.sqrt(
+        sum((s - mean) ** 2 for s in samples) / (len(samples) - 1)) \
+        if len(samples) > 1 else 0.0
+    median = samples[len(samples) // 2] if len(samples) % 2 else \
+        (samples[len(samples) // 2 - 1] + samples[len(samples) // 2]) / 2
+    return {'name': benchmark.name,
+            'number': number,
+            'repeat': repeat,
+            'ops': benchmark.ops,
+            'min_s': samples[0],
+            'median_s': median,
+            'mean_s': mean,
+            'stdev_s': stdev,
+            'ops_per_sec': benchmark.ops / median if median else None}
+
+
+def environment():
+    """Describe the machine and code the results were produced on"""
+    try:
+        commit = subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'],
+            cwd=os.path.dirname(FIXTURES),
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            'cpu_count': os.cpu_count(),
+            'sdk_version': ap_version.versions['application_version'],
+            'git_commit': commit}
+
+
+def report(results):
+    """Build the machine readable report"""
+    return {'schema': 1,
+            'timestamp': datetime.datetime.utcnow().replace(
+                microsecond=0).isoformat() + 'Z',
+            'environment': environment(),
+            'results': results}
+
+
+def compare(baseline, current, out=sys.stdout):
+    """Print the change of every median relative to a baseline report"""
+    previous = {r['name']: r for r in baseline['results']}
+    out.write('{:<48} {:>12} {:>12} {:>8}\n'.format(
+        'benchmark', 'baseline', 'current', 'change'))
+    for result in current['results']:
+        before = previous.get(result['name'])
+        if before is None:
+            change = 'new'
+            before_text = '-'
+        else:
+            change = '{:+.1f}%'.format(
+                (result['median_s'] / before['median_s'] - 1) * 100)
+            before_text = _format_time(before['median_s'])
+        out.write('{:<48} {:>12} {:>12} {:>8}\n'.format(
+            result['name'], before_text, _format_time(result['median_s']),
+            change))
+
+
+def summary(results, out=sys.stdout):
+    """Print a human readable table of results"""
+    out.write('{:<48} {:>12} {:>14}\n'.format(
+        'benchmark', 'median', 'ops/sec'))
+    for result in results:
+        out.write('{:<48} {:>12} {:>14.1f}\n'.format(
+            result['name'], _format_time(result['median_s']),
+            result['ops_per_sec'] or 0))
+
+
+def _format_time(seconds):
+    for unit, scale in (('s', 1), ('ms', 1e-3), ('us', 1e-6)):
+        if seconds >= scale:
+            return '{:.2f} {}'.format(seconds / scale, unit)
+    return '{:.0f} ns'.format(seconds / 1e-9)
+
+
+def write_json(data, path):
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+        f.write('\n')
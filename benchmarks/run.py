@@ -0,0 +1,60 @@
+"""Run the SDK benchmark suite.
+
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.run --filter parse --compare results.json
+"""
+import json
+import argparse
+from benchmarks import bench_signing, bench_parsing, bench_ipn, bench_client, \
+    bench_ipn_app
+from benchmarks.harness import Context, measure, report, compare, summary, \
+    write_json
+
+
+MODULES = (bench_signing, bench_parsing, bench_ipn, bench_client,
+           bench_ipn_app)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        '--filter', action='append', default=[],
+        help='only run benchmarks whose name contains this text')
+    parser.add_argument(
+        '--min-time', type=float, default=0.2,
+        help='minimum seconds per timing sample (default: 0.2)')
+    parser.add_argument(
+        '--repeat', type=int, default=5,
+        help='number of timing samples (default: 5)')
+    parser.add_argument(
+        '--output', help='write the JSON report to this file')
+    parser.add_argument(
+        '--compare', help='JSON report of a previous run to compare with')
+    args = parser.parse_args(argv)
+
+    context = Context()
+    results = []
+    try:
+        for module in MODULES:
+            for benchmark in module.benchmarks(context):
+                if args.filter and not any(
+                        f in benchmark.name for f in args.filter):
+                    continue
+                results.append(measure(
+                    benchmark, min_time=args.min_time, repeat=args.repeat))
+    finally:
+        context.close()
+
+    data = report(results)
+    if args.output:
+        write_json(data, args.output)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), data)
+    else:
+        summary(results)
+    return data
+
+
+if __name__ == '__main__':
+    main()
@@ -9,8 +9,8 @@ import amazon_pay.version as ap_version
 from unittest.mock import Mock, patch
 from amazon_pay.client import AmazonPayClient
 from amazon_pay.payment_request import PaymentRequest
-from amazon_pay.payment_response import PaymentResponse, PaymentErrorResponse
-from symbol import parameters
+from amazon_pay.payment_response import PaymentResponse, PaymentErrorResponse, \
+    OrderReferenceStream
 
 class AmazonPayClientTest(unittest.TestCase):
 
@@ -46,7 +46,8 @@ class AmazonPayClientTest(unittest.TestCase):
         self.response = PaymentResponse('<test>الفلانية فلا</test>')
         self.supplementary_data = '{"AirlineMetaData" : {"version": 1.0, "airlineCode": "PAX", "flightDate": "2018-03-24T20:29:19.22Z", "departureAirport": "CDG", "destinationAirport": "LUX", "bookedLastTime": -1, "classOfTravel": "F", "passengers": {"numberOfPassengers": 4, "numberOfChildren": 1, "numberOfInfants": 1 }}, "AccommodationMetaData": {"version": 1.0, "startDate": "2018-03-24T20:29:19.22Z", "endDate": "2018-03-24T20:29:19.22Z", "lengthOfStay": 5, "numberOfGuests": 4, "class": "Standard", "starRating": 5, "bookedLastTime": -1 }, "OrderMetaData": {"version": 1.0, "numberOfItems": 3, "type": "Digital" }, "BuyerMetaData": {"version" : 1.0, "isFirstTimeCustomer" : true, "numberOfPastPurchases" : 2, "numberOfDisputedPurchases" : 3, "hasOpenDispute" : true, "riskScore" : 0.75 }}'
 
-    def mock_requests_post(self, url, data=None, headers=None, verify=False):
+    def mock_requests_post(self, url, data=None, headers=None, verify=False,
+                           timeout=None):
         mock_response = Mock()
         mock_response.text = '<GetBillingAgreementDetailsResponse>\
             <GetBillingAgreementDetailsResult><BillingAgreementDetails>\
@@ -54,27 +55,31 @@ class AmazonPayClientTest(unittest.TestCase):
             </BillingAgreementStatus></BillingAgreementDetails>\
             </GetBillingAgreementDetailsResult>\
             </GetBillingAgreementDetailsResponse>'
+        mock_response.content = mock_response.text.encode('utf-8')
         mock_response.status_code = 200
         return mock_response
 
     def mock_requests_500_post(
-            self, url, data=None, headers=None, verify=False):
+            self, url, data=None, headers=None, verify=False, timeout=None):
         mock_response = Mock()
         mock_response.text = '<error>test</error>'
+        mock_response.content = mock_response.text.encode('utf-8')
         mock_response.status_code = 500
         return mock_response
 
     def mock_requests_generic_error_post(
-            self, url, data=None, headers=None, verify=False):
+            self, url, data=None, headers=None, verify=False, timeout=None):
         mock_response = Mock()
         mock_response.text = '<error>test</error>'
+        mock_response.content = mock_response.text.encode('utf-8')
         mock_response.status_code = 502
         return mock_response
 
     def mock_requests_503_post(
-            self, url, data=None, headers=None, verify=False):
+            self, url, data=None, headers=None, verify=False, timeout=None):
         mock_response = Mock()
         mock_response.text = '<error>test</error>'
+        mock_response.content = mock_response.text.encode('utf-8')
         mock_response.status_code = 503
         return mock_response
 
@@ -192,7 +197,8 @@ class AmazonPayClientTest(unittest.TestCase):
             py_version,
             str(platform.system()),
             str(platform.release())
-            )
+            ),
+            'Accept-Encoding': 'gzip, deflate'
         }
         self.assertEqual(mock_urlopen.call_args[1]['headers'], header_expected)
         self.assertTrue(py_valid, True)
@@ -821,6 +827,73 @@ class AmazonPayClientTest(unittest.TestCase):
         response = self.client.get_service_status()
         self.assertTrue(et.fromstring(response.to_xml()))
 
+    def test_response_bytes(self):
+        xml = '<test>الفلانية فلا</test>'
+        response = PaymentResponse(xml.encode('utf-8'))
+        self.assertEqual(response.to_dict(), {'test': 'الفلانية فلا'})
+        self.assertEqual(response.to_xml(), xml)
+
+        response = PaymentResponse(xml.encode('utf-8'), keep_xml=False)
+        self.assertIsNone(response._xml)
+        self.assertEqual(response.to_xml(), xml)
+
+    def test_order_reference_stream(self):
+        xml = ('<ListOrderReferenceResponse xmlns="http://mws.amazonservices.'
+               'com/schema/OffAmazonPayments/2013-01-01">'
+               '<ListOrderReferenceResult><OrderReferenceList>'
+               '<OrderReference><AmazonOrderReferenceId>S01-0000000-0000001'
+               '</AmazonOrderReferenceId><OrderTotal><Amount>1.00</Amount>'
+               '</OrderTotal></OrderReference>'
+               '<OrderReference><AmazonOrderReferenceId>S01-0000000-0000002'
+               '</AmazonOrderReferenceId></OrderReference>'
+               '</OrderReferenceList><NextPageToken>token</NextPageToken>'
+               '</ListOrderReferenceResult><ResponseMetadata><RequestId>'
+               'request-id</RequestId></ResponseMetadata>'
+               '</ListOrderReferenceResponse>').encode('utf-8')
+        chunks = [xml[i:i + 7] for i in range(0, len(xml), 7)]
+        response = OrderReferenceStream(iter(chunks))
+        orders = iter(response)
+        self.assertEqual(
+            next(orders),
+            {'AmazonOrderReferenceId': 'S01-0000000-0000001',
+             'OrderTotal': {'Amount': '1.00'}})
+        self.assertIsNone(response.next_page_token)
+        self.assertEqual(
+            [o['AmazonOrderReferenceId'] for o in orders],
+            ['S01-0000000-0000002'])
+        self.assertEqual(response.next_page_token, 'token')
+        self.assertEqual(response.request_id, 'request-id')
+        self.assertEqual(response.response_bytes, len(xml))
+        with self.assertRaises(ValueError):
+            list(response)
+
+        with self.assertRaises(ValueError):
+            list(OrderReferenceStream([b'<invalid></xml>']))
+
+    @patch('requests.post')
+    def test_response_drop_xml(self, mock_urlopen):
+        mock_urlopen.side_effect = self.mock_requests_post
+        self.client.keep_response_xml = False
+        response = self.client.get_billing_agreement_details(
+            amazon_billing_agreement_id='C01-0000000-0000000')
+        self.assertIsNone(response._xml)
+        self.assertEqual(
+            response.to_dict()['GetBillingAgreementDetailsResponse'][
+                'GetBillingAgreementDetailsResult']['BillingAgreementDetails'][
+                'BillingAgreementStatus']['State'], 'Draft')
+        self.assertTrue(et.fromstring(response.to_xml()))
+
+    def test_response_drop_xml_namespace(self):
+        xml = ('<GetServiceStatusResponse xmlns="https://mws.amazonservices'
+               '.com/OffAmazonPayments/2013-01-01"><GetServiceStatusResult>'
+               '<Status>GREEN</Status></GetServiceStatusResult>'
+               '<ResponseMetadata><RequestId>request-id</RequestId>'
+               '</ResponseMetadata></GetServiceStatusResponse>')
+        response = PaymentResponse(xml.encode('utf-8'), keep_xml=False)
+        self.assertEqual(response.to_xml(), xml)
+        self.assertEqual(PaymentResponse(response.to_xml()).to_dict(),
+                         response.to_dict())
+
     @patch('requests.post')
     def test_response_to_json(self, mock_urlopen):
         mock_urlopen.side_effect = self.mock_requests_post
@@ -838,10 +911,14 @@ class AmazonPayClientTest(unittest.TestCase):
         response = self.client.get_service_status()
         self.assertEqual(type(response.to_dict()), dict)
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_get_login_profile(self, mock_urlopen):
         mock_urlopen.side_effect = self.mock_get_login_profile
         response = self.client.get_login_profile('access_token', 'client_id')
+        self.assertEqual(response, {"aud": "client_id"})
+        # Served from the profile cache of the kept LWA client
+        self.client.get_login_profile('access_token', 'client_id')
+        self.assertEqual(mock_urlopen.call_count, 2)
 
     def test_environment_variables(self):
         os.environ['AP_REGION'] = 'na'
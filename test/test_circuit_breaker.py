@@ -0,0 +1,157 @@
+import unittest
+import requests
+from unittest.mock import Mock, patch
+from amazon_pay.client import AmazonPayClient
+from amazon_pay.circuit_breaker import CircuitBreaker, CircuitBreakerRegistry
+from amazon_pay.payment_response import PaymentCircuitOpenResponse
+
+
+class CircuitBreakerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 0
+        self.breaker = CircuitBreaker(
+            failure_rate_threshold=0.5,
+            minimum_calls=4,
+            window_size=4,
+            reset_timeout=30,
+            half_open_max_calls=2,
+            clock=lambda: self.now)
+
+    def open_breaker(self):
+        for _ in range(4):
+            self.breaker.record_failure()
+
+    def test_opens_on_failure_rate(self):
+        self.breaker.record_success()
+        self.breaker.record_success()
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(self.breaker.allow_request())
+        self.assertEqual(self.breaker.snapshot()['rejected'], 1)
+
+    def test_half_open_limits_probes(self):
+        self.open_breaker()
+        self.now = 30
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertTrue(self.breaker.allow_request())
+        self.assertTrue(self.breaker.allow_request())
+        self.assertFalse(self.breaker.allow_request())
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_failed_probe_reopens(self):
+        self.open_breaker()
+        self.now = 30
+        self.assertTrue(self.breaker.allow_request())
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(self.breaker.snapshot()['times_opened'], 2)
+
+    def test_release_frees_probe_slot(self):
+        self.open_breaker()
+        self.now = 30
+        self.assertTrue(self.breaker.allow_request())
+        self.assertTrue(self.breaker.allow_request())
+        self.breaker.release()
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertTrue(self.breaker.allow_request())
+        self.assertFalse(self.breaker.allow_request())
+
+    def test_state_change_callback(self):
+        changes = []
+        self.breaker.on_state_change = \
+            lambda breaker, old, new: changes.append((old, new))
+        self.open_breaker()
+        self.now = 30
+        self.breaker.allow_request()
+        self.assertEqual(
+            changes,
+            [(CircuitBreaker.CLOSED, CircuitBreaker.OPEN),
+             (CircuitBreaker.OPEN, CircuitBreaker.HALF_OPEN)])
+
+
+class CircuitBreakerClientTest(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = CircuitBreakerRegistry(
+            minimum_calls=2, window_size=2, reset_timeout=60)
+        self.client = AmazonPayClient(
+            mws_access_key='mws_access_key',
+            mws_secret_key='mws_secret_key',
+            merchant_id='merchant_id',
+            handle_throttle=False,
+            sandbox=True,
+            region='na',
+            currency_code='USD',
+            circuit_breaker=self.registry)
+
+    def mock_requests_503_post(
+            self, url, data=None, headers=None, verify=False, timeout=None):
+        mock_response = Mock()
+        mock_response.text = '<error>test</error>'
+        mock_response.content = mock_response.text.encode('utf-8')
+        mock_response.status_code = 503
+        return mock_response
+
+    @patch('requests.post')
+    def test_fast_fail_when_open(self, mock_urlopen):
+        mock_urlopen.side_effect = self.mock_requests_503_post
+        self.client.get_service_status()
+        self.client.get_service_status()
+        self.assertEqual(self.client.circuit_breaker_state()['state'], 'open')
+
+        response = self.client.get_service_status()
+        self.assertEqual(mock_urlopen.call_count, 2)
+        self.assertEqual(type(response), PaymentCircuitOpenResponse)
+        self.assertFalse(response.success)
+        self.assertEqual(response.to_dict(), {'error': 'CircuitOpen'})
+
+    @patch('requests.post')
+    def test_timeout_counts_as_failure(self, mock_urlopen):
+        mock_urlopen.side_effect = requests.exceptions.Timeout()
+        for _ in range(2):
+            with self.assertRaises(requests.exceptions.Timeout):
+                self.client.get_service_status()
+        self.assertEqual(self.client.circuit_breaker_state()['state'], 'open')
+
+    @patch('requests.post')
+    def test_timeout_passed_to_requests(self, mock_urlopen):
+        self.client.timeout = (3, 10)
+        mock_urlopen.side_effect = requests.exceptions.Timeout()
+        with self.assertRaises(requests.exceptions.Timeout):
+            self.client.get_service_status()
+        self.assertEqual(mock_urlopen.call_args[1]['timeout'], (3, 10))
+        self.assertEqual(
+            self.client.circuit_breaker_state()['total_failures'], 1)
+
+    @patch('requests.post')
+    def test_unexpected_error_releases_probe(self, mock_urlopen):
+        breaker = self.client._circuit_breaker()
+        breaker.half_open_max_calls = 1
+        for _ in range(2):
+            breaker.record_failure()
+        breaker._opened_at -= 60
+        mock_urlopen.side_effect = RuntimeError('unexpected')
+        with self.assertRaises(RuntimeError):
+            self.client.get_service_status()
+        self.assertEqual(breaker.snapshot()['probes_in_flight'], 0)
+
+        mock_urlopen.side_effect = self.mock_requests_503_post
+        self.client.get_service_status()
+        self.assertEqual(mock_urlopen.call_count, 2)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+    def test_breaker_per_endpoint(self):
+        sandbox_breaker = self.client._circuit_breaker()
+        self.client.sandbox = False
+        self.assertIsNot(self.client._circuit_breaker(), sandbox_breaker)
+        self.assertEqual(len(self.registry.snapshot()), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
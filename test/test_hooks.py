@@ -0,0 +1,103 @@
+import unittest
+from unittest.mock import Mock, patch
+from amazon_pay.client import AmazonPayClient
+
+
+class LifecycleHooksTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = AmazonPayClient(
+            mws_access_key='mws_access_key',
+            mws_secret_key='mws_secret_key',
+            merchant_id='merchant_id',
+            handle_throttle=True,
+            sandbox=True,
+            region='na',
+            currency_code='USD')
+        self.events = []
+        self.status_codes = []
+        for event in self.client.hooks.EVENTS:
+            self.client.register_hook(event, self.events.append)
+
+    def mock_requests_post(self, url, data=None, headers=None, verify=False,
+                           timeout=None):
+        mock_response = Mock()
+        mock_response.status_code = \
+            self.status_codes.pop(0) if self.status_codes else 200
+        mock_response.text = '<Response><ResponseMetadata>\
+            <RequestId>b4ab4bc3-c9ea-44f0-9a3d-67cccef565c6</RequestId>\
+            </ResponseMetadata></Response>'
+        mock_response.content = mock_response.text.encode('utf-8')
+        return mock_response
+
+    @patch('time.sleep')
+    @patch('requests.post')
+    def test_event_sequence(self, mock_urlopen, mock_sleep):
+        self.status_codes = [503, 200]
+        mock_urlopen.side_effect = self.mock_requests_post
+        self.client.get_service_status()
+
+        self.assertEqual(
+            [(e.name, e.attempt) for e in self.events],
+            [('span_start', None),
+             ('before_sign', 1), ('before_send', 1), ('after_receive', 1),
+             ('after_parse', 1),
+             ('before_retry', 2),
+             ('before_sign', 2), ('before_send', 2), ('after_receive', 2),
+             ('after_parse', 2),
+             ('span_end', None)])
+        for event in self.events:
+            self.assertEqual(event.action, 'GetServiceStatus')
+            self.assertEqual(event.span.name, 'GetServiceStatus')
+
+        after_parse = self.events[-2]
+        self.assertEqual(after_parse.status_code, 200)
+        self.assertEqual(
+            after_parse.request_id, 'b4ab4bc3-c9ea-44f0-9a3d-67cccef565c6')
+        self.assertEqual(
+            sorted(after_parse.timings), ['network', 'parse', 'sign'])
+        self.assertEqual(self.events[5].retry_time, 1)
+        self.assertEqual(
+            self.events[-1].request_id, 'b4ab4bc3-c9ea-44f0-9a3d-67cccef565c6')
+
+    @patch('requests.post')
+    def test_charge_parent_span(self, mock_urlopen):
+        mock_urlopen.side_effect = self.mock_requests_post
+        self.client.charge(
+            amazon_reference_id='P01-0000000-0000000',
+            charge_amount='1.00',
+            authorize_reference_id='auth_ref',
+            charge_note='note')
+
+        ends = [e.span for e in self.events if e.name == 'span_end']
+        self.assertEqual(
+            [span.name for span in ends],
+            ['SetOrderReferenceDetails', 'ConfirmOrderReference', 'Authorize',
+             'charge'])
+        charge_span = ends[-1]
+        self.assertIsNone(charge_span.parent)
+        for span in ends[:-1]:
+            self.assertIs(span.parent, charge_span)
+            self.assertLessEqual(span.end, charge_span.end)
+
+    @patch('requests.post')
+    def test_callback_errors_are_ignored(self, mock_urlopen):
+        mock_urlopen.side_effect = self.mock_requests_post
+
+        def broken(event):
+            raise RuntimeError('broken callback')
+
+        self.client.register_hook('before_send', broken)
+        response = self.client.get_service_status()
+        self.assertTrue(response.success)
+
+    def test_unregister(self):
+        self.client.unregister_hook('before_sign', self.events.append)
+        with self.assertRaises(ValueError):
+            self.client.unregister_hook('before_sign', self.events.append)
+        with self.assertRaises(ValueError):
+            self.client.register_hook('invalid', self.events.append)
+
+
+if __name__ == "__main__":
+    unittest.main()
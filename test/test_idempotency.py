@@ -0,0 +1,182 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest.mock import Mock, patch
+from amazon_pay.client import AmazonPayClient
+from amazon_pay.idempotency import MemoryIdempotencyStore, \
+    SqliteIdempotencyStore, idempotency_key, fingerprint
+
+
+class IdempotencyStoreTest(unittest.TestCase):
+
+    def test_key(self):
+        self.assertEqual(
+            idempotency_key({'Action': 'Capture',
+                             'CaptureReferenceId': 'capture-1'}, 'merchant'),
+            'merchant|Capture|capture-1')
+        self.assertEqual(
+            idempotency_key({'Action': 'Refund', 'SellerId': 'seller',
+                             'RefundReferenceId': 'refund-1'}, 'merchant'),
+            'seller|Refund|refund-1')
+        self.assertIsNone(idempotency_key(
+            {'Action': 'GetCaptureDetails'}, 'merchant'))
+
+    def test_fingerprint(self):
+        params = {'Action': 'Capture', 'CaptureReferenceId': 'capture-1',
+                  'SellerCaptureNote': 'note', 'MWSAuthToken': 'token',
+                  'Timestamp': '2020-01-01T00:00:00Z', 'Signature': 'a'}
+        self.assertEqual(
+            fingerprint(params),
+            fingerprint(dict(params, Timestamp='2020-01-01T00:00:05Z',
+                             Signature='b')))
+        self.assertNotEqual(
+            fingerprint(params),
+            fingerprint(dict(params, SellerCaptureNote='other note')))
+        self.assertNotEqual(
+            fingerprint(params),
+            fingerprint(dict(params, MWSAuthToken='other token')))
+
+    def test_memory_store_lru(self):
+        now = [0]
+        store = MemoryIdempotencyStore(
+            max_entries=2, ttl=10, clock=lambda: now[0])
+        store.put('a', 'f', '<a/>')
+        store.put('b', 'f', '<b/>')
+        store.get('a')
+        store.put('c', 'f', '<c/>')
+        self.assertIsNone(store.get('b'))
+        self.assertEqual(store.get('a'), ('f', '<a/>'))
+        now[0] = 11
+        self.assertIsNone(store.get('c'))
+
+    def test_sqlite_store(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'idempotency.db')
+            store = SqliteIdempotencyStore(path)
+            store.put('a', 'f', '<a/>')
+            store.close()
+            store = SqliteIdempotencyStore(path)
+            self.assertEqual(store.get('a'), ('f', '<a/>'))
+            self.assertIsNone(store.get('b'))
+            store.close()
+        finally:
+            shutil.rmtree(directory)
+
+
+class ClientIdempotencyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = AmazonPayClient(
+            mws_access_key='mws_access_key',
+            mws_secret_key='mws_secret_key',
+            merchant_id='merchant_id',
+            handle_throttle=False,
+            sandbox=True,
+            region='na',
+            currency_code='USD',
+            idempotency_store=MemoryIdempotencyStore())
+        self.status_code = 200
+        self.release = None
+
+    def mock_requests_post(self, url, data=None, headers=None, verify=False,
+                           timeout=None):
+        if self.release is not None:
+            self.release.wait(5)
+        mock_response = Mock()
+        mock_response.status_code = self.status_code
+        mock_response.text = '<CaptureResponse><CaptureResult>\
+            <CaptureDetails><AmazonCaptureId>P01-0000000-0000000-C000001\
+            </AmazonCaptureId></CaptureDetails></CaptureResult>\
+            </CaptureResponse>'
+        mock_response.content = mock_response.text.encode('utf-8')
+        return mock_response
+
+    def capture(self, amount='10.00', **kwargs):
+        return self.client.capture(
+            amazon_authorization_id='P01-0000000-0000000-A000001',
+            capture_reference_id='capture-1',
+            capture_amount=amount,
+            **kwargs)
+
+    @patch('requests.post')
+    def test_duplicate_served_from_store(self, mock_urlopen):
+        mock_urlopen.side_effect = self.mock_requests_post
+        first = self.capture()
+        second = self.capture()
+        self.assertEqual(mock_urlopen.call_count, 1)
+        self.assertTrue(second.success)
+        self.assertEqual(first.to_dict(), second.to_dict())
+
+        with self.assertRaises(ValueError):
+            self.capture(amount='11.00')
+        with self.assertRaises(ValueError):
+            self.capture(seller_capture_note='other note')
+        with self.assertRaises(ValueError):
+            self.capture(mws_auth_token='other token')
+
+        self.client.get_capture_details(
+            amazon_capture_id='P01-0000000-0000000-C000001')
+        self.client.get_capture_details(
+            amazon_capture_id='P01-0000000-0000000-C000001')
+        self.assertEqual(mock_urlopen.call_count, 3)
+
+    @patch('requests.post')
+    def test_errors_not_stored(self, mock_urlopen):
+        mock_urlopen.side_effect = self.mock_requests_post
+        self.status_code = 400
+        self.assertFalse(self.capture().success)
+        self.status_code = 200
+        self.assertTrue(self.capture().success)
+        self.assertEqual(mock_urlopen.call_count, 2)
+
+    @patch('requests.post')
+    def test_concurrent_duplicates_coalesced(self, mock_urlopen):
+        mock_urlopen.side_effect = self.mock_requests_post
+        self.release = threading.Event()
+        responses = []
+        threads = [threading.Thread(
+            target=lambda: responses.append(self.capture()))
+            for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        while not mock_urlopen.called:
+            threading.Event().wait(0.01)
+        self.release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(mock_urlopen.call_count, 1)
+        self.assertEqual(len(responses), 5)
+        self.assertTrue(all(r.success for r in responses))
+
+    @patch('requests.post')
+    def test_concurrent_reuse_rejected(self, mock_urlopen):
+        mock_urlopen.side_effect = self.mock_requests_post
+        self.release = threading.Event()
+        first = threading.Thread(target=self.capture)
+        first.start()
+        while not mock_urlopen.called:
+            threading.Event().wait(0.01)
+        errors = []
+
+        def reuse():
+            try:
+                self.capture(amount='11.00')
+            except ValueError as ex:
+                errors.append(ex)
+        second = threading.Thread(target=reuse)
+        second.start()
+        flight = self.client._idempotent_calls._flight
+        while not flight.shared:
+            threading.Event().wait(0.01)
+        self.release.set()
+        first.join()
+        second.join()
+        self.assertEqual(mock_urlopen.call_count, 1)
+        self.assertEqual(len(errors), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,183 @@
+import io
+import json
+import asyncio
+import unittest
+from unittest.mock import patch
+from amazon_pay.ipn_handler import IpnHandler
+from amazon_pay.certificate_store import CertificateStore
+from amazon_pay.ipn_pipeline import IpnPipeline
+from amazon_pay.ipn_dedup import IpnDeduplicator
+from amazon_pay.ipn_app import IpnWsgiApp, IpnAsgiApp
+import ipn_fixtures
+
+
+def wsgi_environ(body, headers, method='POST'):
+    environ = {'REQUEST_METHOD': method,
+               'CONTENT_LENGTH': str(len(body)),
+               'wsgi.input': io.BytesIO(body)}
+    for name, value in headers.items():
+        if name.lower() in ('content-length', 'content-type'):
+            continue
+        environ['HTTP_' + name.upper().replace('-', '_')] = value
+    return environ
+
+
+class IpnAppTest(unittest.TestCase):
+
+    def setUp(self):
+        self.body = ipn_fixtures.BODY_VALID
+        self.body_invalid = ipn_fixtures.BODY_INVALID
+        self.headers = dict(ipn_fixtures.HEADERS)
+        self.store = CertificateStore(fetch=self.fail)
+        self.store.put(json.loads(self.body)['SigningCertURL'],
+                       ipn_fixtures.PEM)
+
+    def call_wsgi(self, app, environ):
+        statuses = []
+        app(environ, lambda status, headers: statuses.append(status))
+        return statuses[0]
+
+    def call_asgi(self, app, body, headers, method='POST', chunk=None):
+        chunk = chunk or len(body) or 1
+        messages = [{'type': 'http.request', 'body': body[i:i + chunk],
+                     'more_body': i + chunk < len(body)}
+                    for i in range(0, max(len(body), 1), chunk)]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {'type': 'http', 'method': method,
+                 'headers': [(name.lower().encode(), value.encode())
+                             for name, value in headers.items()]}
+        asyncio.run(app(scope, receive, send))
+        return sent[0]['status']
+
+    def test_wsgi(self):
+        received = []
+        app = IpnWsgiApp(callback=received.append,
+                         certificate_store=self.store)
+        self.assertEqual(self.call_wsgi(
+            app, wsgi_environ(self.body, self.headers)), '200 OK')
+        self.assertEqual(received[0].notification_type,
+                         'OrderReferenceNotification')
+        self.assertEqual(self.store.hits, 1)
+        self.assertEqual(self.call_wsgi(
+            app, wsgi_environ(self.body_invalid, self.headers)),
+            '400 Bad Request')
+        self.assertEqual(len(received), 1)
+
+    def test_wsgi_limits(self):
+        app = IpnWsgiApp(certificate_store=self.store, max_body=100)
+        self.assertEqual(self.call_wsgi(
+            app, wsgi_environ(self.body, self.headers)),
+            '413 Payload Too Large')
+        self.assertEqual(self.call_wsgi(
+            app, wsgi_environ(b'', {}, method='GET')),
+            '405 Method Not Allowed')
+        environ = wsgi_environ(self.body, self.headers)
+        del environ['CONTENT_LENGTH']
+        self.assertEqual(self.call_wsgi(app, environ),
+                         '411 Length Required')
+        # read(-1) would read the whole stream past max_body
+        environ = wsgi_environ(self.body, self.headers)
+        environ['CONTENT_LENGTH'] = '-1'
+        self.assertEqual(self.call_wsgi(app, environ), '400 Bad Request')
+
+    def test_callback_failure(self):
+        def callback(handler):
+            raise RuntimeError('database down')
+        app = IpnWsgiApp(callback=callback, certificate_store=self.store)
+        self.assertEqual(self.call_wsgi(
+            app, wsgi_environ(self.body, self.headers)),
+            '500 Internal Server Error')
+
+    def test_callback_failure_redelivered(self):
+        received = []
+
+        def callback(handler):
+            received.append(handler)
+            if len(received) == 1:
+                raise RuntimeError('database down')
+        app = IpnWsgiApp(callback=callback, certificate_store=self.store,
+                         deduplicator=IpnDeduplicator())
+        self.assertEqual(self.call_wsgi(
+            app, wsgi_environ(self.body, self.headers)),
+            '500 Internal Server Error')
+        # The SNS retry is processed again, later ones are acknowledged
+        self.assertEqual(self.call_wsgi(
+            app, wsgi_environ(self.body, self.headers)), '200 OK')
+        self.assertEqual(len(received), 2)
+        self.assertEqual(self.call_wsgi(
+            app, wsgi_environ(self.body, self.headers)), '200 OK')
+        self.assertEqual(len(received), 2)
+
+    def test_asgi(self):
+        received = []
+        app = IpnAsgiApp(callback=received.append,
+                         certificate_store=self.store)
+        # Header names arrive in lower case
+        self.assertEqual(self.call_asgi(
+            app, self.body, self.headers, chunk=500), 200)
+        self.assertEqual(len(received), 1)
+        self.assertEqual(self.call_asgi(
+            app, self.body_invalid, self.headers), 400)
+        self.assertEqual(self.call_asgi(app, b'', {}, method='GET'), 405)
+        self.assertEqual(self.call_asgi(
+            app, self.body, dict(self.headers, **{'Content-Length': '-1'})),
+            400)
+        app.max_body = 1000
+        self.assertEqual(self.call_asgi(
+            app, self.body, {'X-Amz-Sns-Message-Type': 'Notification'},
+            chunk=500), 413)
+
+    def test_pipeline(self):
+        received = []
+        pipeline = IpnPipeline(callback=received.append,
+                               certificate_store=self.store)
+        app = IpnWsgiApp(pipeline=pipeline)
+        with pipeline:
+            self.assertEqual(self.call_wsgi(
+                app, wsgi_environ(self.body, self.headers)), '200 OK')
+        self.assertEqual(len(received), 1)
+
+    def test_pipeline_invalid_body(self):
+        pipeline = IpnPipeline(deduplicator=IpnDeduplicator(),
+                               certificate_store=self.store)
+        app = IpnWsgiApp(pipeline=pipeline)
+        self.assertEqual(self.call_wsgi(
+            app, wsgi_environ(b'\xff\xfe', {
+                'X-Amz-Sns-Message-Type': 'Notification'})),
+            '400 Bad Request')
+        self.assertEqual(pipeline.pending(), 0)
+
+    def test_subscription_confirmation(self):
+        payload = json.loads(self.body)
+        payload.update(
+            Type='SubscriptionConfirmation', Token='token',
+            SubscribeURL='https://sns.us-east-1.amazonaws.com/'
+                         '?Action=ConfirmSubscription&Token=token')
+        body = json.dumps(payload).encode('utf-8')
+        headers = dict(self.headers)
+        headers['X-Amz-Sns-Message-Type'] = 'SubscriptionConfirmation'
+        received = []
+        app = IpnWsgiApp(callback=received.append,
+                         certificate_store=self.store)
+        # The fixture is signed as a notification
+        self.assertEqual(self.call_wsgi(
+            app, wsgi_environ(body, headers)), '400 Bad Request')
+        with patch.object(IpnHandler, '_validate_signature',
+                          return_value=True), \
+                patch('amazon_pay.ipn_handler.request.urlopen') as urlopen:
+            self.assertEqual(self.call_wsgi(
+                app, wsgi_environ(body, headers)), '200 OK')
+        self.assertEqual(urlopen.call_args[0][0].full_url,
+                         payload['SubscribeURL'])
+        self.assertEqual(received, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
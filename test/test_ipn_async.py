@@ -0,0 +1,76 @@
+import json
+import time
+import asyncio
+import unittest
+from amazon_pay.certificate_store import CertificateStore
+from amazon_pay.ipn_dedup import IpnDeduplicator
+from amazon_pay.ipn_async import AsyncIpnHandler, AsyncCertificateStore
+import ipn_fixtures
+
+
+class AsyncIpnHandlerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.body = ipn_fixtures.BODY_VALID
+        self.body_invalid = ipn_fixtures.BODY_INVALID
+        self.headers = dict(ipn_fixtures.HEADERS)
+        self.pem = ipn_fixtures.PEM
+        self.url = json.loads(self.body)['SigningCertURL']
+        self.downloads = []
+
+    def fetch(self, url):
+        self.downloads.append(url)
+        time.sleep(0.05)
+        return self.pem
+
+    def test_authenticate(self):
+        store = AsyncCertificateStore(CertificateStore(fetch=self.fetch))
+        deduplicator = IpnDeduplicator()
+
+        async def verify(body):
+            ipn_handler = AsyncIpnHandler(
+                body, self.headers, deduplicator=deduplicator,
+                certificate_store=store)
+            try:
+                await ipn_handler.authenticate()
+            except ValueError:
+                return False
+            return ipn_handler.mark_processed()
+
+        async def main():
+            return await asyncio.gather(
+                *[verify(self.body) for _ in range(10)],
+                verify(self.body_invalid))
+
+        results = asyncio.run(main())
+        self.assertEqual(results, [True] * 10 + [False])
+        # One download shared by the concurrent handlers
+        self.assertEqual(self.downloads, [self.url])
+        self.assertEqual(store.shared, 9)
+        self.assertTrue(deduplicator.is_duplicate(self.body, self.headers))
+
+        ipn_handler = AsyncIpnHandler(self.body, self.headers,
+                                      certificate_store=store)
+        self.assertTrue(asyncio.run(ipn_handler.authenticate()))
+        self.assertEqual(self.downloads, [self.url])
+        self.assertEqual(ipn_handler.notification_type,
+                         'OrderReferenceNotification')
+
+    def test_certificate_error(self):
+        def fetch(url):
+            raise ValueError('Error retrieving certificate.')
+        ipn_handler = AsyncIpnHandler(
+            self.body, self.headers,
+            certificate_store=CertificateStore(fetch=fetch))
+        with self.assertRaises(ValueError):
+            asyncio.run(ipn_handler.authenticate())
+        self.assertEqual(ipn_handler.error, 'Error retrieving certificate.')
+
+    def test_lazy(self):
+        ipn_handler = AsyncIpnHandler(b'not json', self.headers)
+        with self.assertRaises(ValueError):
+            ipn_handler._type
+
+
+if __name__ == "__main__":
+    unittest.main()
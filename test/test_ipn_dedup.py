@@ -0,0 +1,75 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from amazon_pay.ipn_dedup import IpnDeduplicator, MemoryDedupStore, \
+    SqliteDedupStore
+
+
+def body(message_id, notification_reference_id):
+    return json.dumps({
+        'Type': 'Notification',
+        'MessageId': message_id,
+        'Message': json.dumps({
+            'NotificationReferenceId': notification_reference_id})}).encode(
+                'utf-8')
+
+
+class IpnDedupTest(unittest.TestCase):
+
+    def test_memory_store(self):
+        now = [0]
+        store = MemoryDedupStore(max_entries=2, clock=lambda: now[0])
+        store.add('a', 10)
+        store.add('b', 20)
+        store.add('c', 30)
+        self.assertFalse(store.seen('a'))
+        self.assertTrue(store.seen('b'))
+        now[0] = 20
+        self.assertFalse(store.seen('b'))
+        self.assertTrue(store.seen('c'))
+
+    def test_sqlite_store(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'dedup.db')
+            now = [0]
+            store = SqliteDedupStore(path, clock=lambda: now[0])
+            store.add('a', 10)
+            store.close()
+            store = SqliteDedupStore(path, clock=lambda: now[0])
+            self.assertTrue(store.seen('a'))
+            self.assertFalse(store.seen('b'))
+            now[0] = 10
+            self.assertFalse(store.seen('a'))
+            store.close()
+        finally:
+            shutil.rmtree(directory)
+
+    def test_deduplicator(self):
+        now = [0]
+        shared = MemoryDedupStore(clock=lambda: now[0])
+        deduplicator = IpnDeduplicator(
+            store=shared, window=100, clock=lambda: now[0])
+        self.assertFalse(deduplicator.is_duplicate(body('m1', 'n1'), {}))
+        deduplicator.mark('m1', 'n1')
+
+        # Header only, the body is not decoded
+        self.assertTrue(deduplicator.is_duplicate(
+            b'not json', {'x-amz-sns-message-id': 'm1'}))
+        # Same notification in a new SNS message
+        self.assertTrue(deduplicator.is_duplicate(body('m2', 'n1'), {}))
+        self.assertFalse(deduplicator.is_duplicate(body('m3', 'n3'), {}))
+        self.assertEqual(deduplicator.duplicates, 2)
+
+        # Another process sharing the store
+        other = IpnDeduplicator(store=shared, clock=lambda: now[0])
+        self.assertTrue(other.seen('m1'))
+
+        now[0] = 100
+        self.assertFalse(deduplicator.is_duplicate(body('m1', 'n1'), {}))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+import json
+import unittest
+from amazon_pay.ipn_handler import IpnHandler
+from amazon_pay.ipn_dispatch import CaptureEvent, IpnDispatcher
+
+
+CAPTURE_XML = '<?xml version="1.0" encoding="UTF-8"?>\n\
+<CaptureNotification xmlns="https://mws.amazonservices.com/ipn/\
+OffAmazonPayments/2013-01-01"><CaptureDetails>\
+<AmazonCaptureId>P01-0000000-0000000-C000001</AmazonCaptureId>\
+<CaptureReferenceId>capture-1</CaptureReferenceId>\
+<CaptureAmount><Amount>4.00</Amount><CurrencyCode>USD</CurrencyCode>\
+</CaptureAmount><RefundedAmount><Amount>0.00</Amount>\
+<CurrencyCode>USD</CurrencyCode></RefundedAmount>\
+<CaptureStatus><State>Completed</State>\
+<LastUpdateTimestamp>2026-01-01T00:00:00.000Z</LastUpdateTimestamp>\
+</CaptureStatus></CaptureDetails></CaptureNotification>'
+
+
+def notification(notification_type, xml):
+    body = json.dumps({
+        'Type': 'Notification',
+        'MessageId': 'message-1',
+        'TopicArn': 'arn',
+        'Message': json.dumps({
+            'NotificationReferenceId': 'notification-1',
+            'NotificationType': notification_type,
+            'SellerId': 'seller',
+            'IsSample': False,
+            'NotificationData': xml}),
+        'Timestamp': '2026-01-01T00:00:00.000Z',
+        'SignatureVersion': '1',
+        'Signature': '',
+        'SigningCertURL': ''})
+    return IpnHandler(body.encode('utf-8'), {})
+
+
+class IpnDispatcherTest(unittest.TestCase):
+
+    def test_dispatch(self):
+        dispatcher = IpnDispatcher()
+        events = []
+        dispatcher.register('CaptureNotification', events.append)
+
+        ipn_handler = notification('CaptureNotification', CAPTURE_XML)
+        self.assertEqual(ipn_handler.notification_type,
+                         'CaptureNotification')
+        event = dispatcher.dispatch(ipn_handler)
+        self.assertEqual(events, [event])
+        self.assertIsInstance(event, CaptureEvent)
+        self.assertEqual(event.capture_id, 'P01-0000000-0000000-C000001')
+        self.assertEqual(event.reference_id, 'capture-1')
+        self.assertEqual(event.state, 'Completed')
+        self.assertIsNone(event.reason_code)
+        self.assertEqual(event.amount, '4.00')
+        self.assertEqual(event.refunded_amount, '0.00')
+        self.assertEqual(event.notification_reference_id, 'notification-1')
+        self.assertFalse(hasattr(event, '__dict__'))
+
+    def test_ignored_types_not_parsed(self):
+        dispatcher = IpnDispatcher()
+        dispatcher.register('CaptureNotification', lambda event: None)
+        ipn_handler = notification('RefundNotification', 'not xml')
+        self.assertIsNone(dispatcher.dispatch(ipn_handler))
+        self.assertIsNone(ipn_handler._response)
+        self.assertEqual(dispatcher.ignored, 1)
+
+    def test_register(self):
+        dispatcher = IpnDispatcher()
+        with self.assertRaises(ValueError):
+            dispatcher.register('UnknownNotification', print)
+        with self.assertRaises(ValueError):
+            dispatcher.unregister('CaptureNotification', print)
+
+
+if __name__ == "__main__":
+    unittest.main()
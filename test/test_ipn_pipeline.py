@@ -0,0 +1,179 @@
+import os
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+from amazon_pay.ipn_handler import IpnHandler
+from amazon_pay.ipn_dedup import IpnDeduplicator
+from amazon_pay.ipn_pipeline import IpnPipeline, SpillLog
+import ipn_fixtures
+
+
+class IpnPipelineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.body = ipn_fixtures.BODY_VALID
+        self.body_invalid = ipn_fixtures.BODY_INVALID
+        self.headers = dict(ipn_fixtures.HEADERS)
+        pem = ipn_fixtures.PEM
+        self.get_cert = patch.object(
+            IpnHandler, '_get_cert', autospec=True,
+            side_effect=lambda handler: setattr(handler, '_pem', pem))
+        self.get_cert.start()
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.get_cert.stop()
+        shutil.rmtree(self.directory)
+
+    def test_process(self):
+        received = []
+        pipeline = IpnPipeline(callback=received.append, workers=2)
+        with pipeline:
+            self.assertEqual(pipeline.submit(self.body, self.headers), 200)
+            self.assertEqual(
+                pipeline.submit(self.body_invalid, self.headers), 200)
+        self.assertEqual(len(received), 1)
+        self.assertEqual(pipeline.stats['processed'], 1)
+        self.assertEqual(pipeline.stats['failed'], 1)
+
+    def test_duplicates(self):
+        received = []
+        pipeline = IpnPipeline(callback=received.append,
+                               deduplicator=IpnDeduplicator())
+        with pipeline:
+            self.assertEqual(pipeline.submit(self.body, self.headers), 200)
+        # Acknowledged without queueing once processed
+        self.assertEqual(pipeline.submit(self.body, self.headers), 200)
+        self.assertEqual(pipeline.stats['duplicates'], 1)
+        self.assertEqual(pipeline.pending(), 0)
+        self.assertEqual(len(received), 1)
+
+    def test_callback_failure_redelivered(self):
+        received = []
+
+        def callback(handler):
+            received.append(handler)
+            if len(received) == 1:
+                raise RuntimeError('database down')
+        pipeline = IpnPipeline(callback=callback,
+                               deduplicator=IpnDeduplicator(), workers=1)
+        with pipeline:
+            self.assertEqual(pipeline.submit(self.body, self.headers), 200)
+        # The failed notification was not remembered, so its retry is
+        # processed again
+        with pipeline:
+            self.assertEqual(pipeline.submit(self.body, self.headers), 200)
+        self.assertEqual(len(received), 2)
+        self.assertEqual(pipeline.stats['failed'], 1)
+        self.assertEqual(pipeline.stats['processed'], 1)
+
+    def test_worker_survives_errors(self):
+        received = []
+        pipeline = IpnPipeline(callback=received.append, workers=1)
+        self.get_cert.stop()
+        with patch.object(IpnHandler, '_get_cert',
+                          side_effect=OSError('network down')):
+            with pipeline:
+                # Raises TypeError reading the payload fields
+                self.assertEqual(pipeline.submit(
+                    b'["x"]', {'X-Amz-Sns-Topic-Arn': 'arn'}), 200)
+                self.assertEqual(
+                    pipeline.submit(self.body, self.headers), 200)
+        self.get_cert.start()
+        with pipeline:
+            self.assertEqual(pipeline.submit(self.body, self.headers), 200)
+        self.assertEqual(len(received), 1)
+        self.assertEqual(pipeline.stats['failed'], 2)
+        self.assertEqual(pipeline.stats['processed'], 1)
+
+    def test_failures_stay_pending(self):
+        path = os.path.join(self.directory, 'ipn.log')
+
+        def callback(handler):
+            raise RuntimeError('database down')
+        pipeline = IpnPipeline(callback=callback, spill_path=path)
+        with pipeline:
+            self.assertEqual(pipeline.submit(self.body, self.headers), 200)
+            self.assertEqual(
+                pipeline.submit(self.body_invalid, self.headers), 200)
+        self.assertEqual(pipeline.stats['failed'], 2)
+
+        # Only the notification whose callback failed is processed again
+        received = []
+        pipeline = IpnPipeline(callback=received.append, spill_path=path)
+        with pipeline:
+            pass
+        self.assertEqual(len(received), 1)
+        self.assertEqual(os.path.getsize(path), 0)
+
+    def test_backpressure(self):
+        release = threading.Event()
+        pipeline = IpnPipeline(callback=lambda handler: release.wait(5),
+                               workers=1, max_queue=2)
+        pipeline.start()
+        statuses = [pipeline.submit(self.body, self.headers)
+                    for _ in range(5)]
+        self.assertIn(503, statuses)
+        self.assertEqual(statuses[:2], [200, 200])
+        release.set()
+        pipeline.stop()
+        self.assertEqual(pipeline.stats['rejected'], statuses.count(503))
+        self.assertEqual(pipeline.stats['processed'],
+                         statuses.count(200))
+
+    def test_spill_log_recovery(self):
+        path = os.path.join(self.directory, 'ipn.log')
+        log = SpillLog(path, fsync=False)
+        first = log.append(self.body, self.headers)
+        log.append(self.body, self.headers)
+        log.done(first)
+        log.close()
+
+        received = []
+        pipeline = IpnPipeline(callback=received.append, spill_path=path)
+        with pipeline:
+            pass
+        self.assertEqual(len(received), 1)
+        self.assertEqual(os.path.getsize(path), 0)
+
+    def test_spill_log_ids_continue(self):
+        path = os.path.join(self.directory, 'ipn.log')
+        log = SpillLog(path, fsync=False)
+        first = log.append(self.body, self.headers)
+        log.close()
+
+        # A notification submitted before the pipeline started
+        log = SpillLog(path, fsync=False)
+        second = log.append(self.body, self.headers)
+        self.assertNotEqual(second, first)
+        self.assertEqual([entry[0] for entry in log.recover()], [first])
+        self.assertEqual(log.recover(), [])
+        log.close()
+
+    def test_spill_log_compaction(self):
+        path = os.path.join(self.directory, 'ipn.log')
+        log = SpillLog(path, fsync=False, compact_after=2)
+        ids = [log.append(self.body, self.headers) for _ in range(3)]
+        log.done(ids[0])
+        size = os.path.getsize(path)
+        log.done(ids[1])
+        # Only the pending notification is left
+        self.assertLess(os.path.getsize(path), size)
+        with open(path) as f:
+            self.assertEqual([json.loads(line)['id'] for line in f],
+                             [ids[2]])
+        fourth = log.append(self.body, self.headers)
+        log.close()
+
+        log = SpillLog(path, fsync=False)
+        self.assertEqual([entry[0] for entry in log.recover()],
+                         [ids[2], fourth])
+        self.assertEqual(log.append(self.body, self.headers), fourth + 1)
+        log.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,238 @@
+import io
+import os
+import json
+import base64
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+from concurrent.futures import ThreadPoolExecutor
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding
+from amazon_pay.ipn_dedup import IpnDeduplicator
+from amazon_pay.ipn_replay import IpnReplayer, ReplayReport, main, \
+    offline_certificate_store, order_key
+from test_ipn_signature import self_signed
+
+
+CERT_URL = 'https://sns.us-east-1.amazonaws.com/SimpleNotificationService-test.pem'
+TOPIC_ARN = 'arn:aws:sns:us-east-1:291180941288:A3BXB0YN3XH17HAQR8184NJXADU'
+NOTIFICATION_DATA = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<OrderReferenceNotification xmlns="https://mws.amazonservices.com/ipn/'
+    'OffAmazonPayments/2013-01-01"><OrderReference>'
+    '<AmazonOrderReferenceId>{order_id}</AmazonOrderReferenceId>'
+    '<OrderReferenceStatus><State>{state}</State></OrderReferenceStatus>'
+    '</OrderReference></OrderReferenceNotification>')
+# An order created from a billing agreement, and one of its authorizations
+BILLING_AGREEMENT_ORDER_DATA = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<OrderReferenceNotification xmlns="https://mws.amazonservices.com/ipn/'
+    'OffAmazonPayments/2013-01-01"><OrderReference>'
+    '<AmazonOrderReferenceId>{order_id}</AmazonOrderReferenceId>'
+    '<OrderReferenceStatus><State>{state}</State></OrderReferenceStatus>'
+    '<ParentDetails><Id>C01-7654321-7654321</Id>'
+    '<Type>BillingAgreement</Type></ParentDetails>'
+    '</OrderReference></OrderReferenceNotification>')
+AUTHORIZATION_DATA = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<AuthorizationNotification xmlns="https://mws.amazonservices.com/ipn/'
+    'OffAmazonPayments/2013-01-01"><AuthorizationDetails>'
+    '<AmazonAuthorizationId>{order_id}-A000001</AmazonAuthorizationId>'
+    '<AuthorizationStatus><State>{state}</State></AuthorizationStatus>'
+    '</AuthorizationDetails></AuthorizationNotification>')
+
+
+class IpnReplayerTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.key, cls.pem = self_signed()
+
+    def setUp(self):
+        self.count = 0
+        self.store = offline_certificate_store({CERT_URL: self.pem})
+
+    def message(self, order_id, state, timestamp, cert_url=CERT_URL,
+                data=NOTIFICATION_DATA,
+                notification_type='OrderReferenceNotification'):
+        self.count += 1
+        payload = {
+            'Type': 'Notification',
+            'MessageId': 'message-{}'.format(self.count),
+            'TopicArn': TOPIC_ARN,
+            'Message': json.dumps({
+                'NotificationReferenceId': 'reference-{}'.format(self.count),
+                'NotificationType': notification_type,
+                'Timestamp': timestamp,
+                'NotificationData': data.format(
+                    order_id=order_id, state=state)}),
+            'Timestamp': timestamp,
+            'SignatureVersion': '1',
+            'SigningCertURL': cert_url}
+        signing_string = ''.join(
+            '{}\n{}\n'.format(name, payload[name])
+            for name in ('Message', 'MessageId', 'Timestamp', 'TopicArn',
+                         'Type'))
+        payload['Signature'] = base64.b64encode(self.key.sign(
+            signing_string.encode('utf-8'), padding.PKCS1v15(),
+            hashes.SHA1())).decode()
+        return payload
+
+    def lines(self, payloads):
+        return [json.dumps(payload) + '\n' for payload in payloads]
+
+    def state(self, ipn_handler):
+        return ipn_handler.to_dict()['OrderReferenceNotification'][
+            'OrderReference']['OrderReferenceStatus']['State']
+
+    def test_replay(self):
+        order_a = 'P01-1111111-1111111'
+        order_b = 'P01-2222222-2222222'
+        tampered = self.message(order_b, 'Open', '2020-01-01T00:00:05.000Z')
+        tampered['TopicArn'] = TOPIC_ARN + 'x'
+        payloads = [
+            self.message(order_a, 'Closed', '2020-01-01T00:00:03.000Z'),
+            self.message(order_b, 'Open', '2020-01-01T00:00:01.000Z'),
+            self.message(order_a, 'Open', '2020-01-01T00:00:01.000Z'),
+            self.message(order_a, 'Suspended', '2020-01-01T00:00:02.000Z'),
+            self.message(order_b, 'Closed', '2020-01-01T00:00:02.000Z'),
+            self.message(order_b, 'Open', '2020-01-01T00:00:01.000Z',
+                         cert_url=CERT_URL.replace('test', 'other')),
+            tampered]
+        # A line as written by SpillLog, with headers
+        stored = self.message(order_b, 'Canceled', '2020-01-01T00:00:03.000Z')
+        lines = self.lines(payloads) + ['\n', 'not json\n', json.dumps({
+            'body': json.dumps(stored),
+            'headers': {'x-amz-sns-topic-arn': TOPIC_ARN}}) + '\n']
+
+        applied = {}
+
+        def callback(ipn_handler):
+            applied.setdefault(order_key(ipn_handler), []).append(
+                self.state(ipn_handler))
+
+        report = IpnReplayer(callback=callback, certificate_store=self.store,
+                             workers=3).replay(lines)
+        self.assertEqual(applied, {
+            order_a: ['Open', 'Suspended', 'Closed'],
+            order_b: ['Open', 'Closed', 'Canceled']})
+        self.assertEqual(report.read, 9)
+        self.assertEqual(report.verified, 6)
+        self.assertEqual(report.applied, 6)
+        self.assertEqual(report.failed, 3)
+        self.assertEqual(sorted(line for line, error in report.errors),
+                         [6, 7, 9])
+        self.assertIn('Certificate not cached', dict(report.errors)[6])
+        self.assertEqual(report.to_dict()['verified'], 6)
+
+    def test_billing_agreement_order(self):
+        order_id = 'S01-1234567-1234567'
+        payloads = [
+            self.message(order_id, 'Closed', '2020-01-01T00:00:03.000Z',
+                         data=BILLING_AGREEMENT_ORDER_DATA),
+            self.message(order_id, 'Closed', '2020-01-01T00:00:02.000Z',
+                         data=AUTHORIZATION_DATA,
+                         notification_type='AuthorizationNotification'),
+            self.message(order_id, 'Open', '2020-01-01T00:00:01.000Z',
+                         data=BILLING_AGREEMENT_ORDER_DATA)]
+        applied = []
+
+        def callback(ipn_handler):
+            applied.append((order_key(ipn_handler),
+                            ipn_handler.notification_type))
+
+        IpnReplayer(callback=callback, certificate_store=self.store,
+                    workers=4).replay(self.lines(payloads))
+        # The order is not keyed by the billing agreement in ParentDetails
+        self.assertEqual(applied, [
+            (order_id, 'OrderReferenceNotification'),
+            (order_id, 'AuthorizationNotification'),
+            (order_id, 'OrderReferenceNotification')])
+
+    def test_apply_failure(self):
+        order_a = 'P01-1111111-1111111'
+        payloads = [
+            self.message(order_a, 'Open', '2020-01-01T00:00:01.000Z'),
+            self.message(order_a, 'Suspended', '2020-01-01T00:00:02.000Z'),
+            self.message(order_a, 'Closed', '2020-01-01T00:00:03.000Z')]
+
+        def callback(ipn_handler):
+            if self.state(ipn_handler) == 'Suspended':
+                raise RuntimeError('database down')
+
+        report = IpnReplayer(callback=callback,
+                             certificate_store=self.store).replay(
+            self.lines(payloads))
+        self.assertEqual(report.applied, 1)
+        self.assertEqual(report.apply_failed, 1)
+        self.assertEqual(report.skipped, 1)
+
+    def test_duplicates(self):
+        payloads = [self.message('P01-1111111-1111111', 'Open',
+                                 '2020-01-01T00:00:01.000Z')]
+        deduplicator = IpnDeduplicator()
+        replayer = IpnReplayer(certificate_store=self.store,
+                               deduplicator=deduplicator)
+        self.assertEqual(replayer.replay(self.lines(payloads)).verified, 1)
+        report = replayer.replay(self.lines(payloads))
+        self.assertEqual(report.verified, 0)
+        self.assertEqual(report.duplicates, 1)
+
+    def test_apply_failure_replayed_again(self):
+        payloads = [self.message('P01-1111111-1111111', 'Open',
+                                 '2020-01-01T00:00:01.000Z')] * 2
+        calls = []
+
+        def callback(ipn_handler):
+            calls.append(ipn_handler)
+            if len(calls) == 1:
+                raise RuntimeError('database down')
+
+        replayer = IpnReplayer(callback=callback,
+                               certificate_store=self.store,
+                               deduplicator=IpnDeduplicator())
+        report = replayer.replay(self.lines(payloads[:1]))
+        self.assertEqual(report.apply_failed, 1)
+        # Stored twice: applied once, then recognized as a duplicate
+        report = replayer.replay(self.lines(payloads))
+        self.assertEqual(report.applied, 1)
+        self.assertEqual(report.duplicates, 1)
+        self.assertEqual(len(calls), 2)
+
+    def test_events_keep_stored_message(self):
+        payload = self.message('P01-1111111-1111111', 'Open',
+                               '2020-01-01T00:00:01.000Z')
+        lines = self.lines([payload])
+        replayer = IpnReplayer(certificate_store=self.store, workers=2)
+        with ThreadPoolExecutor(2) as executor:
+            shards = replayer._verify(executor, lines, ReplayReport())
+        events = [event for shard in shards for events in shard.values()
+                  for event in events]
+        # No parsed IpnHandler is held until the events are applied
+        self.assertEqual(events, [(
+            '2020-01-01T00:00:01.000Z', 1, lines[0].strip(),
+            {'X-Amz-Sns-Message-Type': 'Notification',
+             'X-Amz-Sns-Message-Id': payload['MessageId'],
+             'X-Amz-Sns-Topic-Arn': TOPIC_ARN})])
+
+    def test_main(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        messages = os.path.join(directory, 'messages.ndjson')
+        cert = os.path.join(directory, 'cert.pem')
+        with open(messages, 'w') as f:
+            f.writelines(self.lines([self.message(
+                'P01-1111111-1111111', 'Open', '2020-01-01T00:00:01.000Z')]))
+        with open(cert, 'w') as f:
+            f.write(self.pem)
+        with patch('sys.stdout', new_callable=io.StringIO) as stdout:
+            report = main([messages, '--cert', CERT_URL, cert])
+        self.assertIsInstance(report, ReplayReport)
+        self.assertEqual(json.loads(stdout.getvalue())['verified'], 1)
+        with patch('sys.stdout', new_callable=io.StringIO):
+            self.assertEqual(main([messages]).failed, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+import json
+import base64
+import datetime
+import unittest
+from unittest.mock import patch
+from cryptography import x509
+from cryptography.x509.oid import NameOID
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa, padding
+from amazon_pay import ipn_signature
+from amazon_pay.ipn_handler import IpnHandler
+from amazon_pay.ipn_signature import SignatureVerifier
+import ipn_fixtures
+
+
+def self_signed():
+    """Return a private key and the PEM of its self-signed certificate"""
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'sns.test')])
+    now = datetime.datetime.utcnow()
+    cert = x509.CertificateBuilder().subject_name(name).issuer_name(
+        name).public_key(key.public_key()).serial_number(1).not_valid_before(
+        now).not_valid_after(now + datetime.timedelta(days=1)).sign(
+        key, hashes.SHA256())
+    return key, cert.public_bytes(serialization.Encoding.PEM).decode()
+
+
+class SignatureVerifierTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.key, cls.pem = self_signed()
+
+    def setUp(self):
+        self.body = ipn_fixtures.BODY_VALID
+        self.headers = dict(ipn_fixtures.HEADERS)
+
+    def sign(self, data, digest):
+        return self.key.sign(data, padding.PKCS1v15(), digest)
+
+    def test_verify(self):
+        verifier = SignatureVerifier()
+        data = b'signed string'
+        self.assertTrue(verifier.verify(
+            self.pem, self.sign(data, hashes.SHA1()), data, '1'))
+        self.assertTrue(verifier.verify(
+            self.pem, self.sign(data, hashes.SHA256()), data, '2'))
+        with self.assertRaises(ValueError):
+            verifier.verify(
+                self.pem, self.sign(data, hashes.SHA1()), data, '2')
+        with self.assertRaises(ValueError):
+            verifier.verify(
+                self.pem, self.sign(data, hashes.SHA1()), data, '3')
+        with self.assertRaises(ValueError):
+            verifier.verify('not a certificate', b'', data)
+        # The certificate was parsed once
+        self.assertEqual(len(verifier._keys), 1)
+
+    def test_pyopenssl_fallback(self):
+        data = b'signed string'
+        with patch.object(ipn_signature, 'load_pem_x509_certificate', None):
+            from OpenSSL import crypto
+            with patch.object(ipn_signature, 'crypto', crypto, create=True):
+                verifier = SignatureVerifier()
+                self.assertEqual(verifier.backend, 'pyopenssl')
+                self.assertTrue(verifier.verify(
+                    self.pem, self.sign(data, hashes.SHA256()), data, '2'))
+                with self.assertRaises(ValueError):
+                    verifier.verify(self.pem, b'invalid', data, '2')
+
+    def test_signature_version_2(self):
+        payload = json.loads(self.body)
+        payload['SignatureVersion'] = '2'
+        signing_string = ''.join(
+            '{}\n{}\n'.format(name, payload[name])
+            for name in ('Message', 'MessageId', 'Timestamp', 'TopicArn',
+                         'Type'))
+        payload['Signature'] = base64.b64encode(self.sign(
+            signing_string.encode('utf-8'), hashes.SHA256())).decode()
+        ipn_handler = IpnHandler(json.dumps(payload), self.headers)
+        ipn_handler._pem = self.pem
+        self.assertTrue(ipn_handler._validate_signature())
+
+        payload['SignatureVersion'] = '1'
+        ipn_handler = IpnHandler(json.dumps(payload), self.headers)
+        ipn_handler._pem = self.pem
+        with self.assertRaises(ValueError):
+            ipn_handler._validate_signature()
+        self.assertEqual(ipn_handler.error, 'Invalid signature.')
+
+    def test_null_subject_not_signed(self):
+        payload = json.loads(self.body)
+        payload['Subject'] = None
+        signing_string = ''.join(
+            '{}\n{}\n'.format(name, payload[name])
+            for name in ('Message', 'MessageId', 'Timestamp', 'TopicArn',
+                         'Type'))
+        payload['Signature'] = base64.b64encode(self.sign(
+            signing_string.encode('utf-8'), hashes.SHA1())).decode()
+        ipn_handler = IpnHandler(json.dumps(payload), self.headers)
+        ipn_handler._pem = self.pem
+        self.assertTrue(ipn_handler._validate_signature())
+
+
+if __name__ == "__main__":
+    unittest.main()
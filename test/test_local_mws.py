@@ -0,0 +1,205 @@
+import unittest
+from unittest.mock import patch
+from amazon_pay.client import AmazonPayClient
+from amazon_pay.local_mws import LocalMwsServer
+from amazon_pay.metrics import InMemoryMetricsSink
+
+
+class LocalMwsServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = LocalMwsServer(seed=1).start()
+        self.client = AmazonPayClient(
+            mws_access_key=self.server.mws_access_key,
+            mws_secret_key=self.server.mws_secret_key,
+            merchant_id='merchant_id',
+            handle_throttle=True,
+            sandbox=True,
+            region='na',
+            currency_code='USD',
+            mws_endpoint=self.server.endpoint)
+        self.order_id = 'S01-1111111-2222222'
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_invalid_signature(self):
+        client = AmazonPayClient(
+            mws_access_key=self.server.mws_access_key,
+            mws_secret_key='wrong_secret',
+            merchant_id='merchant_id',
+            region='na',
+            currency_code='USD',
+            mws_endpoint=self.server.endpoint)
+        response = client.get_service_status()
+        self.assertFalse(response.success)
+        self.assertEqual(
+            response.to_dict()['ErrorResponse']['Error']['Code'],
+            'SignatureDoesNotMatch')
+
+    def test_order_lifecycle(self):
+        response = self.client.set_order_reference_details(
+            amazon_order_reference_id=self.order_id,
+            order_total='10.00',
+            seller_note='note',
+            seller_order_id='ORDER-1')
+        self.assertTrue(response.success)
+        self.assertTrue(self.client.confirm_order_reference(
+            amazon_order_reference_id=self.order_id).success)
+
+        response = self.client.authorize(
+            amazon_order_reference_id=self.order_id,
+            authorization_reference_id='auth-1',
+            authorization_amount='10.00')
+        authorization_id = response.to_dict()['AuthorizeResponse'][
+            'AuthorizeResult']['AuthorizationDetails']['AmazonAuthorizationId']
+
+        response = self.client.capture(
+            amazon_authorization_id=authorization_id,
+            capture_reference_id='capture-1',
+            capture_amount='10.00')
+        capture_id = response.to_dict()['CaptureResponse']['CaptureResult'][
+            'CaptureDetails']['AmazonCaptureId']
+
+        self.assertTrue(self.client.refund(
+            amazon_capture_id=capture_id,
+            refund_reference_id='refund-1',
+            refund_amount='4.00').success)
+        response = self.client.refund(
+            amazon_capture_id=capture_id,
+            refund_reference_id='refund-2',
+            refund_amount='7.00')
+        self.assertEqual(
+            response.to_dict()['ErrorResponse']['Error']['Code'],
+            'InvalidRefundAmount')
+
+        details = self.client.get_payment_details(
+            amazon_order_reference_id=self.order_id)
+        self.assertEqual(
+            [list(r.to_dict())[0] for r in details],
+            ['GetOrderReferenceDetailsResponse',
+             'GetAuthorizationDetailsResponse',
+             'GetCaptureDetailsResponse',
+             'GetRefundDetailsResponse'])
+
+        response = self.client.authorize(
+            amazon_order_reference_id=self.order_id,
+            authorization_reference_id='auth-1',
+            authorization_amount='1.00')
+        self.assertEqual(
+            response.to_dict()['ErrorResponse']['Error']['Code'],
+            'DuplicateReferenceId')
+
+    def test_charge_billing_agreement(self):
+        response = self.client.charge(
+            amazon_reference_id='C01-1111111-2222222',
+            charge_amount='5.00',
+            authorize_reference_id='charge-1',
+            charge_note='note')
+        details = response.to_dict()['AuthorizeOnBillingAgreementResponse'][
+            'AuthorizeOnBillingAgreementResult']['AuthorizationDetails']
+        self.assertEqual(details['CaptureNow'], 'true')
+        self.assertEqual(
+            details['AuthorizationStatus']['ReasonCode'],
+            'MaxCapturesProcessed')
+
+    def test_list_order_reference_pages(self):
+        for _ in range(3):
+            self.server.state.create_order(
+                amount=1, seller_order_id='QUERY', state='Open')
+        response = self.client.list_order_reference(
+            query_id='QUERY', query_id_type='SellerOrderId', page_size=2)
+        result = response.to_dict()['ListOrderReferenceResponse'][
+            'ListOrderReferenceResult']
+        self.assertEqual(
+            len(result['OrderReferenceList']['OrderReference']), 2)
+
+        response = self.client.list_order_reference_by_next_token(
+            next_page_token=result['NextPageToken'])
+        result = response.to_dict()['ListOrderReferenceByNextTokenResponse'][
+            'ListOrderReferenceByNextTokenResult']
+        self.assertNotIn('NextPageToken', result)
+        self.assertEqual(
+            result['OrderReferenceList']['OrderReference'][
+                'SellerOrderAttributes']['SellerOrderId'], 'QUERY')
+
+    def test_list_order_reference_stream(self):
+        for _ in range(5):
+            self.server.state.create_order(
+                amount=1, seller_order_id='STREAM', state='Open')
+        response = self.client.list_order_reference(
+            query_id='STREAM', query_id_type='SellerOrderId', page_size=3,
+            stream=True)
+        orders = list(response)
+        self.assertEqual(len(orders), 3)
+        self.assertEqual(
+            orders[0]['SellerOrderAttributes']['SellerOrderId'], 'STREAM')
+        self.assertIsNotNone(response.next_page_token)
+        self.assertIsNotNone(response.request_id)
+
+        response = self.client.list_order_reference_by_next_token(
+            next_page_token=response.next_page_token, stream=True)
+        self.assertEqual(len(list(response)), 2)
+        self.assertIsNone(response.next_page_token)
+
+        response = self.client.list_order_reference_by_next_token(
+            next_page_token='invalid', stream=True)
+        self.assertFalse(response.success)
+
+    def test_compressed_responses(self):
+        for _ in range(20):
+            self.server.state.create_order(
+                amount=1, seller_order_id='GZIP', state='Open')
+        sink = InMemoryMetricsSink()
+        self.client.metrics = sink
+        labels = {'action': 'ListOrderReference', 'seller_id': 'merchant_id'}
+
+        response = self.client.list_order_reference(
+            query_id='GZIP', query_id_type='SellerOrderId')
+        self.assertTrue(response.success)
+        size = sink.counter('response_bytes_total', **labels)
+        wire = sink.counter('response_wire_bytes_total', **labels)
+        self.assertEqual(size, len(response.to_xml().encode('utf-8')))
+        self.assertLess(wire, size / 2)
+
+        response = self.client.list_order_reference(
+            query_id='GZIP', query_id_type='SellerOrderId', stream=True)
+        self.assertEqual(len(list(response)), 20)
+        self.assertEqual(
+            sink.counter('response_bytes_total', **labels), 2 * size)
+        self.assertLess(
+            sink.counter('response_wire_bytes_total', **labels), size)
+
+        client = AmazonPayClient(
+            mws_access_key=self.server.mws_access_key,
+            mws_secret_key=self.server.mws_secret_key,
+            merchant_id='merchant_id',
+            region='na',
+            currency_code='USD',
+            mws_endpoint=self.server.endpoint,
+            metrics=sink,
+            compress_responses=False)
+        client.get_service_status()
+        labels['action'] = 'GetServiceStatus'
+        self.assertEqual(
+            sink.counter('response_wire_bytes_total', **labels),
+            sink.counter('response_bytes_total', **labels))
+
+    @patch('time.sleep')
+    def test_throttle_injection(self, mock_sleep):
+        self.server.fail_next(503, count=2)
+        response = self.client.get_service_status()
+        self.assertTrue(response.success)
+        self.assertEqual(self.server.stats['throttled'], 2)
+        self.assertEqual(self.server.stats['GetServiceStatus'], 3)
+
+    def test_unknown_authorization(self):
+        response = self.client.get_authorization_details(
+            amazon_authorization_id='S01-1111111-2222222-A000000')
+        self.assertEqual(
+            response.to_dict()['ErrorResponse']['Error']['Code'],
+            'InvalidAuthorizationId')
+
+
+if __name__ == "__main__":
+    unittest.main()
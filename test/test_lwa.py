@@ -1,6 +1,9 @@
+import asyncio
+import threading
 import unittest
 from unittest.mock import Mock, patch
-from amazon_pay.login_with_amazon import LoginWithAmazon
+from amazon_pay.login_with_amazon import LoginWithAmazon, \
+    AsyncLoginWithAmazon
 
 
 class LoginWithAmazonClientTest(unittest.TestCase):
@@ -52,6 +55,102 @@ class LoginWithAmazonClientTest(unittest.TestCase):
             access_token='access_token')
         print(res)
 
+    def test_session_and_cache(self):
+        now = [1000.0]
+        session = Mock()
+        responses = {
+            '/auth/o2/tokeninfo': {'aud': 'client_id', 'exp': 60},
+            '/user/profile': {'user_id': 'amzn1.account.test'}}
+        session.get.side_effect = lambda url, headers, params, verify: Mock(
+            **{'json.return_value': dict(
+                responses[url[len(lwa_client._endpoint):]])})
+        lwa_client = LoginWithAmazon(
+            client_id='client_id', region='na', sandbox=True,
+            session=session, cache_ttl=300, clock=lambda: now[0])
+
+        profile = lwa_client.get_login_profile(access_token='token')
+        self.assertEqual(profile, {'user_id': 'amzn1.account.test'})
+        self.assertEqual(session.get.call_count, 2)
+        self.assertEqual(lwa_client.get_login_profile('token'), profile)
+        self.assertEqual(session.get.call_count, 2)
+        self.assertNotIn('token', str(list(lwa_client._cache)))
+
+        # Cached no longer than the token is valid
+        now[0] += 61
+        lwa_client.get_login_profile('token')
+        self.assertEqual(session.get.call_count, 4)
+
+        # Invalid tokens are not cached
+        responses['/auth/o2/tokeninfo'] = {'aud': 'other'}
+        for _ in range(2):
+            with self.assertRaises(ValueError):
+                lwa_client.get_login_profile('other_token')
+        self.assertEqual(session.get.call_count, 6)
+
+    def test_cache_disabled_by_default(self):
+        session = Mock(**{'get.return_value': Mock(
+            **{'json.return_value': {'aud': 'client_id'}})})
+        lwa_client = LoginWithAmazon(
+            client_id='client_id', region='na', session=session)
+        for _ in range(2):
+            lwa_client.get_login_profile('token')
+        self.assertEqual(session.get.call_count, 4)
+
+    def concurrent_session(self, token_info):
+        """Session whose calls only return once tokeninfo and profile are
+        both in flight
+        """
+        both_sent = threading.Barrier(2, timeout=5)
+        responses = {'/auth/o2/tokeninfo': token_info,
+                     '/user/profile': {'user_id': 'amzn1.account.test'}}
+
+        def get(url, headers, params, verify):
+            both_sent.wait()
+            return Mock(**{'json.return_value': dict(
+                responses[url.split('amazon.com', 1)[1]])})
+        return Mock(**{'get.side_effect': get})
+
+    def test_concurrent(self):
+        lwa_client = LoginWithAmazon(
+            client_id='client_id', region='na', concurrent=True,
+            cache_ttl=300,
+            session=self.concurrent_session({'aud': 'client_id'}))
+        self.assertEqual(lwa_client.get_login_profile('token'),
+                         {'user_id': 'amzn1.account.test'})
+
+        lwa_client.session = self.concurrent_session({'aud': 'other'})
+        with self.assertRaises(ValueError):
+            lwa_client.get_login_profile('other_token')
+        self.assertEqual(len(lwa_client._cache), 1)
+
+        executor = lwa_client._executor
+        with lwa_client:
+            pass
+        self.assertIsNone(lwa_client._executor)
+        with self.assertRaises(RuntimeError):
+            executor.submit(print)
+
+    def test_async(self):
+        for concurrent in (False, True):
+            session = self.concurrent_session({'aud': 'client_id'}) \
+                if concurrent else Mock(**{'get.return_value': Mock(
+                    **{'json.return_value': {'aud': 'client_id'}})})
+            lwa_client = AsyncLoginWithAmazon(
+                client_id='client_id', region='na', session=session,
+                concurrent=concurrent, cache_ttl=300)
+            profile = asyncio.run(lwa_client.get_login_profile('token'))
+            self.assertIn('aud' if not concurrent else 'user_id', profile)
+            self.assertEqual(session.get.call_count, 2)
+            asyncio.run(lwa_client.get_login_profile('token'))
+            self.assertEqual(session.get.call_count, 2)
+
+        lwa_client = AsyncLoginWithAmazon(
+            client_id='client_id', region='na', concurrent=True,
+            session=self.concurrent_session({'aud': 'other'}))
+        with self.assertRaises(ValueError):
+            asyncio.run(lwa_client.get_login_profile('token'))
+        self.assertEqual(len(lwa_client._cache), 0)
+
     def test_invalid_region(self):
         with self.assertRaises(KeyError):
             LoginWithAmazon(client_id='test', region='xx', sandbox=True)
@@ -0,0 +1,103 @@
+import unittest
+from unittest.mock import Mock, patch
+from amazon_pay.client import AmazonPayClient
+from amazon_pay.metrics import InMemoryMetricsSink
+
+
+class InMemoryMetricsSinkTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sink = InMemoryMetricsSink(buckets=(0.1, 1.0))
+
+    def test_counter(self):
+        self.sink.increment('requests_total', {'action': 'Capture'})
+        self.sink.increment('requests_total', {'action': 'Capture'}, 2)
+        self.assertEqual(
+            self.sink.counter('requests_total', action='Capture'), 3)
+        self.assertEqual(
+            self.sink.counter('requests_total', action='Refund'), 0)
+
+    def test_histogram(self):
+        for value in (0.05, 0.5, 5):
+            self.sink.observe('phase_seconds', {'phase': 'network'}, value)
+        histogram = self.sink.histogram('phase_seconds', phase='network')
+        self.assertEqual(histogram['buckets'], [1, 1])
+        self.assertEqual(histogram['count'], 3)
+        self.assertAlmostEqual(histogram['sum'], 5.55)
+
+    def test_to_prometheus(self):
+        self.sink.increment('retries_total', {'action': 'Authorize'})
+        self.sink.observe('phase_seconds', {'phase': 'sign'}, 0.05)
+        self.assertEqual(
+            self.sink.to_prometheus(),
+            '# TYPE amazon_pay_retries_total counter\n'
+            'amazon_pay_retries_total{action="Authorize"} 1\n'
+            '# TYPE amazon_pay_phase_seconds histogram\n'
+            'amazon_pay_phase_seconds_bucket{phase="sign",le="0.1"} 1\n'
+            'amazon_pay_phase_seconds_bucket{phase="sign",le="1.0"} 1\n'
+            'amazon_pay_phase_seconds_bucket{phase="sign",le="+Inf"} 1\n'
+            'amazon_pay_phase_seconds_sum{phase="sign"} 0.05\n'
+            'amazon_pay_phase_seconds_count{phase="sign"} 1\n')
+
+
+class ClientMetricsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sink = InMemoryMetricsSink()
+        self.client = AmazonPayClient(
+            mws_access_key='mws_access_key',
+            mws_secret_key='mws_secret_key',
+            merchant_id='merchant_id',
+            handle_throttle=True,
+            sandbox=True,
+            region='na',
+            currency_code='USD',
+            metrics=self.sink)
+        self.status_codes = []
+
+    def mock_requests_post(self, url, data=None, headers=None, verify=False,
+                           timeout=None):
+        mock_response = Mock()
+        mock_response.status_code = self.status_codes.pop(0)
+        mock_response.text = '<GetServiceStatusResponse>\
+            </GetServiceStatusResponse>'
+        mock_response.content = mock_response.text.encode('utf-8')
+        return mock_response
+
+    @patch('time.sleep')
+    @patch('requests.post')
+    def test_records_throttle_and_retry(self, mock_urlopen, mock_sleep):
+        self.status_codes = [503, 200]
+        mock_urlopen.side_effect = self.mock_requests_post
+        self.client.get_service_status()
+
+        labels = {'action': 'GetServiceStatus', 'seller_id': 'merchant_id'}
+        self.assertEqual(self.sink.counter(
+            'requests_total', status='503', **labels), 1)
+        self.assertEqual(self.sink.counter(
+            'requests_total', status='200', **labels), 1)
+        self.assertEqual(self.sink.counter('throttles_total', **labels), 1)
+        self.assertEqual(self.sink.counter('retries_total', **labels), 1)
+        self.assertEqual(self.sink.counter(
+            'throttle_sleep_seconds_total', **labels), 1)
+        self.assertEqual(
+            self.sink.counter('request_bytes_total', **labels),
+            2 * len(mock_urlopen.call_args[1]['data']))
+        for phase in ('sign', 'network', 'parse'):
+            self.assertEqual(self.sink.histogram(
+                'phase_seconds', phase=phase, **labels)['count'], 2)
+
+    @patch('requests.post')
+    def test_seller_id_label(self, mock_urlopen):
+        self.status_codes = [200]
+        mock_urlopen.side_effect = self.mock_requests_post
+        self.client.get_capture_details(
+            amazon_capture_id='P01-0000000-0000000-C000000',
+            merchant_id='OTHER_SELLER')
+        self.assertEqual(self.sink.counter(
+            'requests_total', action='GetCaptureDetails',
+            seller_id='OTHER_SELLER', status='200'), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,169 @@
+import os
+import shutil
+import sqlite3
+import datetime
+import tempfile
+import unittest
+from unittest.mock import patch
+from amazon_pay.client import AmazonPayClient
+from amazon_pay.local_mws import LocalMwsServer
+from amazon_pay.order_index import OrderIndex
+
+
+ORDER_ID = 'S01-0000000-0000000'
+
+
+class OrderIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.index = OrderIndex()
+
+    def order(self, state, updated, authorizations=None):
+        return {'GetOrderReferenceDetailsResponse': {
+            'GetOrderReferenceDetailsResult': {'OrderReferenceDetails': {
+                'AmazonOrderReferenceId': ORDER_ID,
+                'OrderTotal': {'Amount': '10.00', 'CurrencyCode': 'USD'},
+                'SellerOrderAttributes': {'SellerOrderId': 'order-1'},
+                'IdList': {'member': authorizations} if authorizations
+                else None,
+                'OrderReferenceStatus': {
+                    'State': state, 'LastUpdateTimestamp': updated},
+                'CreationTimestamp': '2026-01-01T00:00:00.000Z'}}}}
+
+    def test_record_order(self):
+        self.assertEqual(self.index.record(
+            self.order('Open', '2026-01-01T00:00:01.000Z')), 1)
+        order = self.index.order(ORDER_ID)
+        self.assertEqual(order['state'], 'Open')
+        self.assertEqual(order['amount'], '10.00')
+        self.assertEqual(
+            self.index.orders_by_seller_order_id('order-1'), [order])
+
+        self.index.record(self.order('Closed', '2026-01-01T00:00:03.000Z'))
+        self.index.record(self.order('Open', '2026-01-01T00:00:02.000Z'))
+        self.assertEqual(self.index.order(ORDER_ID)['state'], 'Closed')
+        self.assertIsNone(self.index.order('S01-0000000-0000001'))
+
+    def test_record_payments(self):
+        self.index.record(self.order(
+            'Open', '2026-01-01T00:00:01.000Z',
+            [ORDER_ID + '-A000001', ORDER_ID + '-A000002']))
+        self.index.record({'CaptureResponse': {'CaptureResult': {
+            'CaptureDetails': {
+                'AmazonCaptureId': ORDER_ID + '-C000001',
+                'CaptureReferenceId': 'capture-1',
+                'CaptureAmount': {'Amount': '4.00', 'CurrencyCode': 'USD'},
+                'IdList': {'member': ORDER_ID + '-R000001'},
+                'CaptureStatus': {
+                    'State': 'Completed',
+                    'LastUpdateTimestamp': '2026-01-01T00:00:05.000Z'}}}}})
+
+        authorizations = self.index.payments(ORDER_ID, kind='authorization')
+        self.assertEqual([a['object_id'] for a in authorizations],
+                         [ORDER_ID + '-A000001', ORDER_ID + '-A000002'])
+        self.assertIsNone(authorizations[0]['state'])
+        self.assertEqual(authorizations[0]['parent_id'], ORDER_ID)
+
+        capture = self.index.payment(ORDER_ID + '-C000001')
+        self.assertEqual(capture['order_id'], ORDER_ID)
+        self.assertEqual(capture['reference_id'], 'capture-1')
+        self.assertEqual(capture['state'], 'Completed')
+        self.assertEqual(capture['amount'], '4.00')
+        refund = self.index.payment(ORDER_ID + '-R000001')
+        self.assertEqual(refund['kind'], 'refund')
+        self.assertEqual(refund['parent_id'], ORDER_ID + '-C000001')
+        self.assertEqual(len(self.index.payments(ORDER_ID)), 4)
+
+    def test_persistent(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'orders.db')
+            index = OrderIndex(path)
+            index.record(self.order('Open', '2026-01-01T00:00:01.000Z'))
+            index.set_checkpoint('name', 'value')
+            index.close()
+            index = OrderIndex(path)
+            self.assertEqual(index.order(ORDER_ID)['state'], 'Open')
+            self.assertEqual(index.checkpoint('name'), 'value')
+            index.close()
+        finally:
+            shutil.rmtree(directory)
+
+
+class OrderIndexClientTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = LocalMwsServer(seed=1).start()
+        self.index = OrderIndex()
+        self.client = AmazonPayClient(
+            mws_access_key=self.server.mws_access_key,
+            mws_secret_key=self.server.mws_secret_key,
+            merchant_id='merchant_id',
+            sandbox=True,
+            region='na',
+            currency_code='USD',
+            mws_endpoint=self.server.endpoint,
+            order_index=self.index)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_responses_recorded(self):
+        order_id = self.server.state.create_order(
+            amount=10, seller_order_id='order-1', state='Open')
+        response = self.client.authorize(
+            amazon_order_reference_id=order_id,
+            authorization_reference_id='authorization-1',
+            authorization_amount='10.00',
+            capture_now=True)
+        self.assertTrue(response.success)
+        authorization_id = response.to_dict()['AuthorizeResponse'][
+            'AuthorizeResult']['AuthorizationDetails']['AmazonAuthorizationId']
+        authorization = self.index.payment(authorization_id)
+        self.assertEqual(authorization['order_id'], order_id)
+        self.assertEqual(authorization['reference_id'], 'authorization-1')
+
+        self.client.get_order_reference_details(
+            amazon_order_reference_id=order_id)
+        self.assertEqual(self.index.order(order_id)['seller_order_id'],
+                         'order-1')
+        self.assertEqual(self.index.payment(authorization_id)['parent_id'],
+                         order_id)
+
+    def test_index_failure_ignored(self):
+        order_id = self.server.state.create_order(
+            amount=10, seller_order_id='order-1', state='Open')
+        with patch.object(self.index, 'record_response',
+                          side_effect=sqlite3.OperationalError(
+                              'database is locked')):
+            response = self.client.authorize(
+                amazon_order_reference_id=order_id,
+                authorization_reference_id='authorization-1',
+                authorization_amount='10.00')
+        self.assertTrue(response.success)
+
+    def test_sync(self):
+        start = datetime.datetime.utcnow() - datetime.timedelta(minutes=1)
+        for _ in range(5):
+            self.server.state.create_order(
+                amount=1, seller_order_id='SYNC', state='Open')
+        end = datetime.datetime.utcnow() + datetime.timedelta(minutes=1)
+        with self.assertRaises(ValueError):
+            self.index.sync(self.client, 'SYNC')
+        self.assertEqual(self.index.sync(
+            self.client, 'SYNC', start=start, end=end, page_size=2), 5)
+        self.assertEqual(len(self.index.orders_by_seller_order_id('SYNC')), 5)
+
+        self.server.state.create_order(
+            amount=1, seller_order_id='SYNC', state='Open')
+        # The overlap with the previous window lists the first orders again
+        self.assertEqual(self.index.sync(
+            self.client, 'SYNC', end=end + datetime.timedelta(minutes=1)), 6)
+        self.assertEqual(self.index.checkpoint('list:SellerOrderId:SYNC'),
+                         (end + datetime.timedelta(minutes=1)).strftime(
+                             '%Y-%m-%dT%H:%M:%SZ'))
+        self.assertEqual(len(self.index.orders_by_seller_order_id('SYNC')), 6)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+import os
+import logging
+import shutil
+import tempfile
+import unittest
+from unittest.mock import Mock, patch
+from amazon_pay.client import AmazonPayClient
+from amazon_pay.profiler import Profiler
+
+
+class ProfilerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.profiler = Profiler()
+        self.client = AmazonPayClient(
+            mws_access_key='mws_access_key',
+            mws_secret_key='mws_secret_key',
+            merchant_id='merchant_id',
+            handle_throttle=False,
+            sandbox=True,
+            region='na',
+            currency_code='USD',
+            profiler=self.profiler)
+
+    def mock_requests_post(self, url, data=None, headers=None, verify=False,
+                           timeout=None):
+        mock_response = Mock()
+        mock_response.text = '<GetServiceStatusResponse>\
+            <GetServiceStatusResult><Status>GREEN</Status>\
+            </GetServiceStatusResult></GetServiceStatusResponse>'
+        mock_response.content = mock_response.text.encode('utf-8')
+        mock_response.status_code = 200
+        return mock_response
+
+    @patch('requests.post')
+    def test_phases(self, mock_urlopen):
+        mock_urlopen.side_effect = self.mock_requests_post
+        logger = logging.getLogger('__amazon_pay_sdk__')
+        self.addCleanup(logger.setLevel, logger.level)
+        logger.setLevel(logging.DEBUG)
+        self.client.get_service_status().to_dict()
+        self.client.get_service_status()
+
+        stats = self.profiler.stats()
+        self.assertEqual(self.profiler.sampled_calls, 2)
+        self.assertEqual(
+            sorted(path[1:] for path in stats),
+            [('http',), ('parse',), ('querystring',), ('querystring', 'sign'),
+             ('sanitize',), ('to_dict',)])
+        self.assertEqual(stats[('GetServiceStatus', 'querystring')]['calls'], 2)
+        self.assertEqual(stats[('GetServiceStatus', 'to_dict')]['calls'], 1)
+        self.assertEqual(stats[('GetServiceStatus', 'sanitize')]['calls'], 4)
+        self.assertIn('GetServiceStatus/querystring/sign',
+                      self.profiler.report())
+
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'stacks.txt')
+            self.profiler.write_collapsed(path)
+            with open(path) as f:
+                lines = f.read().splitlines()
+        finally:
+            shutil.rmtree(directory)
+        for line in lines:
+            stack, micros = line.rsplit(' ', 1)
+            self.assertTrue(stack.startswith('amazon_pay;GetServiceStatus;'))
+            self.assertGreater(int(micros), 0)
+
+        self.profiler.reset()
+        self.assertEqual(self.profiler.stats(), {})
+
+    @patch('requests.post')
+    def test_sampling(self, mock_urlopen):
+        mock_urlopen.side_effect = self.mock_requests_post
+        self.client.profiler = Profiler(sample_rate=0)
+        self.client.get_service_status().to_dict()
+        self.assertEqual(self.client.profiler.stats(), {})
+        self.assertEqual(self.client.profiler.sampled_calls, 0)
+
+        profiler = Profiler(sample_rate=0.5, seed=3)
+        for _ in range(200):
+            profiler.sample()
+        self.assertTrue(50 < profiler.sampled_calls < 150)
+
+        with self.assertRaises(ValueError):
+            Profiler(sample_rate=2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+import os
+import shutil
+import datetime
+import tempfile
+import unittest
+from amazon_pay.client import AmazonPayClient
+from amazon_pay.local_mws import LocalMwsServer
+from amazon_pay.order_index import OrderIndex
+from amazon_pay.reconcile import Quota, Reconciler, time_windows
+
+
+class QuotaTest(unittest.TestCase):
+
+    def test_time_windows(self):
+        start = datetime.datetime(2026, 1, 1)
+        windows = list(time_windows(
+            start, start + datetime.timedelta(minutes=150), 3600))
+        self.assertEqual(len(windows), 3)
+        self.assertEqual(windows[0][0], start)
+        self.assertEqual(windows[-1][1],
+                         start + datetime.timedelta(minutes=150))
+
+    def test_token_bucket(self):
+        now = [0.0]
+        sleeps = []
+
+        def sleep(seconds):
+            sleeps.append(seconds)
+            now[0] += seconds
+
+        quota = Quota({'ListOrderReference': (2, 0.5)},
+                      clock=lambda: now[0], sleep=sleep)
+        for _ in range(3):
+            quota.acquire('ListOrderReference')
+        self.assertEqual(sleeps, [2.0])
+        quota.acquire('Capture')
+        self.assertEqual(len(sleeps), 1)
+
+
+class ReconcilerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = LocalMwsServer(seed=1).start()
+        self.client = AmazonPayClient(
+            mws_access_key=self.server.mws_access_key,
+            mws_secret_key=self.server.mws_secret_key,
+            merchant_id='merchant_id',
+            sandbox=True,
+            region='na',
+            currency_code='USD',
+            mws_endpoint=self.server.endpoint)
+        self.start = datetime.datetime.utcnow() - datetime.timedelta(hours=1)
+        self.end = datetime.datetime.utcnow() + datetime.timedelta(minutes=1)
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.directory)
+
+    def test_reconcile(self):
+        state = self.server.state
+        closed = state.create_order(
+            amount=5, seller_order_id='REC', state='Closed')
+        captured = state.create_order(
+            amount=10, seller_order_id='REC', state='Open')
+        self.assertTrue(self.client.authorize(
+            amazon_order_reference_id=captured,
+            authorization_reference_id='authorization-1',
+            authorization_amount='10.00',
+            capture_now=True).success)
+        missing = state.create_order(
+            amount=1, seller_order_id='REC', state='Open')
+        local = {closed: {'state': 'Open', 'amount': '5'},
+                 captured: {'state': 'Open', 'captured': '10.00'}}
+
+        index = OrderIndex()
+        checkpoint_path = os.path.join(self.directory, 'reconcile.json')
+        reconciler = Reconciler(
+            self.client, local, index=index, window=600, workers=3,
+            quotas={'GetOrderReferenceDetails': None},
+            checkpoint_path=checkpoint_path)
+        differences = sorted(
+            (d.to_dict() for d in reconciler.reconcile(
+                'REC', self.start, self.end)),
+            key=lambda d: d['order_id'])
+        expected = sorted([
+            {'order_id': closed, 'field': 'state', 'amazon': 'Closed',
+             'local': 'Open'},
+            {'order_id': missing, 'field': None, 'amazon': None,
+             'local': None}], key=lambda d: d['order_id'])
+        self.assertEqual(differences, expected)
+        self.assertEqual(reconciler.stats['windows'], 7)
+        self.assertEqual(reconciler.stats['orders'], 3)
+        self.assertEqual(index.payment(
+            index.payments(captured, kind='capture')[0]['object_id'])[
+                'state'], 'Completed')
+
+        # Every window is in the checkpoint
+        self.assertEqual(list(reconciler.reconcile(
+            'REC', self.start, self.end)), [])
+
+        # Without the checkpoint, the closed order and the closed
+        # authorization are answered by the index; the open orders and the
+        # completed capture are fetched again
+        reconciler = Reconciler(self.client, local, index=index, window=600)
+        self.assertEqual(len(list(reconciler.reconcile(
+            'REC', self.start, self.end))), 2)
+        self.assertEqual(reconciler.stats['orders'], 3)
+        self.assertEqual(reconciler.stats['fetched'], 3)
+        self.assertEqual(self.client.hooks._callbacks['before_sign'], [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,134 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import Mock, patch
+from amazon_pay.client import AmazonPayClient
+from amazon_pay.response_cache import ResponseCache, MemoryCacheBackend, \
+    SqliteCacheBackend, object_root
+
+
+class CacheBackendTest(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 0
+        self.ticks = 0
+
+    def clock(self):
+        self.ticks += 1
+        return self.now + self.ticks * 1e-6
+
+    def check_backend(self, backend):
+        backend.set('a', '<a/>', 10, {'P01-0000000-0000000'})
+        backend.set('b', '<b/>', 20, {'P01-0000000-0000000'})
+        backend.set('c', '<c/>', 30, {'C01-0000000-0000000'})
+        self.assertEqual(backend.get('a'), '<a/>')
+        self.now = 15
+        self.assertIsNone(backend.get('a'))
+        self.assertEqual(backend.invalidate('P01-0000000-0000000'), 1)
+        self.assertIsNone(backend.get('b'))
+        self.assertEqual(backend.get('c'), '<c/>')
+
+        backend.set('d', '<d/>', 30, set())
+        backend.get('c')
+        backend.set('e', '<e/>', 30, set())
+        backend.set('f', '<f/>', 30, set())
+        self.assertIsNone(backend.get('d'))
+        self.assertEqual(backend.get('c'), '<c/>')
+        backend.clear()
+        self.assertIsNone(backend.get('c'))
+
+    def test_memory_backend(self):
+        self.check_backend(MemoryCacheBackend(max_entries=3, clock=self.clock))
+
+    def test_sqlite_backend(self):
+        directory = tempfile.mkdtemp()
+        try:
+            backend = SqliteCacheBackend(
+                os.path.join(directory, 'cache.db'), max_entries=3,
+                clock=self.clock)
+            self.check_backend(backend)
+            backend.close()
+        finally:
+            shutil.rmtree(directory)
+
+    def test_object_root(self):
+        self.assertEqual(object_root('P01-1234567-1234567-A123456'),
+                         'P01-1234567-1234567')
+        self.assertEqual(object_root('S01-1234567-1234567'),
+                         'S01-1234567-1234567')
+        self.assertEqual(object_root('other'), 'other')
+
+
+class ClientCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = ResponseCache(ttls={'GetCaptureDetails': 0})
+        self.client = AmazonPayClient(
+            mws_access_key='mws_access_key',
+            mws_secret_key='mws_secret_key',
+            merchant_id='merchant_id',
+            handle_throttle=False,
+            sandbox=True,
+            region='na',
+            currency_code='USD',
+            response_cache=self.cache)
+        self.status_code = 200
+
+    def mock_requests_post(self, url, data=None, headers=None, verify=False,
+                           timeout=None):
+        mock_response = Mock()
+        mock_response.status_code = self.status_code
+        mock_response.text = '<GetAuthorizationDetailsResponse>\
+            <GetAuthorizationDetailsResult><AuthorizationDetails>\
+            <AmazonAuthorizationId>P01-1234567-1234567-A123456\
+            </AmazonAuthorizationId></AuthorizationDetails>\
+            </GetAuthorizationDetailsResult>\
+            </GetAuthorizationDetailsResponse>'
+        mock_response.content = mock_response.text.encode('utf-8')
+        return mock_response
+
+    def get_authorization_details(self):
+        return self.client.get_authorization_details(
+            amazon_authorization_id='P01-1234567-1234567-A123456')
+
+    @patch('requests.post')
+    def test_read_through(self, mock_urlopen):
+        mock_urlopen.side_effect = self.mock_requests_post
+        first = self.get_authorization_details()
+        second = self.get_authorization_details()
+        self.assertEqual(mock_urlopen.call_count, 1)
+        self.assertEqual(first.to_dict(), second.to_dict())
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+        self.client.get_capture_details(
+            amazon_capture_id='P01-1234567-1234567-C123456')
+        self.client.get_capture_details(
+            amazon_capture_id='P01-1234567-1234567-C123456')
+        self.assertEqual(mock_urlopen.call_count, 3)
+
+    @patch('requests.post')
+    def test_write_invalidates(self, mock_urlopen):
+        mock_urlopen.side_effect = self.mock_requests_post
+        self.get_authorization_details()
+        self.client.close_order_reference(
+            amazon_order_reference_id='P01-1234567-1234567')
+        self.get_authorization_details()
+        self.assertEqual(mock_urlopen.call_count, 3)
+
+        self.assertEqual(self.client.invalidate_cache(
+            'P01-1234567-1234567-A123456'), 1)
+        self.get_authorization_details()
+        self.assertEqual(mock_urlopen.call_count, 4)
+
+    @patch('requests.post')
+    def test_errors_not_cached(self, mock_urlopen):
+        mock_urlopen.side_effect = self.mock_requests_post
+        self.status_code = 400
+        self.get_authorization_details()
+        self.get_authorization_details()
+        self.assertEqual(mock_urlopen.call_count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
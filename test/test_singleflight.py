@@ -0,0 +1,110 @@
+import threading
+import unittest
+from unittest.mock import Mock, patch
+from amazon_pay.client import AmazonPayClient
+from amazon_pay.singleflight import SingleFlight, read_key
+
+
+class SingleFlightTest(unittest.TestCase):
+
+    def test_read_key(self):
+        params = {'Action': 'GetOrderReferenceDetails',
+                  'AmazonOrderReferenceId': 'S01-0000000-0000000',
+                  'MWSAuthToken': 'amzn.mws.secret'}
+        key = read_key(params, 'merchant_id')
+        self.assertNotIn('amzn.mws.secret', key)
+        self.assertEqual(key, read_key(dict(params), 'merchant_id'))
+        self.assertNotEqual(key, read_key(params, 'other_merchant'))
+        self.assertNotEqual(key, read_key(
+            dict(params, AmazonOrderReferenceId='S01-0000000-0000001'),
+            'merchant_id'))
+        self.assertIsNone(read_key({'Action': 'Capture'}, 'merchant_id'))
+
+    def test_shared_exception(self):
+        flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        errors = []
+
+        def fail():
+            started.set()
+            release.wait(5)
+            raise ValueError('failed')
+
+        def call():
+            try:
+                flight.do('key', fail)
+            except ValueError as ex:
+                errors.append(ex)
+
+        leader = threading.Thread(target=call)
+        leader.start()
+        started.wait(5)
+        follower = threading.Thread(target=call)
+        follower.start()
+        while flight.shared == 0:
+            threading.Event().wait(0.01)
+        release.set()
+        leader.join()
+        follower.join()
+        self.assertEqual(len(errors), 2)
+        self.assertIs(errors[0], errors[1])
+        self.assertEqual(flight.in_flight(), 0)
+
+
+class ClientCoalescingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = AmazonPayClient(
+            mws_access_key='mws_access_key',
+            mws_secret_key='mws_secret_key',
+            merchant_id='merchant_id',
+            handle_throttle=False,
+            sandbox=True,
+            region='na',
+            currency_code='USD',
+            coalesce_reads=True)
+        self.release = threading.Event()
+
+    def mock_requests_post(self, url, data=None, headers=None, verify=False,
+                           timeout=None):
+        self.release.wait(5)
+        mock_response = Mock()
+        mock_response.status_code = 200
+        mock_response.text = '<GetOrderReferenceDetailsResponse>\
+            </GetOrderReferenceDetailsResponse>'
+        mock_response.content = mock_response.text.encode('utf-8')
+        return mock_response
+
+    @patch('requests.post')
+    def test_concurrent_reads_coalesced(self, mock_urlopen):
+        mock_urlopen.side_effect = self.mock_requests_post
+        responses = []
+
+        def read(order_reference_id):
+            responses.append(self.client.get_order_reference_details(
+                amazon_order_reference_id=order_reference_id))
+
+        threads = [threading.Thread(target=read,
+                                    args=('S01-0000000-0000000',))
+                   for _ in range(5)]
+        threads.append(threading.Thread(target=read,
+                                        args=('S01-0000000-0000001',)))
+        for thread in threads:
+            thread.start()
+        while self.client._read_flight.shared < 4:
+            threading.Event().wait(0.01)
+        self.release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(mock_urlopen.call_count, 2)
+        self.assertEqual(len(responses), 6)
+        self.assertEqual(len(set(map(id, responses))), 2)
+
+        self.client.get_order_reference_details(
+            amazon_order_reference_id='S01-0000000-0000000')
+        self.assertEqual(mock_urlopen.call_count, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
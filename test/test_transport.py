@@ -0,0 +1,118 @@
+import os
+import gzip
+import shutil
+import tempfile
+import unittest
+import requests
+from unittest.mock import Mock, patch
+from amazon_pay.client import AmazonPayClient
+from amazon_pay.transport import RecordingTransport, ReplayTransport, \
+    load_cassette, replay_traffic
+
+
+class RecordReplayTransportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cassette = os.path.join(self.directory, 'cassette.jsonl.gz')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def client(self, transport):
+        return AmazonPayClient(
+            mws_access_key='mws_access_key',
+            mws_secret_key='mws_secret_key',
+            merchant_id='merchant_id',
+            handle_throttle=False,
+            sandbox=True,
+            region='na',
+            currency_code='USD',
+            transport=transport)
+
+    def mock_requests_post(self, url, data=None, headers=None, verify=False,
+                           timeout=None):
+        mock_response = Mock()
+        mock_response.status_code = 200
+        mock_response.content = '<CaptureResponse><CaptureResult>\
+            <CaptureDetails><SellerCaptureNote>secret note</SellerCaptureNote>\
+            <AmazonCaptureId>P01-0000000-0000000-C000001</AmazonCaptureId>\
+            </CaptureDetails></CaptureResult></CaptureResponse>'.encode('utf-8')
+        mock_response.text = mock_response.content.decode('utf-8')
+        return mock_response
+
+    def capture(self, client):
+        return client.capture(
+            amazon_authorization_id='P01-0000000-0000000-A000001',
+            capture_reference_id='capture-1',
+            capture_amount='10.00',
+            seller_capture_note='secret note',
+            mws_auth_token='amzn.mws.secret-token')
+
+    @patch('requests.post')
+    def test_record_redacts(self, mock_urlopen):
+        mock_urlopen.side_effect = self.mock_requests_post
+        self.capture(self.client(RecordingTransport(self.cassette)))
+
+        entry, = load_cassette(self.cassette)
+        self.assertEqual(entry['status'], 200)
+        self.assertEqual(entry['params']['Action'], 'Capture')
+        for key in ('AWSAccessKeyId', 'Signature', 'MWSAuthToken',
+                    'SellerCaptureNote'):
+            self.assertEqual(entry['params'][key], 'REMOVED')
+        self.assertNotIn('secret note', entry['body'])
+        self.assertIn('P01-0000000-0000000-C000001', entry['body'])
+
+    @patch('requests.post')
+    def test_record_redacts_buyer_tokens(self, mock_urlopen):
+        mock_urlopen.side_effect = self.mock_requests_post
+        client = self.client(RecordingTransport(self.cassette))
+        client.get_order_reference_details(
+            amazon_order_reference_id='P01-0000000-0000000',
+            access_token='Atza|secret-access-token')
+        client.get_order_reference_details(
+            amazon_order_reference_id='P01-0000000-0000000',
+            address_consent_token='Atza|secret-consent-token')
+
+        first, second = load_cassette(self.cassette)
+        self.assertEqual(first['params']['AccessToken'], 'REMOVED')
+        self.assertEqual(second['params']['AddressConsentToken'], 'REMOVED')
+        with open(self.cassette, 'rb') as f:
+            self.assertNotIn(b'secret', gzip.decompress(f.read()))
+
+    @patch('requests.post')
+    def test_replay(self, mock_urlopen):
+        mock_urlopen.side_effect = self.mock_requests_post
+        self.capture(self.client(RecordingTransport(self.cassette)))
+        mock_urlopen.reset_mock()
+
+        client = self.client(ReplayTransport(self.cassette))
+        response = self.capture(client)
+        self.assertFalse(mock_urlopen.called)
+        self.assertTrue(response.success)
+        self.assertEqual(
+            response.to_dict()['CaptureResponse']['CaptureResult'][
+                'CaptureDetails']['AmazonCaptureId'],
+            'P01-0000000-0000000-C000001')
+
+        with self.assertRaises(ValueError):
+            client.get_service_status()
+
+        stats = replay_traffic(client, self.cassette, workers=2)
+        self.assertEqual(stats['calls'], 1)
+        self.assertEqual(stats['actions']['Capture']['failures'], 0)
+
+    @patch('requests.post')
+    def test_replay_transport_error(self, mock_urlopen):
+        mock_urlopen.side_effect = requests.exceptions.Timeout()
+        client = self.client(RecordingTransport(self.cassette))
+        with self.assertRaises(requests.exceptions.Timeout):
+            client.get_service_status()
+
+        client = self.client(ReplayTransport(self.cassette))
+        with self.assertRaises(requests.exceptions.Timeout):
+            client.get_service_status()
+
+
+if __name__ == "__main__":
+    unittest.main()